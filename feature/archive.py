@@ -0,0 +1,233 @@
+"""
+Archivo de matrices de features para entrenamiento: un `.npy` de forma
+(N, niveles, len(FEATURE_ORDER)) que solo crece, más un índice CSV con
+file/date/label/y/key por fila. Se abre sin parsear:
+
+    X = np.load(".../features.npy", mmap_mode="r")
+
+La cabecera del .npy tiene tamaño fijo y se reescribe al final de cada append:
+es el punto de confirmación y su N manda (filas de datos o del índice escritas
+después de la última cabecera se descartan en el siguiente append). Cada
+proceso recuerda hasta dónde leyó el índice, así que un append solo lee las
+filas que agregaron otros procesos. El tipo (float64, o float32 en modo
+compacto) lo fija la primera matriz archivada; las siguientes se convierten, y
+las de otra forma se saltan (con un warning) sin afectar al resto del lote.
+"""
+import ast
+import csv
+import fcntl
+import logging
+import os
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from .rs_core import CLASSES, FEATURE_ORDER
+
+logger = logging.getLogger(__name__)
+
+_HEADER_LEN = 256   # bytes totales de magic + cabecera (múltiplo de 64)
+_INDEX_FIELDS = ["row", "file", "date", "label", "y", "key"]
+_KEY = _INDEX_FIELDS.index("key")
+# index.csv -> (filas, bytes, keys) ya leídos del índice en este proceso
+_SEEN = {}
+
+def _header(shape, descr="<f8"):
+    d = {"descr": descr, "fortran_order": False, "shape": tuple(shape)}
+    text = repr(d)
+    # magic (6) + versión (2) + HEADER_LEN (2) + dict + relleno + '\n'
+    pad = _HEADER_LEN - 10 - len(text) - 1
+    if pad < 0:
+        raise ValueError("cabecera .npy demasiado larga")
+    body = (text + " " * pad + "\n").encode("latin1")
+    return b"\x93NUMPY\x01\x00" + (len(body)).to_bytes(2, "little") + body
+
+def _read_header(fh):
+    """(shape, descr) del .npy."""
+    fh.seek(0)
+    raw = fh.read(_HEADER_LEN)
+    d = ast.literal_eval(raw[10:].decode("latin1").strip())
+    return tuple(d["shape"]), d["descr"]
+
+def _descr(X):
+    return "<f4" if X.dtype == np.float32 else "<f8"
+
+
+class FeatureArchive:
+    """Archivo append-only en `path` (directorio con features.npy e index.csv)."""
+
+    def __init__(self, path, n_levels=None):
+        self.path = Path(path)
+        self.data_path = self.path / "features.npy"
+        self.index_path = self.path / "index.csv"
+        self.n_levels = n_levels
+
+    @contextmanager
+    def _locked(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+        with open(self.path / ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def __len__(self):
+        return self.shape[0]
+
+    @property
+    def shape(self):
+        if not self.data_path.exists():
+            return (0, self.n_levels or 0, len(FEATURE_ORDER))
+        with open(self.data_path, "rb") as fh:
+            return _read_header(fh)[0]
+
+    def open(self, mmap_mode="r"):
+        """Tensor (N, niveles, features) mapeado en memoria."""
+        return np.load(self.data_path, mmap_mode=mmap_mode)
+
+    def index(self):
+        """Filas del índice (dicts con row, file, date, label, y, key), solo las confirmadas."""
+        n = len(self)
+        if not n:
+            return []
+        with open(self.index_path, newline="", encoding="utf-8") as fh:
+            rows = list(csv.DictReader(fh))[:n]
+        for r in rows:
+            r["row"], r["y"] = int(r["row"]), int(r["y"])
+        return rows
+
+    def append(self, items):
+        """
+        Agrega [(resultado de process_tsv_matrix, key), ...]. Las keys ya
+        archivadas y las matrices de otra forma que el archivo se saltan.
+        Devuelve cuántas filas se agregaron.
+        """
+        with self._locked():
+            exists = self.data_path.exists()
+            if exists:
+                with open(self.data_path, "rb") as fh:
+                    shape, descr = _read_header(fh)
+                seen = self._committed_keys(shape, descr)
+            else:
+                seen = set()
+
+            new, rows, keys = [], [], set()
+            for result, key in items:
+                X = np.asarray(result["X"])
+                if not exists and not new:
+                    shape, descr = (0,) + X.shape, _descr(X)
+                if X.shape != tuple(shape[1:]):
+                    logger.warning("Se omite %s del archivo: matriz %s, el archivo es %s",
+                                   result.get("file"), X.shape, tuple(shape[1:]))
+                    continue
+                if key in seen or key in keys:
+                    continue
+                keys.add(key)
+                n = shape[0] + len(new)
+                new.append(np.ascontiguousarray(X, dtype=descr))
+                rows.append({"row": n, "file": result["file"], "date": result.get("date") or "",
+                             "label": result["label"], "y": CLASSES.index(result["label"]), "key": key})
+            if not new:
+                return 0
+
+            mode = "r+b" if exists else "w+b"
+            with open(self.data_path, mode) as fh:
+                if not exists:
+                    fh.write(_header(shape, descr))
+                fh.seek(0, os.SEEK_END)
+                for X in new:
+                    fh.write(X.tobytes())
+                fh.flush()
+                with open(self.index_path, "a" if exists else "w", newline="", encoding="utf-8") as ix:
+                    w = csv.DictWriter(ix, fieldnames=_INDEX_FIELDS)
+                    if not exists:
+                        w.writeheader()
+                    w.writerows(rows)
+                os.fsync(fh.fileno())
+                # Confirmación: la cabecera con el nuevo N
+                fh.seek(0)
+                fh.write(_header((shape[0] + len(new),) + tuple(shape[1:]), descr))
+            _SEEN[self.index_path] = (shape[0] + len(new), self.index_path.stat().st_size, seen | keys)
+            return len(new)
+
+    def _committed_keys(self, shape, descr):
+        """
+        Keys de las shape[0] filas confirmadas. Descarta datos e índice de un
+        append interrumpido y lee el índice solo desde donde quedó este proceso.
+        """
+        n = shape[0]
+        row_bytes = int(np.prod(shape[1:])) * np.dtype(descr).itemsize
+        if self.data_path.stat().st_size > _HEADER_LEN + n * row_bytes:
+            with open(self.data_path, "r+b") as fh:
+                fh.truncate(_HEADER_LEN + n * row_bytes)
+        if not self.index_path.exists():
+            return set()
+
+        rows, offset, keys = _SEEN.get(self.index_path, (0, 0, set()))
+        size = self.index_path.stat().st_size
+        if rows > n or offset > size:   # archivo reemplazado
+            rows, offset, keys = 0, 0, set()
+        if (rows, offset) == (n, size):
+            return keys
+        keys = set(keys)
+        with open(self.index_path, "r+b") as fh:
+            fh.seek(offset)
+            reader = csv.reader(line.decode("utf-8") for line in iter(fh.readline, b""))
+            if offset == 0:
+                next(reader, None)   # cabecera
+            while True:
+                start = fh.tell()
+                record = next(reader, None)
+                if record is None:
+                    offset = start
+                    break
+                if int(record[0]) >= n:   # sin confirmar
+                    fh.truncate(start)
+                    offset = start
+                    break
+                keys.add(record[_KEY])
+        _SEEN[self.index_path] = (n, offset, keys)
+        return keys
+
+    def select(self, date_from=None, date_to=None, labels=None):
+        """Índices de fila que cumplen el filtro (fechas ISO inclusive, lista de etiquetas)."""
+        out = []
+        for r in self.index():
+            if labels and r["label"] not in labels:
+                continue
+            if (date_from or date_to) and not r["date"]:
+                continue
+            if date_from and r["date"] < date_from:
+                continue
+            if date_to and r["date"] > date_to:
+                continue
+            out.append(r["row"])
+        return np.array(out, dtype=np.int64)
+
+    def export(self, output, rows=None, chunk=4096):
+        """
+        Copia el archivo completo (o `rows`) a un .npy contiguo en `output` y su
+        índice a `<output>.csv`. Devuelve la cantidad de sondeos exportados.
+        """
+        src = self.open()
+        index = self.index()
+        rows = np.arange(len(src)) if rows is None else np.asarray(rows, dtype=np.int64)
+        out = np.lib.format.open_memmap(output, mode="w+", dtype=src.dtype, shape=(len(rows),) + src.shape[1:])
+        for i in range(0, len(rows), chunk):
+            out[i:i + chunk] = src[rows[i:i + chunk]]
+        out.flush()
+        del out
+        with open(f"{output}.csv", "w", newline="", encoding="utf-8") as fh:
+            w = csv.DictWriter(fh, fieldnames=_INDEX_FIELDS)
+            w.writeheader()
+            for new_row, old_row in enumerate(rows.tolist()):
+                w.writerow({**index[old_row], "row": new_row})
+        return len(rows)
+
+
+def get_archive():
+    """Archivo configurado en RADIOSONDE_ARCHIVE_DIR."""
+    return FeatureArchive(settings.RADIOSONDE_ARCHIVE_DIR)
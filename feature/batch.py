@@ -0,0 +1,373 @@
+import asyncio
+import logging
+import math
+import os
+import signal
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from io import BytesIO
+
+from django.conf import settings
+
+from . import metrics
+from .metrics import QUEUE_DEPTH, QUEUE_REJECTED, QUEUE_WAIT
+from .rs_core import process_tsv_grids, process_tsv_matrix, process_uploaded_tsv
+
+logger = logging.getLogger(__name__)
+
+_POOL = None
+_POOL_PID = None
+_POOL_LOCK = threading.Lock()
+
+def _pool_size():
+    return getattr(settings, "RADIOSONDE_BATCH_WORKERS", None) or os.cpu_count() or 1
+
+def _exit_with_parent(parent):
+    # Si el proceso padre muere (p. ej. kill -9 del worker de trabajos) el worker no queda huérfano
+    while os.getppid() == parent:
+        time.sleep(1.0)
+    os._exit(1)
+
+def _warm_worker():
+    """Inicializador de cada worker: importa pandas/MetPy, arma la tabla de parcelas y procesa un sondeo chico."""
+    from . import rs_core
+    from .synthetic import edt_texts
+    metrics.reset()   # lo heredado del proceso web por fork no es de este worker
+    signal.signal(signal.SIGINT, signal.SIG_IGN)    # Ctrl-C lo maneja el proceso padre
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    threading.Thread(target=_exit_with_parent, args=(os.getppid(),), daemon=True).start()
+    try:
+        rs_core.warm_up()
+        text = next(edt_texts(1, rows=300, seed=0))
+        process_tsv_matrix(BytesIO(text.encode("utf-8")), filename="warmup.tsv")
+    except Exception:
+        logger.exception("Falló el precalentamiento del worker")
+    metrics.reset()
+
+def _usable(pool):
+    return pool is not None and _POOL_PID == os.getpid() and not getattr(pool, "_broken", False)
+
+def get_pool() -> ProcessPoolExecutor:
+    """
+    Pool de procesos compartido por el proceso web (se crea en el primer uso,
+    con workers precalentados). Se recrea si el proceso web se forkeó después
+    o si un worker murió (pool roto).
+    """
+    global _POOL, _POOL_PID
+    if not _usable(_POOL):
+        with _POOL_LOCK:
+            if not _usable(_POOL):
+                if _POOL is not None and _POOL_PID == os.getpid():
+                    logger.warning("Pool de procesamiento roto (murió un worker); se recrea")
+                    _POOL.shutdown(wait=False, cancel_futures=True)
+                _POOL = ProcessPoolExecutor(max_workers=_pool_size(), initializer=_warm_worker)
+                _POOL_PID = os.getpid()
+    return _POOL
+
+def _noop():
+    return None
+
+def warm_pool(wait_ready=True):
+    """Arranca (y precalienta) todos los workers del pool antes de recibir tráfico."""
+    pool = get_pool()
+    futures = [pool.submit(_noop) for _ in range(_pool_size())]
+    if wait_ready:
+        wait(futures)
+    return pool
+
+
+class WorkerPool:
+    """
+    Pool de procesos propio (el de `process_jobs`), con workers precalentados.
+    A diferencia de get_pool() no se comparte: process_archive lo recrea con
+    replace() cuando un worker muere.
+    """
+    def __init__(self, max_workers=None):
+        self._max_workers = max_workers or _pool_size()
+        self._executor = self._start()
+
+    def _start(self):
+        return ProcessPoolExecutor(max_workers=self._max_workers, initializer=_warm_worker)
+
+    def submit(self, fn, *args):
+        return self._executor.submit(fn, *args)
+
+    def warm(self):
+        """Arranca todos los workers y espera a que estén listos."""
+        wait([self.submit(_noop) for _ in range(self._max_workers)])
+
+    def replace(self):
+        logger.warning("Pool de trabajos roto (murió un worker); se recrea")
+        old, self._executor = self._executor, self._start()
+        old.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self._executor.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+
+class QueueFull(Exception):
+    """Cola de procesamiento llena; `retry_after` en segundos para la cabecera Retry-After."""
+    def __init__(self, retry_after):
+        super().__init__(f"Cola de procesamiento llena, reintentar en {retry_after} s")
+        self.retry_after = retry_after
+
+
+def _run_job(submitted, fn, args):
+    """Corre en el worker: (espera en cola, duración, resultado, métricas del worker)."""
+    started = time.time()
+    result = fn(*args)
+    return started - submitted, time.time() - started, result, metrics.drain()
+
+
+class ProcessingQueue:
+    """
+    Cola acotada delante del pool: admite a lo sumo `workers + max_queue`
+    trabajos (en curso + esperando). Con la cola llena submit() lanza QueueFull
+    en vez de acumular peticiones; el retry_after sale del tiempo de servicio medio.
+    """
+    def __init__(self, max_queue=16):
+        self.max_queue = max_queue
+        self._depth = 0
+        self._service = 0.1    # s, media móvil de la duración de cada trabajo
+        self._lock = threading.Lock()
+
+    @property
+    def capacity(self):
+        return _pool_size() + self.max_queue
+
+    @property
+    def depth(self):
+        return self._depth
+
+    def retry_after(self):
+        return max(1, math.ceil(self._depth * self._service / _pool_size()))
+
+    def submit(self, fn, *args):
+        """Encola fn(*args) en el pool; devuelve el Future de _run_job o lanza QueueFull."""
+        with self._lock:
+            if self._depth >= self.capacity:
+                QUEUE_REJECTED.inc()
+                raise QueueFull(self.retry_after())
+            self._depth += 1
+            QUEUE_DEPTH.set(self._depth)
+        try:
+            try:
+                future = get_pool().submit(_run_job, time.time(), fn, args)
+            except BrokenProcessPool:
+                # Se rompió entre get_pool() y submit(): get_pool() ya lo ve roto y lo recrea
+                future = get_pool().submit(_run_job, time.time(), fn, args)
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    def _release(self):
+        with self._lock:
+            self._depth -= 1
+            QUEUE_DEPTH.set(self._depth)
+
+    def _done(self, future):
+        self._release()
+        if future.cancelled() or future.exception() is not None:
+            return
+        waited, service, _, worker_metrics = future.result()
+        QUEUE_WAIT.observe(waited)
+        metrics.merge(worker_metrics)
+        with self._lock:
+            self._service += 0.2 * (service - self._service)
+
+    def run(self, fn, *args):
+        return self.submit(fn, *args).result()[2]
+
+    async def arun(self, fn, *args):
+        return (await asyncio.wrap_future(self.submit(fn, *args)))[2]
+
+
+processing_queue = ProcessingQueue(max_queue=getattr(settings, "RADIOSONDE_QUEUE_SIZE", 16))
+
+def _in_pool():
+    return getattr(settings, "RADIOSONDE_PROCESS_IN_POOL", True)
+
+def _skip_member(name):
+    base = os.path.basename(name)
+    return not base or base.startswith(".") or name.startswith("__MACOSX/")
+
+def _iter_zip(zf, full_paths):
+    with zf:
+        for info in zf.infolist():
+            if info.is_dir() or _skip_member(info.filename):
+                continue
+            yield info.filename if full_paths else os.path.basename(info.filename), zf.read(info)
+
+def _iter_tar(tf, full_paths):
+    with tf:
+        for member in tf:
+            if not member.isfile() or _skip_member(member.name):
+                continue
+            yield member.name if full_paths else os.path.basename(member.name), tf.extractfile(member).read()
+
+def iter_archive_members(fileobj, name="", full_paths=False):
+    """
+    Iterador de (nombre, bytes) de cada archivo regular dentro de un zip o tar
+    (tar, tar.gz, tar.bz2, tar.xz). Lee un miembro a la vez. El nombre es el
+    del archivo, o su ruta dentro del zip/tar con full_paths=True.
+    Lanza ValueError de inmediato si el archivo no es zip ni tar.
+    """
+    if zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        return _iter_zip(zipfile.ZipFile(fileobj), full_paths)
+    fileobj.seek(0)
+    try:
+        tf = tarfile.open(fileobj=fileobj, mode="r:*")
+    except tarfile.TarError:
+        raise ValueError(f"'{name}' no es un zip ni un tar válido")
+    return _iter_tar(tf, full_paths)
+
+def _process_member(filename, data, digits=None):
+    """Corre en el worker: nunca lanza, los errores se devuelven en el dict."""
+    try:
+        return process_uploaded_tsv(BytesIO(data), filename=filename, digits=digits)
+    except Exception as e:
+        return {"file": filename, "error": f"Error procesando: {e}"}
+
+def _stream(source):
+    return BytesIO(source) if isinstance(source, (bytes, bytearray)) else source
+
+@contextmanager
+def _upload_path(source):
+    """
+    Ruta en disco del upload para el worker (en vez de pasarle los bytes): la del
+    archivo temporal de Django si ya está en disco, si no una copia por bloques.
+    """
+    path = getattr(source, "temporary_file_path", None)
+    if path is not None:
+        yield path()
+        return
+    with tempfile.NamedTemporaryFile(prefix="radiosonde-", suffix=".tsv") as tmp:
+        if isinstance(source, (bytes, bytearray)):
+            tmp.write(source)
+        else:
+            while chunk := source.read(1 << 16):
+                tmp.write(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+        tmp.flush()
+        yield tmp.name
+
+def _process_upload(path, filename, grid):
+    return process_tsv_matrix(path, filename=filename, grid=grid)
+
+def _process_grids(path, grids, filename):
+    return process_tsv_grids(path, grids, filename=filename)
+
+def process_upload(source, filename, grid=None):
+    """
+    process_tsv_matrix sobre `source` (file-like o bytes) en un worker
+    precalentado del pool, pasando por processing_queue (QueueFull si está
+    llena); el worker lee el upload desde un archivo en disco. Con
+    RADIOSONDE_PROCESS_IN_POOL=false se parsea el stream en el proceso actual.
+    """
+    if not _in_pool():
+        return process_tsv_matrix(_stream(source), filename=filename, grid=grid)
+    with _upload_path(source) as path:
+        return processing_queue.run(_process_upload, path, filename, grid)
+
+def process_grids(source, grids, filename):
+    """process_tsv_grids como process_upload."""
+    if not _in_pool():
+        return process_tsv_grids(_stream(source), grids, filename=filename)
+    with _upload_path(source) as path:
+        return processing_queue.run(_process_grids, path, grids, filename)
+
+async def process_in_pool(data, filename, grid=None):
+    """process_upload awaitable: la física (CPU) no bloquea el event loop de la vista async."""
+    if not _in_pool():
+        return await asyncio.to_thread(process_tsv_matrix, BytesIO(data), filename, grid)
+    with _upload_path(data) as path:
+        return await processing_queue.arun(_process_upload, path, filename, grid)
+
+def process_archive(members, pool=None, max_pending=None, fn=None):
+    """
+    Reparte los miembros del archivo en el pool y va devolviendo cada resultado
+    (mismo dict que process_uploaded_tsv, o {"file", "error"}) apenas termina.
+    Mantiene a lo sumo `max_pending` miembros en vuelo para acotar memoria.
+    `fn(filename, data)` reemplaza a _process_member (debe ser picklable y no lanzar).
+
+    Sin `pool` los miembros pasan por processing_queue, con la misma cuenta y
+    límite que /process/: si la cola está llena se espera a que termine uno de
+    los propios en vez de fallar, y a lo sumo hay un miembro por worker en vuelo.
+    Un `pool` propio debe poder recrearse (WorkerPool).
+
+    Si muere un worker (p. ej. por memoria) se rompe el pool y fallan todos los
+    miembros en vuelo: el pool se recrea y esos miembros se reintentan de a
+    uno; solo queda como error el que rompe un pool nuevo estando solo.
+    """
+    fn = fn or _process_member
+    if pool is None:
+        queue = processing_queue
+        submit, unwrap = (lambda *args: queue.submit(fn, *args)), (lambda out: out[2])
+        replace = lambda: None     # get_pool() recrea el pool roto en el próximo submit
+        max_pending = max_pending or _pool_size()
+    else:
+        submit, unwrap, replace = (lambda *args: pool.submit(fn, *args)), (lambda out: out), pool.replace
+        max_pending = max_pending or 2 * getattr(pool, "_max_workers", _pool_size())
+    members = iter(members)
+    pending = {}       # future -> (miembro, reintento aislado)
+    suspects = []      # miembros en vuelo cuando murió un worker
+    member = None      # siguiente miembro (queda aquí si la cola estaba llena)
+    isolated = False
+    exhausted = False
+    while pending or suspects or not exhausted or member:
+        while len(pending) < (1 if suspects or isolated else max_pending):
+            if member is None:
+                if suspects:
+                    member, isolated = suspects.pop(0), True
+                else:
+                    member, isolated = next(members, None), False
+                    if member is None:
+                        exhausted = True
+                        break
+            try:
+                pending[submit(*member)] = (member, isolated)
+            except QueueFull as e:
+                if not pending:
+                    time.sleep(min(e.retry_after, 1.0))
+                    continue
+                break
+            except BrokenProcessPool:
+                replace()
+                continue
+            member = None
+        if not pending:
+            break
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        broke = any(isinstance(fut.exception(), BrokenProcessPool) for fut in done)
+        if broke:
+            # Con el pool roto falla todo lo que estaba en vuelo: se recoge todo
+            wait(pending)
+            done = list(pending)
+        for fut in done:
+            (filename, data), alone = pending.pop(fut)
+            try:
+                yield unwrap(fut.result())
+            except BrokenProcessPool:
+                if alone:
+                    logger.warning("El worker murió procesando %s", filename)
+                    yield {"file": filename, "error": "Error procesando: el proceso del worker murió"}
+                else:
+                    suspects.append((filename, data))
+            except Exception as e:
+                yield {"file": filename, "error": f"Error procesando: {e}"}
+        if broke:
+            replace()
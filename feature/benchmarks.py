@@ -0,0 +1,252 @@
+"""
+Micro-benchmarks del pipeline de sondeos. Se ejecutan con
+`python manage.py benchmark <suite>`.
+"""
+import asyncio
+import json
+import platform
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import metpy
+import metpy.calc as mpcalc
+from metpy.units import units
+
+from . import llm_groq, rs_core
+from .fake_llm import FakeLLMServer
+from .synthetic import edt_texts, synthetic_profiles
+
+def timeit(fn, repeat=5):
+    """Corre fn() `repeat` veces; devuelve tiempos en ms (best, mean)."""
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t0) * 1000.0)
+    return {"best_ms": min(times), "mean_ms": float(np.mean(times))}
+
+def environment():
+    """Versiones relevantes, para comparar corridas entre upgrades."""
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "metpy": metpy.__version__,
+        "machine": platform.machine(),
+        "cape_mode": rs_core.CAPE_MODE,
+        "parcel_mode": rs_core.PARCEL_MODE,
+        "grid": rs_core.DEFAULT_GRID,
+    }
+
+def bench_stages(count=20, repeat=3, seed=0, rows=2000):
+    """
+    Cada etapa de process_uploaded_tsv por separado y de punta a punta, sobre
+    `count` archivos EDT sintéticos de `rows` filas. Tiempos por sondeo (ms).
+    """
+    raw = [t.encode("utf-8") for t in edt_texts(count, rows=rows, seed=seed)]
+    rs_core.get_moist_table()
+
+    # Entradas de cada etapa, calculadas una vez fuera de la medición
+    dfs = [rs_core.read_edt_tsv(BytesIO(b)) for b in raw]
+    levels = [rs_core.interp_to_levels(df) for df in dfs]
+    phys = [rs_core.physics_from_profile(*lv) for lv in levels]
+    labels_in = []
+    for lv, ph in zip(levels, phys):
+        means = rs_core.means_0_3km(ph["z"] - ph["z"][0], ph["Gamma_env"], ph["Gamma_moist"], ph["N2"])
+        labels_in.append((lv, ph, means))
+    X = [rs_core.build_feature_matrix(lv[0], ph["z"], *lv[2:7], ph) for lv, ph in zip(levels, phys)]
+
+    def label_all():
+        for lv, ph, means in labels_in:
+            rs_core.label_from_metrics(
+                ph["z"], lv[2], ph["Gamma_env"], ph["Gamma_moist"], ph["N2"], z_sfc=ph["z"][0],
+                cape_sb=ph["cape_sb"], cin_sb=ph["cin_sb"], cape_ml=ph["cape_ml"], cin_ml=ph["cin_ml"],
+                means=means,
+            )
+
+    stages = {
+        "read_edt_tsv": lambda: [rs_core.read_edt_tsv(BytesIO(b)) for b in raw],
+        "interp_to_levels": lambda: [rs_core.interp_to_levels(df) for df in dfs],
+        "physics_from_profile": lambda: [rs_core.physics_from_profile(*lv) for lv in levels],
+        "label_from_metrics": label_all,
+        "build_feature_matrix": lambda: [rs_core.build_feature_matrix(lv[0], ph["z"], *lv[2:7], ph)
+                                         for lv, ph in zip(levels, phys)],
+        "serialize_levels": lambda: [json.dumps(rs_core.levels_from_matrix(x)) for x in X],
+        "end_to_end": lambda: [json.dumps(rs_core.process_uploaded_tsv(BytesIO(b))) for b in raw],
+    }
+    out = {}
+    for name, fn in stages.items():
+        t = timeit(fn, repeat)
+        out[name] = {"best_ms": t["best_ms"] / count, "mean_ms": t["mean_ms"] / count}
+    return {"count": count, "rows": rows, "per_sounding": out}
+
+def bench_cape(count=200, repeat=3, seed=0):
+    """CAPE/CIN de `count` parcelas: mpcalc.cape_cin en bucle vs cape_cin_batch."""
+    p = rs_core.P_LEVELS
+    _, T, Td = synthetic_profiles(count, seed=seed)
+    Tp = np.array([
+        mpcalc.parcel_profile(p * units.hPa, T[i, 0] * units.K, Td[i, 0] * units.K).to("K").m
+        for i in range(count)
+    ])
+    p_q = p * units.hPa
+
+    def metpy_loop():
+        for i in range(count):
+            try:
+                mpcalc.cape_cin(p_q, T[i] * units.K, Td[i] * units.K, Tp[i] * units.K)
+            except Exception:
+                pass
+
+    metpy = timeit(metpy_loop, repeat)
+    fast = timeit(lambda: rs_core.cape_cin_batch(p, T, Td, Tp), repeat)
+    return {
+        "count": count,
+        "metpy": metpy,
+        "fast": fast,
+        "speedup": metpy["best_ms"] / fast["best_ms"],
+    }
+
+def bench_parcel(count=200, repeat=3, seed=0):
+    """Perfiles de parcela: mpcalc.parcel_profile (ODE) en bucle vs parcel_profile_batch (tabla)."""
+    p = rs_core.P_LEVELS
+    _, T, Td = synthetic_profiles(count, seed=seed)
+    p_q = p * units.hPa
+    rs_core.get_moist_table()   # la tabla se construye una vez por proceso
+
+    def ode_loop():
+        for i in range(count):
+            mpcalc.parcel_profile(p_q, T[i, 0] * units.K, Td[i, 0] * units.K)
+
+    ode = timeit(ode_loop, repeat)
+    table = timeit(lambda: rs_core.parcel_profile_batch(p, T[:, 0], Td[:, 0]), repeat)
+    build = timeit(rs_core.build_moist_table, repeat)
+    return {
+        "count": count,
+        "ode": ode,
+        "table": table,
+        "table_build": build,
+        "speedup": ode["best_ms"] / table["best_ms"],
+    }
+
+def bench_llm(count=200, repeat=1, seed=0, latency=0.2, error_rate=0.1, threads=32):
+    """
+    Narrativas contra fake_llm (sin red): `count` peticiones desde `threads` hilos
+    con el cliente compartido, el semáforo y los reintentos de llm_groq.
+    """
+    record = {"file": "bench.tsv", "label": "estable", "summary": {}, "levels": []}
+    runs = []
+    with FakeLLMServer(latency=latency, error_rate=error_rate, seed=seed) as srv:
+        llm_groq.configure_client(base_url=srv.url, api_key="bench")
+        try:
+            for _ in range(repeat):
+                srv.requests = srv.errors = 0
+
+                def one(_):
+                    try:
+                        llm_groq.summarize_radiosonde(record)
+                        return True
+                    except Exception:
+                        return False
+
+                t0 = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=threads) as ex:
+                    ok = sum(ex.map(one, range(count)))
+                wall = time.perf_counter() - t0
+                runs.append({"wall_s": wall, "ok": ok, "failed": count - ok,
+                             "http_requests": srv.requests, "http_errors": srv.errors,
+                             "throughput_rps": ok / wall})
+        finally:
+            llm_groq.reset_client()
+    return {
+        "count": count,
+        "latency_s": latency,
+        "error_rate": error_rate,
+        "threads": threads,
+        "max_concurrency": llm_groq._MAX_CONCURRENCY,
+        "runs": runs,
+    }
+
+def _view_requests(factory, texts, path):
+    from django.contrib.auth import get_user_model
+    from rest_framework.test import force_authenticate
+    user = get_user_model()(username="bench@example.com")
+    requests = []
+    for i, text in enumerate(texts):
+        request = factory.post(path, data=text.encode("utf-8"), content_type="application/octet-stream",
+                               headers={"X-Filename": f"edt_01{(i % 28) + 1:02d}2025.tsv"})
+        force_authenticate(request, user=user)
+        requests.append(request)
+    return requests
+
+def bench_async(count=32, repeat=1, seed=0, rows=2000, latency=0.5):
+    """
+    Un solo worker atendiendo `count` uploads concurrentes con narrativa (fake_llm
+    con `latency` s): RadiosondeProcessView (síncrona; bajo ASGI Django la corre en
+    un único hilo, una petición a la vez) vs RadiosondeProcessAsyncView (física en
+    el pool de procesos, LLM con AsyncGroq). Cada corrida usa sondeos nuevos (sin caché).
+    """
+    from django.core.cache import caches as django_caches
+    from django.test import AsyncRequestFactory, RequestFactory, override_settings
+    from .batch import get_pool
+    from .cache import narrative_cache, result_cache
+    from .views import RadiosondeProcessAsyncView, RadiosondeProcessView
+
+    sync_view, async_view = RadiosondeProcessView.as_view(), RadiosondeProcessAsyncView.as_view()
+    path = "/feature/process/?summarize=true"
+    caches = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+              "radiosonde": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "bench"}}
+
+    def run_sync(texts):
+        for request in _view_requests(RequestFactory(), texts, path):
+            resp = sync_view(request)
+            resp.render()
+            assert resp.status_code == 200, resp.content
+
+    async def run_async(texts):
+        resps = await asyncio.gather(*(async_view(r) for r in _view_requests(AsyncRequestFactory(), texts, path)))
+        assert all(r.status_code == 200 for r in resps)
+
+    runs = []
+    with FakeLLMServer(latency=latency, seed=seed) as srv, \
+            override_settings(CACHES=caches, RADIOSONDE_STORE_RESULTS=False, RADIOSONDE_ARCHIVE_RESULTS=False):
+        llm_groq.configure_client(base_url=srv.url, api_key="bench")
+        get_pool().submit(rs_core.get_moist_table).result()   # arranca el pool fuera de la medición
+        rs_core.get_moist_table()
+        try:
+            for r in range(repeat):
+                texts = list(edt_texts(2 * count, rows=rows, seed=seed + 1000 * r))
+                result_cache.clear()
+                narrative_cache.clear()
+                django_caches["radiosonde"].clear()
+                t0 = time.perf_counter()
+                run_sync(texts[:count])
+                sync_wall = time.perf_counter() - t0
+                t0 = time.perf_counter()
+                asyncio.run(run_async(texts[count:]))
+                async_wall = time.perf_counter() - t0
+                runs.append({
+                    "sync": {"wall_s": sync_wall, "throughput_rps": count / sync_wall},
+                    "async": {"wall_s": async_wall, "throughput_rps": count / async_wall},
+                    "speedup": sync_wall / async_wall,
+                })
+        finally:
+            llm_groq.reset_client()
+    return {
+        "count": count,
+        "rows": rows,
+        "llm_latency_s": latency,
+        "pool_workers": get_pool()._max_workers,
+        "max_concurrency": llm_groq._MAX_CONCURRENCY,
+        "runs": runs,
+    }
+
+SUITES = {
+    "stages": bench_stages,
+    "cape": bench_cape,
+    "parcel": bench_parcel,
+    "llm": bench_llm,
+    "async": bench_async,
+}
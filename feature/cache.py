@@ -0,0 +1,300 @@
+import hashlib
+import json
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from asgiref.sync import sync_to_async
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import InvalidCacheBackendError
+
+from . import llm_groq, rs_core
+from .batch import process_in_pool, process_upload
+from .metrics import CACHE_LOOKUPS
+from .store import store_result
+
+# Versión del código de procesamiento: cualquier cambio en rs_core invalida el caché
+CODE_VERSION = hashlib.sha256(Path(rs_core.__file__).read_bytes()).hexdigest()[:16]
+
+_SPOOL_MAX = 8 * 1024 * 1024   # uploads no seekables: en memoria hasta 8 MB, luego a disco
+
+def fingerprint_upload(up, chunk_size=1 << 16):
+    """
+    SHA-256 del contenido del upload sin cargarlo entero en memoria.
+    Devuelve (hexdigest, fuente) donde `fuente` se puede volver a leer desde el
+    inicio: el mismo archivo si es seekable, o una copia en SpooledTemporaryFile
+    si es un stream (p. ej. request.stream).
+    """
+    h = hashlib.sha256()
+    seekable = hasattr(up, "seekable") and up.seekable()
+    if seekable:
+        up.seek(0)
+        spool = None
+    else:
+        spool = tempfile.SpooledTemporaryFile(max_size=_SPOOL_MAX)
+    while True:
+        chunk = up.read(chunk_size)
+        if not chunk:
+            break
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        h.update(chunk)
+        if spool is not None:
+            spool.write(chunk)
+    source = up if seekable else spool
+    source.seek(0)
+    return h.hexdigest(), source
+
+def processing_params(grid=None):
+    """Parámetros que cambian el resultado de process_tsv_matrix."""
+    g = rs_core.parse_grid(grid)
+    return {
+        "code": CODE_VERSION,
+        "cape_mode": rs_core.CAPE_MODE,
+        "parcel_mode": rs_core.PARCEL_MODE,
+        "dtype": np.dtype(rs_core.FEATURE_DTYPE).str,
+        "grid": g.kind,
+        "levels": g.levels.tolist(),
+    }
+
+def result_key(content_hash, params=None):
+    params = processing_params() if params is None else params
+    p_hash = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:16]
+    return f"rs:result:{content_hash}:{p_hash}"
+
+
+class ResultCache:
+    """
+    Caché de resultados en dos niveles: LRU en el proceso (max_entries) y un
+    backend de Django compartido (alias `alias`, p. ej. FileBasedCache con
+    MAX_ENTRIES). Se guarda label/summary/X (matriz de niveles); file y date se rellenan con
+    el nombre de cada petición.
+    """
+    def __init__(self, max_entries=256, alias="radiosonde"):
+        self.max_entries = max_entries
+        self.alias = alias
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _shared(self):
+        try:
+            return caches[self.alias]
+        except InvalidCacheBackendError:
+            return None
+
+    def get(self, key, filename):
+        """Devuelve (resultado o None, "memory" | "shared" | "miss")."""
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is not None:
+                self._lru.move_to_end(key)
+        tier = "memory"
+        if entry is None:
+            shared = self._shared()
+            entry = shared.get(key) if shared is not None else None
+            if entry is None:
+                return None, "miss"
+            self._remember(key, entry)
+            tier = "shared"
+        result = {"file": filename, "date": rs_core.date_from_filename(filename), **entry}
+        return result, tier
+
+    def set(self, key, result):
+        entry = {k: result[k] for k in ("label", "summary", "X")}
+        self._remember(key, entry)
+        shared = self._shared()
+        if shared is not None:
+            shared.set(key, entry)
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._lru[key] = entry
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
+
+
+result_cache = ResultCache(
+    max_entries=getattr(settings, "RADIOSONDE_RESULT_CACHE_ENTRIES", 256),
+    alias=getattr(settings, "RADIOSONDE_RESULT_CACHE", "radiosonde"),
+)
+
+def _lookup_result(content_hash, filename, grid):
+    params = processing_params(grid)
+    key = result_key(content_hash, params)
+    result, tier = result_cache.get(key, filename)
+    CACHE_LOOKUPS.inc("result", tier)
+    return key, params, result, tier
+
+def _remember_result(key, params, result):
+    result_cache.set(key, result)
+    if params == processing_params():
+        # primera vez que se ve este contenido: a la BD/archivo en segundo plano
+        # (solo la rejilla por defecto, la del archivo de features)
+        store_result(result, key)
+
+def process_cached(up, filename, grid=None):
+    """
+    process_tsv_matrix con caché por contenido y rejilla. Devuelve (resultado,
+    "memory"|"shared"|"miss"); los niveles vienen como matriz "X" (ver rs_core.levels_from_matrix).
+    """
+    content_hash, source = fingerprint_upload(up)
+    key, params, result, tier = _lookup_result(content_hash, filename, grid)
+    if result is None:
+        result = process_upload(source, filename, grid)   # worker del pool (QueueFull si está llena)
+        _remember_result(key, params, result)
+    return result, tier
+
+async def aprocess_cached(data, filename, grid=None):
+    """
+    process_cached para vistas async, sobre el upload ya leído (bytes). El caché
+    se consulta en un hilo y en un fallo la física corre en el pool de procesos
+    (batch.process_in_pool). Mismas claves que process_cached.
+    """
+    content_hash = hashlib.sha256(data).hexdigest()
+    key, params, result, tier = await sync_to_async(_lookup_result, thread_sensitive=False)(
+        content_hash, filename, grid)
+    if result is None:
+        result = await process_in_pool(data, filename, grid)
+        await sync_to_async(_remember_result, thread_sensitive=False)(key, params, result)
+    return result, tier
+
+
+def narrative_key(record, language, model_id=None):
+    """Clave de la narrativa: niveles compactados + summary + label, modelo e idioma."""
+    compact = llm_groq.compact_record(record)
+    canon = {
+        "label": compact["label"],
+        "summary": compact["summary"],
+        "levels_sampled": compact["levels_sampled"],
+        "model": llm_groq.resolve_model(model_id),
+        "lang": language,
+    }
+    digest = hashlib.sha256(
+        json.dumps(canon, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+    return f"rs:narrative:{digest}"
+
+
+class NarrativeCache:
+    """
+    Caché de narrativas LLM: LRU en el proceso (max_entries) con TTL y el mismo
+    TTL en el backend compartido de Django, para que todos los workers reutilicen
+    la respuesta del LLM.
+    """
+    def __init__(self, max_entries=512, ttl=86400, alias="radiosonde"):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.alias = alias
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _shared(self):
+        try:
+            return caches[self.alias]
+        except InvalidCacheBackendError:
+            return None
+
+    def get(self, key):
+        """Devuelve (narrativa o None, "memory" | "shared" | "miss")."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._lru.move_to_end(key)
+                    return entry[1], "memory"
+                del self._lru[key]
+        shared = self._shared()
+        text = shared.get(key) if shared is not None else None
+        if text is None:
+            return None, "miss"
+        self._remember(key, text)
+        return text, "shared"
+
+    def set(self, key, text):
+        self._remember(key, text)
+        shared = self._shared()
+        if shared is not None:
+            shared.set(key, text, timeout=self.ttl)
+
+    def _remember(self, key, text):
+        with self._lock:
+            self._lru[key] = (time.monotonic() + self.ttl, text)
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
+
+
+narrative_cache = NarrativeCache(
+    max_entries=getattr(settings, "RADIOSONDE_NARRATIVE_CACHE_ENTRIES", 512),
+    ttl=getattr(settings, "RADIOSONDE_NARRATIVE_TTL", 86400),
+    alias=getattr(settings, "RADIOSONDE_NARRATIVE_CACHE", "radiosonde"),
+)
+
+def summarize_cached(record, language="es", model_id=None, refresh=False):
+    """
+    summarize_radiosonde con caché. refresh=True ignora la entrada guardada y la
+    regenera. Devuelve (narrativa, "memory"|"shared"|"miss"|"refresh").
+    Los errores del LLM se propagan y no se guardan.
+    """
+    key = narrative_key(record, language, model_id)
+    if not refresh:
+        text, tier = narrative_cache.get(key)
+        if text is not None:
+            CACHE_LOOKUPS.inc("narrative", tier)
+            return text, tier
+    tier = "refresh" if refresh else "miss"
+    CACHE_LOOKUPS.inc("narrative", tier)
+    text = llm_groq.summarize_radiosonde(record, language=language, model_id=model_id)
+    narrative_cache.set(key, text)
+    return text, tier
+
+async def asummarize_cached(record, language="es", model_id=None, refresh=False):
+    """summarize_cached con la llamada al LLM vía AsyncGroq (llm_groq.asummarize_radiosonde)."""
+    key = narrative_key(record, language, model_id)
+    if not refresh:
+        text, tier = await sync_to_async(narrative_cache.get, thread_sensitive=False)(key)
+        if text is not None:
+            CACHE_LOOKUPS.inc("narrative", tier)
+            return text, tier
+    tier = "refresh" if refresh else "miss"
+    CACHE_LOOKUPS.inc("narrative", tier)
+    text = await llm_groq.asummarize_radiosonde(record, language=language, model_id=model_id)
+    await sync_to_async(narrative_cache.set, thread_sensitive=False)(key, text)
+    return text, tier
+
+def stream_summary_cached(record, language="es", model_id=None, refresh=False):
+    """
+    Versión en streaming de summarize_cached. Devuelve (iterador de fragmentos,
+    tier): un acierto es un único fragmento con la narrativa guardada; en un fallo
+    los fragmentos vienen del LLM y la narrativa completa se guarda al terminar.
+    """
+    key = narrative_key(record, language, model_id)
+    if not refresh:
+        text, tier = narrative_cache.get(key)
+        if text is not None:
+            CACHE_LOOKUPS.inc("narrative", tier)
+            return iter([text]), tier
+    CACHE_LOOKUPS.inc("narrative", "refresh" if refresh else "miss")
+
+    def chunks():
+        parts = []
+        for delta in llm_groq.stream_radiosonde(record, language=language, model_id=model_id):
+            parts.append(delta)
+            yield delta
+        narrative_cache.set(key, "".join(parts).strip())
+
+    return chunks(), "refresh" if refresh else "miss"
@@ -0,0 +1,39 @@
+"""
+Backend de caché para el estado vivo de las sesiones incrementales (session.py).
+"""
+import os
+import tempfile
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.filebased import FileBasedCache
+
+
+class SessionFileCache(FileBasedCache):
+    """
+    FileBasedCache sin descarte por MAX_ENTRIES (una sesión solo se va al cerrarse
+    o al expirar su TTL) y con add() atómico entre procesos: el archivo se escribe
+    aparte y se publica con os.link, que falla si la clave ya existe. session.py
+    lo usa como lock por sesión.
+    """
+
+    def _cull(self):
+        pass
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._createdir()
+        fname = self._key_to_file(key, version)
+        fd, tmp_path = tempfile.mkstemp(dir=self._dir)
+        try:
+            with open(fd, "wb") as f:
+                self._write_content(f, timeout, value)
+            for _ in range(2):
+                try:
+                    os.link(tmp_path, fname)
+                    return True
+                except FileExistsError:
+                    if self.has_key(key, version):
+                        return False
+                    self._delete(fname)   # expirado: se reemplaza
+            return False
+        finally:
+            os.remove(tmp_path)
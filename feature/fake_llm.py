@@ -0,0 +1,125 @@
+"""
+Servidor local compatible con /chat/completions de OpenAI/Groq, para medir y
+probar el pipeline sin red. Latencia y tasa de errores configurables.
+
+    python manage.py fake_llm --port 8765 --latency 1.5 --error-rate 0.1
+    GROQ_BASE_URL=http://127.0.0.1:8765 GROQ_API_KEY=x python manage.py runserver
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_TEXT = ("Perfil estable en los primeros kilómetros, sin CAPE apreciable. "
+         "No se esperan fenómenos convectivos significativos.")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive, como la API real
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        srv = self.server
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            return self._json(404, {"error": {"message": f"ruta desconocida: {self.path}"}})
+        with srv.lock:
+            srv.requests += 1
+            fail = srv.rng.random() < srv.error_rate
+            status = srv.rng.choice(srv.error_statuses) if fail else 200
+        time.sleep(srv.latency)
+        if fail:
+            with srv.lock:
+                srv.errors += 1
+            return self._json(status, {"error": {"message": "fallo simulado", "type": "fake"}})
+        model = body.get("model", "fake")
+        if body.get("stream"):
+            return self._stream(model)
+        return self._json(200, {
+            "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": srv.text},
+                         "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": length // 4, "completion_tokens": len(srv.text.split()),
+                      "total_tokens": length // 4 + len(srv.text.split())},
+        })
+
+    def _json(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, model):
+        srv = self.server
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        base = {"id": "chatcmpl-fake", "object": "chat.completion.chunk",
+                "created": int(time.time()), "model": model}
+        tokens = srv.text.split(" ")
+        for i, tok in enumerate(tokens):
+            delta = tok if i == len(tokens) - 1 else tok + " "
+            self._chunk({**base, "choices": [{"index": 0, "delta": {"content": delta}, "finish_reason": None}]})
+            time.sleep(srv.token_latency)
+        self._chunk({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        self._write(b"data: [DONE]\n\n")
+        self._write(b"")
+
+    def _chunk(self, payload):
+        self._write(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+
+    def _write(self, data):
+        self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+class FakeLLMServer(ThreadingHTTPServer):
+    """
+    latency: segundos antes de responder; token_latency: pausa entre fragmentos
+    en modo stream; error_rate: fracción de peticiones que responden con uno de
+    `error_statuses` (429/5xx). `requests` y `errors` cuentan lo atendido.
+    Uso en pruebas/benchmarks: `with FakeLLMServer(...) as srv: srv.url`.
+    """
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, token_latency=0.0,
+                 error_rate=0.0, error_statuses=(429, 500, 503), text=_TEXT, seed=0):
+        super().__init__((host, port), _Handler)
+        self.latency = latency
+        self.token_latency = token_latency
+        self.error_rate = error_rate
+        self.error_statuses = tuple(error_statuses)
+        self.text = text
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,198 @@
+"""
+Cola de trabajos en la base de datos (sin broker): cada ProcessingJob es una
+fila; los workers (`python manage.py process_jobs`) la toman con
+SELECT ... FOR UPDATE SKIP LOCKED, procesan los miembros del zip/tar con
+process_tsv_matrix en un pool de procesos y guardan progreso y heartbeat.
+
+Un trabajo `running` cuyo heartbeat tiene más de RADIOSONDE_JOB_STALE_SECONDS
+(worker caído) se vuelve a tomar y continúa sin repetir los miembros ya
+registrados en `results` (por su ruta dentro del archivo); tras
+RADIOSONDE_JOB_MAX_ATTEMPTS intentos queda `failed`. Los sondeos se guardan
+como los de /process/: BD y/o archivo de features según RADIOSONDE_STORE_RESULTS
+y RADIOSONDE_ARCHIVE_RESULTS.
+"""
+import hashlib
+import logging
+import os
+import socket
+import time
+from datetime import timedelta
+from io import BytesIO
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .batch import iter_archive_members, process_archive
+from .cache import result_key
+from .models import ProcessingJob, _finite
+from .rs_core import date_from_filename, process_tsv_matrix
+from .store import persist_results
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_EVERY = 50        # miembros entre guardados de progreso
+PROGRESS_SECONDS = 5.0     # ... o cada tantos segundos
+
+def _stale_seconds():
+    return getattr(settings, "RADIOSONDE_JOB_STALE_SECONDS", 300)
+
+def _max_attempts():
+    return getattr(settings, "RADIOSONDE_JOB_MAX_ATTEMPTS", 3)
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"[:64]
+
+def submit_job(archive, filename):
+    """Encola un zip/tar (bytes). Lanza ValueError si no es un archivo válido."""
+    members = iter_archive_members(BytesIO(archive), name=filename)
+    close = getattr(members, "close", None)
+    if close:
+        close()
+    return ProcessingJob.objects.create(filename=filename[:255], archive=archive)
+
+def claim_job(worker):
+    """
+    Toma el trabajo en cola más antiguo (o uno `running` abandonado) y lo marca
+    `running` a nombre de `worker`. None si no hay trabajo.
+    """
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=_stale_seconds())
+    abandoned = Q(status=ProcessingJob.RUNNING, heartbeat_at__lt=cutoff)
+    # Los que ya agotaron sus intentos no se vuelven a tomar
+    ProcessingJob.objects.filter(abandoned, attempts__gte=_max_attempts()).update(
+        status=ProcessingJob.FAILED, finished=now,
+        error="El worker dejó de responder demasiadas veces",
+    )
+    with transaction.atomic():
+        job = (ProcessingJob.objects
+               .select_for_update(skip_locked=True)
+               .filter(Q(status=ProcessingJob.QUEUED) | abandoned)
+               .defer("archive")
+               .order_by("created", "id")
+               .first())
+        if job is None:
+            return None
+        if job.status == ProcessingJob.RUNNING:
+            logger.warning("Retomando trabajo %s abandonado por %s", job.pk, job.worker)
+        ProcessingJob.objects.filter(pk=job.pk).update(
+            status=ProcessingJob.RUNNING, worker=worker, heartbeat_at=now,
+            attempts=F("attempts") + 1, started=job.started or now,
+        )
+    job.refresh_from_db()
+    return job
+
+def _process_job_member(path, data):
+    """
+    Corre en el worker del pool: process_tsv_matrix + hash del contenido (clave
+    en Radiosondeo). `file` es la ruta dentro del archivo; la fecha sale del nombre.
+    """
+    try:
+        out = process_tsv_matrix(BytesIO(data), filename=path)
+    except Exception as e:
+        return {"file": path, "error": f"Error procesando: {e}"}
+    out["date"] = date_from_filename(os.path.basename(path))
+    out["sha256"] = hashlib.sha256(data).hexdigest()
+    return out
+
+def _save_progress(job, **fields):
+    """Guarda progreso + heartbeat si el trabajo sigue siendo nuestro. False si otro worker lo tomó."""
+    updated = ProcessingJob.objects.filter(pk=job.pk, worker=job.worker, status=ProcessingJob.RUNNING).update(
+        heartbeat_at=timezone.now(), **fields)
+    return updated == 1
+
+def _store(rows):
+    if rows:
+        persist_results(rows)
+
+def _load_archive(job):
+    return bytes(ProcessingJob.objects.values_list("archive", flat=True).get(pk=job.pk))
+
+class JobLost(Exception):
+    """Otro worker tomó el trabajo (este se consideró caído)."""
+
+def run_job(job, pool=None):
+    """
+    Procesa los miembros pendientes del trabajo y lo deja `done`. Cada sondeo se
+    guarda en Radiosondeo (misma clave que /process/) y se resume en `results`.
+    """
+    archive = _load_archive(job)
+    done = {r["file"] for r in job.results}
+    if job.total is None:
+        job.total = sum(1 for _ in iter_archive_members(BytesIO(archive), name=job.filename, full_paths=True))
+        if not _save_progress(job, total=job.total):
+            raise JobLost(job.pk)
+
+    members = ((name, data) for name, data
+               in iter_archive_members(BytesIO(archive), name=job.filename, full_paths=True)
+               if name not in done)
+    pending_rows, last_save = [], time.monotonic()
+    for res in process_archive(members, pool=pool, fn=_process_job_member):
+        sha = res.pop("sha256", None)
+        if "error" in res:
+            job.failed += 1
+            job.results.append({"file": res["file"], "error": res["error"]})
+        else:
+            pending_rows.append((res, result_key(sha)))
+            job.results.append({"file": res["file"], "date": res["date"], "label": res["label"],
+                                # NaN no es JSON válido para jsonb
+                                "summary": {k: _finite(v) for k, v in res["summary"].items()}})
+        job.processed += 1
+        if len(pending_rows) >= PROGRESS_EVERY or time.monotonic() - last_save > PROGRESS_SECONDS:
+            _store(pending_rows)
+            pending_rows, last_save = [], time.monotonic()
+            if not _save_progress(job, processed=job.processed, failed=job.failed, results=job.results):
+                raise JobLost(job.pk)
+    _store(pending_rows)
+    if not _save_progress(job, processed=job.processed, failed=job.failed, results=job.results,
+                          status=ProcessingJob.DONE, finished=timezone.now()):
+        raise JobLost(job.pk)
+    job.status = ProcessingJob.DONE
+    return job
+
+def work(pool=None, worker=None, once=False, poll=2.0, stop=None):
+    """
+    Bucle del worker: toma un trabajo, lo procesa y repite. Con once=True
+    termina cuando no hay más trabajos. `stop()` -> True corta el bucle.
+    Devuelve cuántos trabajos completó.
+    """
+    worker = worker or worker_id()
+    completed = 0
+    while not (stop and stop()):
+        close_old_connections()
+        job = claim_job(worker)
+        if job is None:
+            if once:
+                break
+            time.sleep(poll)
+            continue
+        logger.info("Trabajo %s (%s) tomado por %s", job.pk, job.filename, worker)
+        try:
+            run_job(job, pool=pool)
+            completed += 1
+        except JobLost:
+            logger.warning("Trabajo %s tomado por otro worker; se abandona", job.pk)
+        except Exception as e:
+            logger.exception("Falló el trabajo %s", job.pk)
+            _save_progress(job, status=ProcessingJob.FAILED, error=str(e)[:2000], finished=timezone.now())
+    return completed
+
+def job_status(job, with_results=False):
+    out = {
+        "id": job.pk,
+        "status": job.status,
+        "file": job.filename,
+        "total": job.total,
+        "processed": job.processed,
+        "failed": job.failed,
+        "progress": (job.processed / job.total) if job.total else None,
+        "attempts": job.attempts,
+        "error": job.error or None,
+        "created": job.created.isoformat(),
+        "started": job.started.isoformat() if job.started else None,
+        "finished": job.finished.isoformat() if job.finished else None,
+    }
+    if with_results:
+        out["results"] = job.results
+    return out
@@ -0,0 +1,71 @@
+"""
+Importación diferida de dependencias pesadas (pandas, SciPy, MetPy/pint, Groq).
+`models.py`, `views.py` y los comandos de manage.py importan rs_core / llm_groq
+al cargar Django; con esto solo pagan esas importaciones en el primer uso real.
+
+    pd = lazy_import("pandas")
+    units = lazy_import("metpy.units", "units")
+    pd.read_csv(...)            # aquí se importa pandas
+
+Para precargar todo antes de recibir tráfico: RADIOSONDE_PRELOAD=true (lo aplica
+radiosonde/wsgi.py o asgi.py al arrancar el servidor, no los comandos de
+manage.py) o llamar a `preload()`.
+"""
+import importlib
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class LazyModule:
+    """Proxy de un módulo (o de un atributo suyo) que se importa en el primer acceso."""
+    def __init__(self, name, attr=None):
+        self.__dict__.update(_name=name, _attr=attr, _obj=None)
+
+    def _load(self):
+        obj = self._obj
+        if obj is None:
+            obj = importlib.import_module(self._name)
+            if self._attr:
+                obj = getattr(obj, self._attr)
+            self.__dict__["_obj"] = obj
+        return obj
+
+    def __getattr__(self, item):
+        return getattr(self._load(), item)
+
+    def __call__(self, *args, **kwargs):
+        return self._load()(*args, **kwargs)
+
+    def __repr__(self):
+        target = f"{self._name}.{self._attr}" if self._attr else self._name
+        return f"<LazyModule {target} {'cargado' if self._obj is not None else 'pendiente'}>"
+
+
+def lazy_import(name, attr=None):
+    return LazyModule(name, attr)
+
+
+def preload():
+    """
+    Importa las dependencias diferidas, prepara lo que se construye una vez por
+    proceso (tabla de pseudo-adiabáticas) y arranca los workers precalentados
+    del pool de procesamiento (si se usa). Devuelve los segundos que tomó.
+    """
+    from django.conf import settings
+    from . import batch, llm_groq, rs_core
+    t0 = time.perf_counter()
+    rs_core.warm_up()
+    llm_groq.warm_up()
+    if getattr(settings, "RADIOSONDE_PROCESS_IN_POOL", True):
+        batch.warm_pool()
+    elapsed = time.perf_counter() - t0
+    logger.info("Dependencias de feature precargadas en %.2f s", elapsed)
+    return elapsed
+
+def preload_if_enabled():
+    """preload() si RADIOSONDE_PRELOAD=true. Solo desde los puntos de entrada del servidor (wsgi/asgi)."""
+    from django.conf import settings
+    if getattr(settings, "RADIOSONDE_PRELOAD", False):
+        preload()
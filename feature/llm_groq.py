@@ -1,17 +1,161 @@
 import os
+import asyncio
 import json
-from groq import Groq
+import random
+import threading
+import time
+import weakref
+
 from dotenv import load_dotenv
 
+from .lazy import lazy_import
+from .metrics import LLM_FAILURES, timed
+
+# El SDK (groq + httpx + pydantic) se importa en la primera llamada, ver lazy.py
+groq = lazy_import("groq")
+httpx = lazy_import("httpx")
+
 load_dotenv()
 
 _MODEL_DEFAULT = os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile")
 
-def _make_client():
-    api_key = os.getenv("GROQ_API_KEY")
+# Cliente compartido por el proceso (conexiones keep-alive), límites y reintentos.
+# GROQ_BASE_URL permite apuntar a un servidor compatible (p. ej. `manage.py fake_llm`).
+_BASE_URL = os.getenv("GROQ_BASE_URL") or None
+_TIMEOUT = float(os.getenv("GROQ_TIMEOUT", "60"))
+_CONNECT_TIMEOUT = float(os.getenv("GROQ_CONNECT_TIMEOUT", "5"))
+_MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", "3"))
+_BACKOFF_BASE = float(os.getenv("GROQ_BACKOFF_BASE", "0.5"))
+_BACKOFF_MAX = float(os.getenv("GROQ_BACKOFF_MAX", "8"))
+_MAX_CONCURRENCY = int(os.getenv("GROQ_MAX_CONCURRENCY", "8"))
+
+_CLIENT = None
+_CLIENT_LOCK = threading.Lock()
+_SLOTS = threading.BoundedSemaphore(_MAX_CONCURRENCY)
+_RETRYABLE = None
+_CLIENT_ARGS = {}   # base_url/api_key de configure_client, también para los clientes async
+# Un AsyncGroq (y su semáforo) por event loop: httpx.AsyncClient no se comparte entre loops.
+# Cada cliente se cierra cuando termina su loop (ver _loop_client)
+_ASYNC = weakref.WeakKeyDictionary()
+
+def retryable_errors():
+    """Errores del SDK que se reintentan (429, 5xx, conexión)."""
+    global _RETRYABLE
+    if _RETRYABLE is None:
+        _RETRYABLE = (groq.RateLimitError, groq.InternalServerError, groq.APIConnectionError)
+    return _RETRYABLE
+
+def warm_up():
+    """Importa el SDK de Groq sin crear el cliente (lazy.preload)."""
+    groq._load()
+    httpx._load()
+    retryable_errors()
+
+def _make_client(base_url=None, api_key=None):
+    api_key = api_key or os.getenv("GROQ_API_KEY")
     if not api_key:
         raise RuntimeError("Falta GROQ_API_KEY en variables de entorno / .env")
-    return Groq(api_key=api_key)
+    http_client = httpx.Client(
+        timeout=httpx.Timeout(_TIMEOUT, connect=_CONNECT_TIMEOUT),
+        limits=httpx.Limits(max_connections=_MAX_CONCURRENCY, max_keepalive_connections=_MAX_CONCURRENCY),
+    )
+    # Los reintentos los hacemos nosotros (_with_retries), no el SDK
+    return groq.Groq(api_key=api_key, base_url=base_url or _BASE_URL, max_retries=0, http_client=http_client)
+
+def get_client():
+    """Cliente Groq único por proceso (se crea en el primer uso)."""
+    global _CLIENT
+    if _CLIENT is None:
+        with _CLIENT_LOCK:
+            if _CLIENT is None:
+                _CLIENT = _make_client()
+    return _CLIENT
+
+def configure_client(base_url=None, api_key=None):
+    """Reemplaza el cliente del proceso (p. ej. para apuntar a fake_llm en benchmarks)."""
+    global _CLIENT, _CLIENT_ARGS
+    with _CLIENT_LOCK:
+        old, _CLIENT = _CLIENT, _make_client(base_url, api_key)
+        _CLIENT_ARGS = {"base_url": base_url, "api_key": api_key}
+        _ASYNC.clear()
+    if old is not None:
+        old.close()
+    return _CLIENT
+
+def reset_client():
+    """Cierra el cliente actual; el siguiente uso lo recrea desde GROQ_* del entorno."""
+    global _CLIENT, _CLIENT_ARGS
+    with _CLIENT_LOCK:
+        old, _CLIENT = _CLIENT, None
+        _CLIENT_ARGS = {}
+        _ASYNC.clear()
+    if old is not None:
+        old.close()
+
+def _make_async_client(base_url=None, api_key=None):
+    api_key = api_key or os.getenv("GROQ_API_KEY")
+    if not api_key:
+        raise RuntimeError("Falta GROQ_API_KEY en variables de entorno / .env")
+    http_client = httpx.AsyncClient(
+        timeout=httpx.Timeout(_TIMEOUT, connect=_CONNECT_TIMEOUT),
+        limits=httpx.Limits(max_connections=_MAX_CONCURRENCY, max_keepalive_connections=_MAX_CONCURRENCY),
+    )
+    return groq.AsyncGroq(api_key=api_key, base_url=base_url or _BASE_URL, max_retries=0, http_client=http_client)
+
+async def _loop_client():
+    """
+    Generador async dueño del AsyncGroq de un loop. El loop cierra sus generadores
+    async al terminar (shutdown_asyncgens en asyncio.run, que es lo que usa
+    async_to_sync por petición) y con eso se cierra el cliente; también si el
+    generador se descarta antes (configure_client/reset_client vacían _ASYNC).
+    """
+    client = _make_async_client(**_CLIENT_ARGS)
+    try:
+        yield client
+    finally:
+        await client.close()
+
+async def _async_state():
+    """(AsyncGroq, asyncio.Semaphore, dueño) del event loop en curso; se crean en el primer uso."""
+    loop = asyncio.get_running_loop()
+    state = _ASYNC.get(loop)
+    if state is None:
+        owner = _loop_client()
+        state = _ASYNC[loop] = (await anext(owner), asyncio.Semaphore(_MAX_CONCURRENCY), owner)
+    return state
+
+async def get_async_client():
+    """Cliente AsyncGroq del event loop en curso (mismo destino que get_client)."""
+    return (await _async_state())[0]
+
+def _backoff(attempt, error):
+    """Espera antes del reintento `attempt`: Retry-After si viene, si no exponencial con jitter."""
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        return min(float(retry_after), _BACKOFF_MAX)
+    except (TypeError, ValueError):
+        return random.uniform(0, min(_BACKOFF_MAX, _BACKOFF_BASE * 2 ** attempt))
+
+def _with_retries(call):
+    """Ejecuta call() reintentando ante 429, 5xx y errores de conexión/timeout."""
+    for attempt in range(_MAX_RETRIES + 1):
+        try:
+            return call()
+        except retryable_errors() as e:
+            if attempt == _MAX_RETRIES:
+                raise
+            time.sleep(_backoff(attempt, e))
+
+async def _awith_retries(call):
+    """_with_retries para corrutinas: la espera entre intentos no bloquea el loop."""
+    for attempt in range(_MAX_RETRIES + 1):
+        try:
+            return await call()
+        except retryable_errors() as e:
+            if attempt == _MAX_RETRIES:
+                raise
+            await asyncio.sleep(_backoff(attempt, e))
 
 def _compact_levels(levels, keep=12):
     """
@@ -33,27 +177,24 @@ def _compact_levels(levels, keep=12):
     sampled = [levels[i] for i in idx]
     return [{k: round(l[k], 4) for k in cols if k in l} for l in sampled]
 
-def summarize_radiosonde(record: dict, language: str = "es", model_id: str = None) -> str:
-    """
-    Usa Groq LLM para generar una descripción/summary del radiosondeo procesado.
-    - record: dict con keys: file, date, label, summary{...}, levels[...]
-    - language: 'es' o 'en'
-    - model_id: override del modelo (opcional)
-    """
-    client = _make_client()
-    model = model_id or _MODEL_DEFAULT
+def resolve_model(model_id: str = None) -> str:
+    return model_id or _MODEL_DEFAULT
 
+def compact_record(record: dict) -> dict:
+    """Contexto compacto que se envía al LLM (y que identifica la narrativa en caché)."""
     # Reducimos niveles para no enviar payload gigante al LLM
     levels_small = _compact_levels(record.get("levels", []), keep=12)
-
-    # Construimos un contexto compacto (JSON estilizado)
-    compact = {
+    return {
         "file": record.get("file"),
         "date": record.get("date"),
         "label": record.get("label"),
         "summary": record.get("summary", {}),
         "levels_sampled": levels_small
     }
+
+def _messages(record: dict, language: str = "es"):
+    # Construimos un contexto compacto (JSON estilizado)
+    compact = compact_record(record)
     compact_json = json.dumps(compact, ensure_ascii=False, indent=2)
 
     system_msg = (
@@ -81,14 +222,73 @@ def summarize_radiosonde(record: dict, language: str = "es", model_id: str = Non
         "Data (JSON):\n"
         f"{compact_json}"
     )
+    return [
+        {"role": "system", "content": system_msg},
+        {"role": "user", "content": user_instruction},
+    ]
 
-    resp = client.chat.completions.create(
-        model=model,
-        messages=[
-            {"role": "system", "content": system_msg},
-            {"role": "user", "content": user_instruction},
-        ],
-        temperature=0.3,   # más estable
-        # max_tokens=800,  # ajusta si hace falta
-    )
+def summarize_radiosonde(record: dict, language: str = "es", model_id: str = None) -> str:
+    """
+    Usa Groq LLM para generar una descripción/summary del radiosondeo procesado.
+    - record: dict con keys: file, date, label, summary{...}, levels[...]
+    - language: 'es' o 'en'
+    - model_id: override del modelo (opcional)
+    """
+    try:
+        client = get_client()
+        with timed("llm"), _SLOTS:   # a lo sumo GROQ_MAX_CONCURRENCY completions en vuelo
+            resp = _with_retries(lambda: client.chat.completions.create(
+                model=resolve_model(model_id),
+                messages=_messages(record, language),
+                temperature=0.3,   # más estable
+                # max_tokens=800,  # ajusta si hace falta
+            ))
+    except Exception as e:
+        LLM_FAILURES.inc(type(e).__name__)
+        raise
+    return resp.choices[0].message.content.strip()
+
+async def asummarize_radiosonde(record: dict, language: str = "es", model_id: str = None) -> str:
+    """
+    summarize_radiosonde con AsyncGroq, para vistas async: mientras el LLM
+    responde el event loop sigue atendiendo otras peticiones.
+    """
+    try:
+        client, slots, _ = await _async_state()
+        with timed("llm"):
+            async with slots:
+                resp = await _awith_retries(lambda: client.chat.completions.create(
+                    model=resolve_model(model_id),
+                    messages=_messages(record, language),
+                    temperature=0.3,
+                ))
+    except Exception as e:
+        LLM_FAILURES.inc(type(e).__name__)
+        raise
     return resp.choices[0].message.content.strip()
+
+def stream_radiosonde(record: dict, language: str = "es", model_id: str = None):
+    """
+    Igual que summarize_radiosonde pero con stream=True: genera los fragmentos
+    de texto a medida que llegan del LLM. Solo se reintenta la apertura del
+    stream; el cupo de concurrencia se mantiene hasta que termina.
+    """
+    try:
+        client = get_client()
+        with timed("llm"), _SLOTS:
+            stream = _with_retries(lambda: client.chat.completions.create(
+                model=resolve_model(model_id),
+                messages=_messages(record, language),
+                temperature=0.3,
+                stream=True,
+            ))
+            with stream:
+                for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        yield delta
+    except Exception as e:
+        LLM_FAILURES.inc(type(e).__name__)
+        raise
@@ -0,0 +1,36 @@
+import inspect
+import json
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand
+
+from feature.benchmarks import SUITES, environment
+
+
+class Command(BaseCommand):
+    help = "Corre micro-benchmarks del pipeline de radiosondeos (ver feature/benchmarks.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("suite", choices=sorted(SUITES), help="Suite a ejecutar")
+        parser.add_argument("--count", type=int, default=200, help="Sondeos/parcelas sintéticos")
+        parser.add_argument("--repeat", type=int, default=3, help="Repeticiones por medición")
+        parser.add_argument("--rows", type=int, help="Filas por archivo EDT sintético (suites que lo usan)")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Guardar el resultado como JSON en este archivo")
+
+    def handle(self, *args, **opts):
+        fn = SUITES[opts["suite"]]
+        kwargs = {"count": opts["count"], "repeat": opts["repeat"], "seed": opts["seed"]}
+        if opts["rows"] is not None and "rows" in inspect.signature(fn).parameters:
+            kwargs["rows"] = opts["rows"]
+        result = fn(**kwargs)
+        text = json.dumps({
+            "suite": opts["suite"],
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "environment": environment(),
+            **result,
+        }, indent=2)
+        if opts["output"]:
+            with open(opts["output"], "w", encoding="utf-8") as fh:
+                fh.write(text + "\n")
+        self.stdout.write(text)
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from feature.archive import FeatureArchive, get_archive
+
+
+class Command(BaseCommand):
+    help = "Exporta el archivo de features (o un subconjunto) a un .npy contiguo + índice .csv."
+
+    def add_arguments(self, parser):
+        parser.add_argument("output", help="Ruta del .npy de salida (el índice va en <output>.csv)")
+        parser.add_argument("--archive", help="Directorio del archivo (por defecto RADIOSONDE_ARCHIVE_DIR)")
+        parser.add_argument("--date-from", help="Fecha mínima YYYY-MM-DD (inclusive)")
+        parser.add_argument("--date-to", help="Fecha máxima YYYY-MM-DD (inclusive)")
+        parser.add_argument("--label", action="append", help="Etiqueta a incluir (repetible)")
+
+    def handle(self, *args, **opts):
+        archive = FeatureArchive(opts["archive"]) if opts["archive"] else get_archive()
+        if not len(archive):
+            raise CommandError(f"El archivo {archive.path} está vacío")
+        rows = None
+        if opts["date_from"] or opts["date_to"] or opts["label"]:
+            rows = archive.select(opts["date_from"], opts["date_to"], opts["label"])
+        n = archive.export(opts["output"], rows=rows)
+        self.stdout.write(f"{n} sondeos exportados a {opts['output']} (índice en {opts['output']}.csv)")
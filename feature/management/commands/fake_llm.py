@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from feature.fake_llm import FakeLLMServer
+
+
+class Command(BaseCommand):
+    help = "Servidor local compatible con Groq/OpenAI (/chat/completions) con latencia y errores simulados."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument("--latency", type=float, default=1.0, help="Segundos antes de responder")
+        parser.add_argument("--token-latency", type=float, default=0.02, help="Pausa entre fragmentos (stream)")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Fracción de respuestas 429/5xx")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **opts):
+        srv = FakeLLMServer(opts["host"], opts["port"], latency=opts["latency"],
+                            token_latency=opts["token_latency"], error_rate=opts["error_rate"],
+                            seed=opts["seed"])
+        self.stdout.write(f"fake_llm en {srv.url} (GROQ_BASE_URL={srv.url})")
+        try:
+            srv.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            srv.server_close()
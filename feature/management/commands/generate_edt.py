@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from feature.synthetic import write_edt_files
+
+
+class Command(BaseCommand):
+    help = "Genera archivos EDT TSV sintéticos (atmósfera estándar + inversiones, capas inestables y ruido)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory", help="Directorio de salida")
+        parser.add_argument("--count", type=int, default=10, help="Cantidad de archivos")
+        parser.add_argument("--rows", type=int, default=2000, help="Filas (resolución vertical) por archivo")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **opts):
+        paths = write_edt_files(opts["directory"], count=opts["count"], rows=opts["rows"], seed=opts["seed"])
+        self.stdout.write(f"{len(paths)} archivos EDT en {opts['directory']}")
@@ -0,0 +1,36 @@
+import signal
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from feature.batch import WorkerPool, _pool_size
+from feature.jobs import work, worker_id
+
+
+class Command(BaseCommand):
+    help = "Worker de la cola de trabajos (ProcessingJob): toma trabajos con SKIP LOCKED y los procesa."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, help="Procesos para los sondeos de cada trabajo "
+                                                        "(por defecto RADIOSONDE_BATCH_WORKERS / núcleos)")
+        parser.add_argument("--once", action="store_true", help="Terminar cuando no queden trabajos")
+        parser.add_argument("--poll", type=float, default=2.0, help="Segundos entre consultas si la cola está vacía")
+
+    def handle(self, *args, **opts):
+        stopping = []
+
+        def stop(signum, frame):
+            self.stdout.write("Señal recibida: se termina tras el trabajo en curso")
+            stopping.append(signum)
+
+        n = opts["workers"] or _pool_size()
+        # Los procesos se crean antes de abrir la conexión a la BD (no la heredan)
+        connections.close_all()
+        with WorkerPool(max_workers=n) as pool:
+            pool.warm()
+            signal.signal(signal.SIGTERM, stop)
+            signal.signal(signal.SIGINT, stop)
+            name = worker_id()
+            self.stdout.write(f"Worker {name} listo con {n} procesos")
+            done = work(pool=pool, worker=name, once=opts["once"], poll=opts["poll"], stop=lambda: bool(stopping))
+        self.stdout.write(f"{done} trabajos completados")
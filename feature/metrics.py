@@ -0,0 +1,187 @@
+"""
+Métricas en proceso (histogramas y contadores) en formato de texto Prometheus,
+expuestas en /feature/metrics/. Con RADIOSONDE_METRICS=false `timed()` devuelve
+un contexto vacío compartido y los contadores no hacen nada.
+
+    with timed("physics"):
+        ...
+    CACHE_LOOKUPS.inc("result", "memory")
+
+Cada proceso web lleva sus propias métricas; los workers del pool de
+procesamiento (batch.py) devuelven las suyas con cada trabajo (drain/merge).
+"""
+import bisect
+import os
+import threading
+import time
+
+ENABLED = os.getenv("RADIOSONDE_METRICS", "true").lower() == "true"
+
+# Segundos: de sub-milisegundo (interp, label) a decenas de segundos (LLM)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_REGISTRY = []
+
+def _escape(value):
+    # Formato de texto Prometheus: \\, \" y \n dentro de los valores de etiqueta
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name, doc, labelnames=()):
+        self.name, self.doc, self.labelnames = name, doc, tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def inc(self, *labels, amount=1):
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines += [f"{self.name}{_labels(self.labelnames, k)} {v}" for k, v in items]
+        return lines
+
+
+class Gauge(Counter):
+    def set(self, value, *labels):
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[labels] = value
+
+    def render(self):
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, doc, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.doc, self.labelnames = name, doc, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}   # labels -> [conteo por bucket (no acumulado)..., +Inf], suma
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def observe(self, value, *labels):
+        if not ENABLED:
+            return
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][i] += 1
+            entry[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1])) for k, v in self._values.items())
+        names = self.labelnames + ("le",)
+        for labels, (counts, total) in items:
+            cum = 0
+            for bound, c in zip(self.buckets + ("+Inf",), counts):
+                cum += c
+                lines.append(f"{self.name}_bucket{_labels(names, labels + (bound,))} {cum}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cum}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("stage", "t0")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        STAGE_SECONDS.observe(time.perf_counter() - self.t0, self.stage)
+        return False
+
+
+class _NoTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NO_TIMER = _NoTimer()
+
+def timed(stage):
+    """Contexto que registra la duración de `stage` en radiosonde_stage_seconds."""
+    return _Timer(stage) if ENABLED else _NO_TIMER
+
+def render():
+    """Todas las métricas registradas en formato de exposición de texto de Prometheus."""
+    lines = []
+    for metric in _REGISTRY:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+def drain():
+    """Valores de contadores e histogramas acumulados desde el último drain, y los vacía."""
+    out = {}
+    for metric in _REGISTRY:
+        if isinstance(metric, Gauge):
+            continue
+        with metric._lock:
+            if metric._values:
+                out[metric.name], metric._values = metric._values, {}
+    return out
+
+def merge(values):
+    """Suma lo devuelto por drain() en otro proceso (workers del pool) a este registro."""
+    if not ENABLED:
+        return
+    by_name = {m.name: m for m in _REGISTRY}
+    for name, entries in values.items():
+        metric = by_name[name]
+        with metric._lock:
+            for labels, v in entries.items():
+                if isinstance(metric, Histogram):
+                    cur = metric._values.setdefault(labels, [[0] * (len(metric.buckets) + 1), 0.0])
+                    cur[0] = [a + b for a, b in zip(cur[0], v[0])]
+                    cur[1] += v[1]
+                else:
+                    metric._values[labels] = metric._values.get(labels, 0) + v
+
+def reset():
+    """Vacía todas las métricas (tests)."""
+    for metric in _REGISTRY:
+        with metric._lock:
+            metric._values.clear()
+
+
+STAGE_SECONDS = Histogram(
+    "radiosonde_stage_seconds",
+    "Duración por etapa: read, interp, physics (incluye parcel y cape), label, feature_matrix, serialize, llm, session (pedazo incremental).",
+    ["stage"],
+)
+CACHE_LOOKUPS = Counter(
+    "radiosonde_cache_lookups_total", "Consultas a caché por nivel (memory, shared, miss, refresh).", ["cache", "tier"],
+)
+LLM_FAILURES = Counter("radiosonde_llm_failures_total", "Llamadas al LLM que fallaron, por tipo de error.", ["error"])
+LABELS = Counter("radiosonde_labels_total", "Etiquetas producidas por el procesamiento.", ["label"])
+QUEUE_DEPTH = Gauge("radiosonde_queue_depth", "Trabajos admitidos en el pool de procesamiento (esperando + en curso).")
+QUEUE_WAIT = Histogram("radiosonde_queue_wait_seconds", "Espera en cola antes de que un worker del pool tome el trabajo.")
+QUEUE_REJECTED = Counter("radiosonde_queue_rejected_total", "Peticiones rechazadas con 429 por cola llena.")
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Radiosondeo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=128, unique=True)),
+                ('file', models.CharField(max_length=255)),
+                ('date', models.DateField(blank=True, null=True)),
+                ('label', models.CharField(max_length=16)),
+                ('gamma_env_0_3km', models.FloatField(null=True)),
+                ('gamma_moist_0_3km', models.FloatField(null=True)),
+                ('n2_mean_0_3km', models.FloatField(null=True)),
+                ('cape_sb', models.FloatField(null=True)),
+                ('cin_sb', models.FloatField(null=True)),
+                ('cape_ml', models.FloatField(null=True)),
+                ('cin_ml', models.FloatField(null=True)),
+                ('n_levels', models.PositiveSmallIntegerField()),
+                ('levels', models.BinaryField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date', 'id'], name='radiosondeo_date_idx'), models.Index(fields=['label', 'date', 'id'], name='radiosondeo_label_date_idx')],
+            },
+        ),
+    ]
@@ -1,3 +1,124 @@
+import datetime
+
 from django.db import models
+import numpy as np
+
+from .rs_core import FEATURE_ORDER
+
+def _parse_date(value):
+    try:
+        return datetime.date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+def _finite(value):
+    # NaN (p. ej. CAPE sin LFC) se guarda como NULL
+    return value if value is not None and np.isfinite(value) else None
+
+class Radiosondeo(models.Model):
+    """
+    Sondeo procesado. Las métricas de summary van en columnas propias (filtrables
+    e indexables); la matriz de niveles (n_levels x FEATURE_ORDER) se guarda
+    empaquetada como float64 little-endian en `levels` (float32 si X viene en
+    modo compacto; el tipo se deduce del tamaño).
+    """
+    key = models.CharField(max_length=128, unique=True)   # cache.result_key: contenido + parámetros
+    file = models.CharField(max_length=255)
+    date = models.DateField(null=True, blank=True)
+    label = models.CharField(max_length=16)
+
+    gamma_env_0_3km = models.FloatField(null=True)
+    gamma_moist_0_3km = models.FloatField(null=True)
+    n2_mean_0_3km = models.FloatField(null=True)
+    cape_sb = models.FloatField(null=True)
+    cin_sb = models.FloatField(null=True)
+    cape_ml = models.FloatField(null=True)
+    cin_ml = models.FloatField(null=True)
+
+    n_levels = models.PositiveSmallIntegerField()
+    levels = models.BinaryField()
+
+    created = models.DateTimeField(auto_now_add=True)
+
+    # summary de process_tsv_matrix -> columna
+    SUMMARY_FIELDS = {
+        "Gamma_env_0_3km": "gamma_env_0_3km",
+        "Gamma_moist_0_3km": "gamma_moist_0_3km",
+        "N2_mean_0_3km": "n2_mean_0_3km",
+        "CAPE_SB": "cape_sb",
+        "CIN_SB": "cin_sb",
+        "CAPE_ML": "cape_ml",
+        "CIN_ML": "cin_ml",
+    }
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["date", "id"], name="radiosondeo_date_idx"),
+            models.Index(fields=["label", "date", "id"], name="radiosondeo_label_date_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.file} ({self.label})"
+
+    @classmethod
+    def from_result(cls, result, key):
+        """Instancia sin guardar a partir del dict de process_tsv_matrix (para bulk_create)."""
+        X = np.asarray(result["X"])
+        X = np.ascontiguousarray(X, dtype="<f4" if X.dtype == np.float32 else "<f8")
+        summary = result.get("summary", {})
+        return cls(
+            key=key,
+            file=result["file"][:255],
+            date=_parse_date(result.get("date")),
+            label=result["label"],
+            n_levels=X.shape[0],
+            levels=X.tobytes(),
+            **{field: _finite(summary.get(k)) for k, field in cls.SUMMARY_FIELDS.items()},
+        )
+
+    def matrix(self):
+        """Matriz de niveles (n_levels x FEATURE_ORDER), float64 o float32 según cómo se guardó."""
+        raw = bytes(self.levels)
+        itemsize = len(raw) // max(1, self.n_levels * len(FEATURE_ORDER))
+        return np.frombuffer(raw, dtype="<f4" if itemsize == 4 else "<f8").reshape(self.n_levels, len(FEATURE_ORDER))
+
+    def summary(self):
+        return {key: getattr(self, field) for key, field in self.SUMMARY_FIELDS.items()}
+
+
+class ProcessingJob(models.Model):
+    """
+    Trabajo de procesamiento en segundo plano (un zip/tar de EDT TSV), para
+    lotes que no terminan dentro de un timeout HTTP. Los workers
+    (`manage.py process_jobs`) lo toman con SELECT ... FOR UPDATE SKIP LOCKED
+    y van guardando el progreso; un trabajo `running` sin heartbeat reciente
+    se vuelve a tomar (ver jobs.py).
+    """
+    QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+    STATUS_CHOICES = [(s, s) for s in (QUEUED, RUNNING, DONE, FAILED)]
+
+    status = models.CharField(max_length=8, choices=STATUS_CHOICES, default=QUEUED)
+    filename = models.CharField(max_length=255)
+    archive = models.BinaryField()                # zip/tar tal como se subió
+
+    total = models.PositiveIntegerField(null=True)    # miembros del archivo (se cuenta al tomarlo)
+    processed = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    results = models.JSONField(default=list)          # [{file, date, label, summary} | {file, error}]
+    error = models.TextField(blank=True, default="")
+
+    attempts = models.PositiveSmallIntegerField(default=0)
+    worker = models.CharField(max_length=64, blank=True, default="")
+    heartbeat_at = models.DateTimeField(null=True)
+
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True)
+    finished = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "created"], name="processingjob_status_idx"),
+        ]
 
-# Create your models here.
+    def __str__(self):
+        return f"{self.filename} ({self.status})"
@@ -0,0 +1,118 @@
+"""
+Consultas sobre los sondeos guardados (modelo Radiosondeo) para /feature/soundings/:
+rango de fechas, etiqueta y umbrales de métricas, con paginación keyset sobre
+(date, id) en vez de OFFSET (usa los índices radiosondeo_date_idx / _label_date_idx).
+"""
+import base64
+import datetime
+import json
+
+from django.db.models import Q
+
+from .models import Radiosondeo
+from .rs_core import FEATURE_ORDER, matrix_rows
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+_METRIC_FIELDS = tuple(Radiosondeo.SUMMARY_FIELDS.values())
+
+def encode_cursor(date, pk):
+    raw = json.dumps([date.isoformat(), pk]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor):
+    """Cursor opaco -> (fecha, id). ValueError si no es válido."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        date, pk = json.loads(raw)
+        return datetime.date.fromisoformat(date), int(pk)
+    except Exception:
+        raise ValueError("cursor inválido")
+
+def _date(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"'{name}' debe ser una fecha YYYY-MM-DD")
+
+def _float(params, name):
+    try:
+        return float(params[name])
+    except ValueError:
+        raise ValueError(f"'{name}' debe ser numérico")
+
+def build_queryset(params):
+    """
+    Filtros (query params):
+      date_from / date_to (inclusive), label (una o varias separadas por coma),
+      <métrica>_min / <métrica>_max con métrica en Radiosondeo.SUMMARY_FIELDS
+      (p. ej. cape_ml_min=500), cursor, limit, levels=true.
+    Solo se listan sondeos con fecha. Lanza ValueError ante parámetros inválidos.
+    """
+    qs = Radiosondeo.objects.filter(date__isnull=False)
+    date_from, date_to = _date(params, "date_from"), _date(params, "date_to")
+    if date_from:
+        qs = qs.filter(date__gte=date_from)
+    if date_to:
+        qs = qs.filter(date__lte=date_to)
+
+    labels = [l for l in params.get("label", "").split(",") if l]
+    if len(labels) == 1:
+        qs = qs.filter(label=labels[0])
+    elif labels:
+        qs = qs.filter(label__in=labels)
+
+    for field in _METRIC_FIELDS:
+        if params.get(f"{field}_min"):
+            qs = qs.filter(**{f"{field}__gte": _float(params, f"{field}_min")})
+        if params.get(f"{field}_max"):
+            qs = qs.filter(**{f"{field}__lte": _float(params, f"{field}_max")})
+
+    if params.get("cursor"):
+        date, pk = decode_cursor(params["cursor"])
+        qs = qs.filter(Q(date__gt=date) | Q(date=date, id__gt=pk))
+
+    if params.get("levels", "false").lower() != "true":
+        qs = qs.defer("levels")   # la matriz solo viaja si se pide
+    return qs.order_by("date", "id")
+
+def _limit(params):
+    try:
+        limit = int(params.get("limit", DEFAULT_LIMIT))
+    except ValueError:
+        raise ValueError("'limit' debe ser entero")
+    return max(1, min(limit, MAX_LIMIT))
+
+def serialize(obj, with_levels=False, digits=None):
+    out = {
+        "id": obj.id,
+        "file": obj.file,
+        "date": obj.date.isoformat(),
+        "label": obj.label,
+        "summary": obj.summary(),
+    }
+    if with_levels:
+        out["levels"] = matrix_rows(obj.matrix(), digits)
+    return out
+
+def query_soundings(params, digits=None):
+    """
+    Una página: {"results": [...], "next": cursor o None}. "levels" en columnas
+    FEATURE_ORDER, redondeadas a `digits` cifras significativas si se pide.
+    """
+    limit = _limit(params)
+    with_levels = params.get("levels", "false").lower() == "true"
+    rows = list(build_queryset(params)[:limit + 1])
+    more = len(rows) > limit
+    rows = rows[:limit]
+    page = {
+        "results": [serialize(r, with_levels, digits) for r in rows],
+        "next": encode_cursor(rows[-1].date, rows[-1].id) if more else None,
+    }
+    if with_levels:
+        page["columns"] = FEATURE_ORDER
+    return page
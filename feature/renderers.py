@@ -0,0 +1,104 @@
+"""
+Codificaciones del sondeo procesado para /feature/process/ (negociación por
+Accept o ?format=). Reciben el dict de process_tsv_matrix, con la matriz "X"
+(niveles x FEATURE_ORDER) en vez de la lista de dicts por nivel.
+"""
+import io
+import json
+
+import msgpack
+import numpy as np
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from .metrics import timed
+from .rs_core import FEATURE_ORDER, matrix_rows, significant_digits
+
+def _meta(data):
+    return {k: v for k, v in data.items() if k != "X"}
+
+def _is_result(data):
+    return isinstance(data, dict) and "X" in data
+
+def _json_fallback(data, renderer_context):
+    """Respuestas que no son un sondeo (401, 404, 429...) van en JSON aunque se haya pedido npy/npz."""
+    response = (renderer_context or {}).get("response")
+    if response is not None:
+        response["Content-Type"] = JSONRenderer.media_type
+    return JSONRenderer().render(data, renderer_context=renderer_context)
+
+
+class _TimedRender:
+    """render() medido como etapa "serialize"; cada renderer implementa encode()."""
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with timed("serialize"):
+            return self.encode(data, accepted_media_type, renderer_context)
+
+
+class SoundingJSONRenderer(_TimedRender, JSONRenderer):
+    """JSON por defecto (niveles como lista de dicts)."""
+    def encode(self, data, accepted_media_type=None, renderer_context=None):
+        return JSONRenderer.render(self, data, accepted_media_type, renderer_context)
+
+
+class ColumnarJSONRenderer(_TimedRender, JSONRenderer):
+    """{"file", "date", "label", "summary", "columns": FEATURE_ORDER, "data": [[...], ...]}"""
+    media_type = "application/vnd.radiosonde.columnar+json"
+    format = "columnar"
+
+    def encode(self, data, accepted_media_type=None, renderer_context=None):
+        if _is_result(data):
+            data = {**_meta(data), "columns": FEATURE_ORDER, "data": matrix_rows(data["X"], significant_digits(data))}
+        return JSONRenderer.render(self, data, accepted_media_type, renderer_context)
+
+
+class NpyRenderer(_TimedRender, BaseRenderer):
+    """Solo la matriz X (.npy, float64 o float32 compacto); columnas y etiqueta van en cabeceras X-Radiosonde-*."""
+    media_type = "application/x-npy"
+    format = "npy"
+    charset = None
+    render_style = "binary"
+
+    def encode(self, data, accepted_media_type=None, renderer_context=None):
+        if not _is_result(data):
+            return _json_fallback(data, renderer_context)
+        buf = io.BytesIO()
+        np.save(buf, np.asarray(data["X"]), allow_pickle=False)
+        return buf.getvalue()
+
+
+class NpzRenderer(_TimedRender, BaseRenderer):
+    """.npz con X, columns y meta (JSON con file/date/label/summary[/narrative])."""
+    media_type = "application/x-npz"
+    format = "npz"
+    charset = None
+    render_style = "binary"
+
+    def encode(self, data, accepted_media_type=None, renderer_context=None):
+        if not _is_result(data):
+            return _json_fallback(data, renderer_context)
+        buf = io.BytesIO()
+        np.savez(buf, X=np.asarray(data["X"]), columns=np.array(FEATURE_ORDER),
+                 meta=np.array(json.dumps(_meta(data), ensure_ascii=False)))
+        return buf.getvalue()
+
+
+class MsgPackRenderer(_TimedRender, BaseRenderer):
+    """
+    MessagePack: metadatos + "columns" + "X" como bytes little-endian (filas x
+    columnas) de tipo "dtype": "<f8", o "<f4" en modo compacto.
+    """
+    media_type = "application/x-msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def encode(self, data, accepted_media_type=None, renderer_context=None):
+        if _is_result(data):
+            X = np.asarray(data["X"])
+            X = np.ascontiguousarray(X, dtype="<f4" if X.dtype == np.float32 else "<f8")
+            data = {**_meta(data), "columns": FEATURE_ORDER, "shape": list(X.shape), "dtype": X.dtype.str,
+                    "X": X.tobytes()}
+        return msgpack.packb(data, use_bin_type=True)
+
+
+MATRIX_RENDERERS = [ColumnarJSONRenderer, NpyRenderer, NpzRenderer, MsgPackRenderer]
@@ -1,10 +1,20 @@
+from __future__ import annotations
+
 import os
-from io import StringIO
+import codecs
+from collections import namedtuple
+from functools import lru_cache
 import re, json
 import numpy as np
-import pandas as pd
-import metpy.calc as mpcalc
-from metpy.units import units
+
+from .lazy import lazy_import
+from .metrics import LABELS, timed
+
+# Pesadas (segundos de import): se cargan en el primer uso, ver lazy.py
+pd = lazy_import("pandas")
+lambertw = lazy_import("scipy.special", "lambertw")
+mpcalc = lazy_import("metpy.calc")
+units = lazy_import("metpy.units", "units")
 
 # ==== Config ====
 _P = list(np.arange(620.0, 100.0, -20.0, dtype=float))
@@ -18,6 +28,14 @@ FEATURE_ORDER = [
 ]
 CLASSES = ["Inversion", "Inestable", "Neutral", "Estable"]
 
+# Modo compacto (RADIOSONDE_COMPACT=true): matrices de features en float32 (la
+# física sigue en float64) y salidas redondeadas a SIGNIFICANT_DIGITS cifras
+# significativas (ver compact_result). Cada petición puede pedirlo con ?compact/?digits.
+COMPACT = os.getenv("RADIOSONDE_COMPACT", "false").lower() == "true"
+SIGNIFICANT_DIGITS = int(os.getenv("RADIOSONDE_SIGNIFICANT_DIGITS", "6"))
+MAX_SIGNIFICANT_DIGITS = 7    # lo que float32 representa sin ambigüedad
+FEATURE_DTYPE = np.float32 if COMPACT else np.float64
+
 G = 9.806
 GAMMA_DRY = 9.8
 HEADER_LINE_IDX = 45   # cabecera en la línea 46 (1-based)
@@ -29,25 +47,98 @@ RENAME_MAP = {
 }
 
 # ---- Lectura (desde path o file-like) ----
-def read_edt_tsv(source) -> pd.DataFrame:
+HEADER_SCAN_LINES = 400                      # máx. líneas de preámbulo a inspeccionar
+_HEADER_REQUIRED = ("p", "height", "t", "td")
+_WANTED_COLS = {k.lower() for k in RENAME_MAP}
+
+def _is_header(line) -> bool:
+    tokens = {t.strip().lower() for t in line.split("\t")}
+    return all(k in tokens for k in _HEADER_REQUIRED)
+
+def find_header_line(lines) -> int:
     """
-    source: ruta (str/Path) o file-like (UploadedFile, BytesIO, etc).
-    Asegura modo texto para pandas.read_csv.
+    Índice (0-based) de la línea de cabecera EDT: la primera línea cuyas columnas
+    (separadas por tab) incluyen P, Height, T y TD. Si no aparece en las primeras
+    HEADER_SCAN_LINES líneas se usa HEADER_LINE_IDX.
     """
-    # Caso 1: ruta en disco
-    if isinstance(source, (str, os.PathLike)):
-        df = pd.read_csv(source, sep="\t", skiprows=HEADER_LINE_IDX, engine="python")
-    else:
-        # Caso 2: file-like (bytes). Leemos y decodificamos a texto.
-        raw = source.read()
-        if isinstance(raw, bytes):
-            text = raw.decode("utf-8", errors="replace")
+    for i, line in enumerate(lines):
+        if i >= HEADER_SCAN_LINES:
+            break
+        if _is_header(line):
+            return i
+    return HEADER_LINE_IDX
+
+class _TextStream:
+    """
+    Vista de texto sobre un stream binario (UploadedFile, HttpRequest, BytesIO...).
+    Decodifica por bloques con un decoder incremental, así pandas consume el
+    upload sin que exista una copia completa en bytes ni en str.
+    """
+    def __init__(self, raw, encoding="utf-8", chunk_size=1 << 16):
+        self._raw = raw
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        self._chunk_size = chunk_size
+        self._buf = ""
+        self._eof = False
+
+    def _fill(self):
+        chunk = self._raw.read(self._chunk_size)
+        if not chunk:
+            self._buf += self._decoder.decode(b"", final=True)
+            self._eof = True
+        elif isinstance(chunk, bytes):
+            self._buf += self._decoder.decode(chunk)
         else:
-            # Ya es str
-            text = raw
-        buf = StringIO(text)
-        df = pd.read_csv(buf, sep="\t", skiprows=HEADER_LINE_IDX, engine="python")
+            self._buf += chunk   # file-like en modo texto
+
+    def unread(self, text):
+        self._buf = text + self._buf
+
+    def readline(self):
+        while "\n" not in self._buf and not self._eof:
+            self._fill()
+        i = self._buf.find("\n") + 1 or len(self._buf)
+        line, self._buf = self._buf[:i], self._buf[i:]
+        return line
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            while not self._eof:
+                self._fill()
+            size = len(self._buf)
+        while len(self._buf) < size and not self._eof:
+            self._fill()
+        out, self._buf = self._buf[:size], self._buf[size:]
+        return out
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            yield line
+
+def _skip_to_header(stream: _TextStream):
+    """Consume el preámbulo y deja la línea de cabecera al inicio del stream."""
+    seen = []
+    for line in stream:
+        if _is_header(line):
+            stream.unread(line)
+            return
+        seen.append(line)
+        if len(seen) >= HEADER_SCAN_LINES:
+            break
+    stream.unread("".join(seen[HEADER_LINE_IDX:]))
+
+def _read_table(buf, header_idx=0) -> pd.DataFrame:
+    # Motor C, solo columnas de RENAME_MAP y ya como float64 (sin astype por columna)
+    return pd.read_csv(
+        buf, sep="\t", skiprows=header_idx, engine="c",
+        usecols=lambda c: c.strip().lower() in _WANTED_COLS,
+        dtype=np.float64,
+    )
 
+def _select_columns(df: pd.DataFrame) -> pd.DataFrame:
     df.columns = df.columns.str.strip()
     cols_lower = {c.lower(): c for c in df.columns}
     selected = {}
@@ -56,32 +147,147 @@ def read_edt_tsv(source) -> pd.DataFrame:
             selected[src] = dst
         elif src.lower() in cols_lower:
             selected[cols_lower[src.lower()]] = dst
-    df = df[list(selected.keys())].rename(columns=selected)
-    for c in df.columns:
-        df[c] = df[c].astype(float)
-    return df.sort_values("P").reset_index(drop=True)
+    df = df[list(selected.keys())]
+    df.columns = list(selected.values())
+    return df
+
+def read_edt_tsv(source) -> pd.DataFrame:
+    """
+    source: ruta (str/Path) o file-like (UploadedFile, HttpRequest, BytesIO, etc).
+    Detecta la línea de cabecera y devuelve las columnas de RENAME_MAP
+    como float64, ordenadas por presión ascendente.
+    """
+    # Caso 1: ruta en disco
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "r", encoding="utf-8", errors="replace", newline="") as fh:
+            header_idx = find_header_line(fh)
+            fh.seek(0)
+            df = _read_table(fh, header_idx)
+    else:
+        # Caso 2: file-like (bytes o texto). Se decodifica por bloques mientras
+        # pandas lee, sin materializar el archivo completo.
+        stream = _TextStream(source)
+        _skip_to_header(stream)
+        df = _read_table(stream)
+
+    df = _select_columns(df)
+    return df.sort_values("P", ignore_index=True)
 
 # ---- Interpolación ----
+# Rejillas verticales: "p:620:100:20" (hPa, paso), "logp:620:100:27" (n niveles
+# equiespaciados en ln p), "z:0:12000:250" (m AGL, paso) o lista "p:850,700,500".
+Grid = namedtuple("Grid", "spec kind levels")   # levels: p descendente o z AGL ascendente
+
+DEFAULT_GRID = os.getenv("RADIOSONDE_GRID", "p:620:100:20")
+
+@lru_cache(maxsize=64)
+def parse_grid(spec=None):
+    """Grid a partir de su especificación (cacheada). ValueError si no es válida."""
+    spec = (spec or DEFAULT_GRID).strip()
+    kind, _, rest = spec.partition(":")
+    try:
+        if "," in rest:
+            levels = np.array([float(v) for v in rest.split(",")])
+        else:
+            start, stop, step = (float(v) for v in rest.split(":"))
+            if kind == "p":
+                levels = np.arange(start, stop, -abs(step))
+                if levels[-1] != stop: levels = np.append(levels, stop)
+            elif kind == "logp":
+                levels = np.geomspace(start, stop, int(step))
+            elif kind == "z":
+                levels = np.arange(start, stop + 1e-9, abs(step))
+            else:
+                raise ValueError
+    except (ValueError, IndexError):
+        raise ValueError(f"rejilla inválida: '{spec}' (ej. p:620:100:20, logp:620:100:27, z:0:12000:250)")
+    if kind not in ("p", "logp", "z") or levels.size < 2:
+        raise ValueError(f"rejilla inválida: '{spec}'")
+    levels = np.sort(levels)[::-1] if kind != "z" else np.sort(levels)
+    levels.setflags(write=False)
+    return Grid(spec, kind, levels)
+
+def interp_weights(xp, x):
+    """
+    Índices y pesos de interpolación lineal de xp (creciente) a x, con la
+    semántica de np.interp (valores constantes fuera de rango). Se calculan una
+    vez y se aplican a todos los campos con apply_weights.
+    """
+    xp = np.asarray(xp, dtype=np.float64)
+    i = np.clip(np.searchsorted(xp, x, side="right") - 1, 0, xp.size - 2)
+    dx = xp[i + 1] - xp[i]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        w = np.where(dx > 0, (x - xp[i]) / dx, 0.0)
+    return i, np.clip(w, 0.0, 1.0)
+
+def apply_weights(cols, i, w):
+    """
+    Aplica (i, w) a varios campos a la vez: cols es una lista de arreglos (n,);
+    solo se leen las filas que rodean cada nivel. Devuelve (campos, len(i)).
+    """
+    m = len(i)
+    gathered = np.stack([c[np.concatenate((i, i + 1))] for c in cols])
+    lo, hi = gathered[:, :m], gathered[:, m:]
+    return lo + (hi - lo) * w
+
+_INTERP_FIELDS = (("Z", None), ("T", None), ("TD", None), ("RH", 50.0), ("u", 0.0), ("v", 0.0), ("MR", 0.0))
+
+def _profile_arrays(df: pd.DataFrame):
+    """(p ascendente, nombres presentes, columnas) extraídos del DataFrame una sola vez."""
+    p = df["P"].to_numpy(dtype=np.float64)   # ascendente (read_edt_tsv ordena por P)
+    if p.size < 2:
+        raise ValueError("el sondeo necesita al menos 2 niveles")
+    present = [name for name, _ in _INTERP_FIELDS if name in df]
+    return p, present, [df[name].to_numpy(dtype=np.float64) for name in present]
+
+def _interp_arrays(p, present, cols, grid):
+    if grid.kind == "z":
+        # Coordenada z AGL creciente desde la superficie (mayor presión)
+        cols, p = [c[::-1] for c in cols], p[::-1]
+        z_agl = ensure_monotonic_z(cols[0] - cols[0][0])
+        i, w = interp_weights(z_agl, grid.levels)
+        out = apply_weights(cols + [np.log(p)], i, w)
+        p_out = np.exp(out[-1])
+        out[0] = cols[0][0] + grid.levels
+    else:
+        x_tgt = grid.levels[::-1]
+        if grid.kind == "logp":
+            i, w = interp_weights(np.log(p), np.log(x_tgt))
+        else:
+            i, w = interp_weights(p, x_tgt)
+        out = apply_weights(cols, i, w)[:, ::-1]
+        p_out = grid.levels.copy()
+
+    by_name = dict(zip(present, out))
+    fields = [by_name[name] if name in by_name else np.full(len(p_out), fill) for name, fill in _INTERP_FIELDS]
+    return (p_out, *fields)
+
+def interp_to_grid(df: pd.DataFrame, grid=None):
+    """
+    Interpola el perfil a la rejilla `grid` (Grid o especificación). Los índices
+    y pesos se calculan una vez y se aplican a todos los campos juntos.
+    Devuelve (p, z, T, Td, RH, u, v, MR) con p descendente, como interp_to_levels.
+    """
+    grid = grid if isinstance(grid, Grid) else parse_grid(grid)
+    return _interp_arrays(*_profile_arrays(df), grid)
+
+def interp_to_grids(df: pd.DataFrame, grids):
+    """{spec: tupla de interp_to_grid} para varias rejillas, leyendo el DataFrame una vez."""
+    arrays = _profile_arrays(df)
+    return {g: _interp_arrays(*arrays, parse_grid(g)) for g in grids}
+
 def interp_to_levels(df: pd.DataFrame):
-    p = df["P"].to_numpy()
-    I = lambda y: np.interp(P_LEVELS_ASC, p, y)
-    Z  = I(df["Z"].to_numpy())
-    T  = I(df["T"].to_numpy())
-    TD = I(df["TD"].to_numpy())
-    RH = I(df["RH"].to_numpy()) if "RH" in df else np.full_like(T, 50.0)
-    U  = I(df["u"].to_numpy())  if "u"  in df else np.zeros_like(T)
-    V  = I(df["v"].to_numpy())  if "v"  in df else np.zeros_like(T)
-    MR = I(df["MR"].to_numpy()) if "MR" in df else np.zeros_like(T)
-    D = lambda a: a[::-1]
-    return (P_LEVELS.copy(), D(Z), D(T), D(TD), D(RH), D(U), D(V), D(MR))
+    return interp_to_grid(df, DEFAULT_GRID)
 
 # ---- Utilidades físicas ----
 def ensure_monotonic_z(z):
-    z = z.copy()
-    for i in range(1, len(z)):
-        if z[i] <= z[i-1]:
-            z[i] = z[i-1] + 1.0
-    return z
+    """
+    Fuerza z estrictamente creciente sobre el último eje (1-D o (N, niveles)),
+    con al menos 1 m entre niveles: z'[i] = i + max_{j<=i}(z[j] - j).
+    """
+    z = np.asarray(z, dtype=np.float64)
+    i = np.arange(z.shape[-1], dtype=np.float64)
+    return np.maximum.accumulate(z - i, axis=-1) + i
 
 def moving_mean(x, k=5):
     if k <= 1 or len(x) < 3: return x
@@ -90,15 +296,351 @@ def moving_mean(x, k=5):
     return np.convolve(xx, np.ones(k)/k, mode='valid')
 
 def grad_dz(z, f, smooth_k=5):
-    ff = moving_mean(f, k=smooth_k) if smooth_k > 1 else f
-    n = min(len(z), len(ff))
-    return np.gradient(ff[:n], z[:n])
+    return grad_dz_stack(z, f, smooth_k=smooth_k)
+
+@lru_cache(maxsize=32)
+def _smoothing_matrix(L, k):
+    """Matriz (L, L) de moving_mean (media de k con bordes replicados)."""
+    if k <= 1 or L < 3:
+        return np.eye(L)
+    pad = k // 2
+    S = np.zeros((L, L))
+    cols = np.clip(np.arange(L)[:, None] + np.arange(-pad, pad + 1)[None, :], 0, L - 1)
+    np.add.at(S, (np.repeat(np.arange(L), k), cols.ravel()), 1.0 / k)
+    S.setflags(write=False)
+    return S
+
+def _gradient_matrix(z):
+    """
+    Operador (..., L, L) de np.gradient(f, z) para coordenadas no uniformes:
+    2º orden en el interior, 1er orden en los bordes.
+    """
+    L = z.shape[-1]
+    D = np.zeros(z.shape + (L,))
+    hs = z[..., 1:-1] - z[..., :-2]
+    hd = z[..., 2:] - z[..., 1:-1]
+    den = hs * hd * (hd + hs)
+    i = np.arange(1, L - 1)
+    D[..., i, i - 1] = -hd**2 / den
+    D[..., i, i]     = (hd**2 - hs**2) / den
+    D[..., i, i + 1] = hs**2 / den
+    h0, hn = z[..., 1] - z[..., 0], z[..., -1] - z[..., -2]
+    D[..., 0, 0], D[..., 0, 1] = -1.0 / h0, 1.0 / h0
+    D[..., -1, -2], D[..., -1, -1] = -1.0 / hn, 1.0 / hn
+    return D
+
+def dz_operator(z, smooth_k=5):
+    """Operador lineal (..., L, L) = gradiente(z) · suavizado(k): d/dz de la media móvil."""
+    z = np.asarray(z, dtype=np.float64)
+    return _gradient_matrix(z) @ _smoothing_matrix(z.shape[-1], smooth_k)
+
+def grad_dz_stack(z, F, smooth_k=5):
+    """
+    Suaviza y deriva respecto a z en un solo paso (equivale a grad_dz campo a campo).
+    z: (L,) o (N, L). F: (L,), (campos, L) o (N, campos, L) -> misma forma que F.
+    """
+    z = np.asarray(z, dtype=np.float64)
+    F = np.asarray(F, dtype=np.float64)
+    op = dz_operator(z, smooth_k)
+    if F.ndim == 1:
+        return op @ F
+    if z.ndim == 2 and F.ndim == 2:     # (N, L) con un campo por sondeo
+        return np.einsum("nij,nj->ni", op, F)
+    return F @ np.swapaxes(op, -1, -2)
+
+# ---- Física vectorizada (N sondeos × niveles) ----
+# Constantes con los mismos valores que metpy.constants (para paridad con MetPy)
+P0_HPA   = 1000.0
+KAPPA    = 0.28571428571428564      # Rd / Cp_d
+EPSILON  = 0.6219569100577033       # Mw / Md
+_T0      = 273.16                   # K
+_ES0_PA  = 611.2                    # e_s a T0
+_LV0     = 2500840.0                # J/kg
+_CP_L    = 4219.4                   # J/(kg K)
+_CP_V    = 1860.078011865639        # J/(kg K)
+_RV      = 461.52311572606084       # J/(kg K)
+_RD      = 287.04749097718457       # J/(kg K)
+_CP_D    = 1004.6662184201462       # J/(kg K)
+
+CAPE_MODE   = os.getenv("RADIOSONDE_CAPE_MODE", "fast")     # "fast" (NumPy) | "metpy" (referencia)
+PARCEL_MODE = os.getenv("RADIOSONDE_PARCEL_MODE", "table")  # "table" (LUT) | "ode" (mpcalc.parcel_profile)
+
+def _rows(a):
+    return np.atleast_2d(np.asarray(a, dtype=np.float64))
+
+def saturation_vapor_pressure_pa(T_K):
+    """e_s sobre agua líquida (Ambaum 2020, ec. 13), igual que MetPy. Devuelve Pa."""
+    L = _LV0 - (_CP_L - _CP_V) * (T_K - _T0)
+    return _ES0_PA * (_T0 / T_K) ** ((_CP_L - _CP_V) / _RV) * np.exp((_LV0 / _T0 - L / T_K) / _RV)
+
+def mixing_ratio_from_rh(p_hPa, T_K, rh01):
+    """Razón de mezcla (kg/kg) a partir de HR en 0..1; NaN donde e_s >= p."""
+    p_pa = p_hPa * 100.0
+    e_s = saturation_vapor_pressure_pa(T_K)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        w_s = np.where(e_s >= p_pa, np.nan, EPSILON * e_s / (p_pa - e_s))
+    return EPSILON * w_s * rh01 / (EPSILON + w_s * (1.0 - rh01))
+
+def physics_batch(p_hPa, z_m, T_K, RH_pct, MR_gkg, smooth_k=5, T_parcel_K=None, use_rh=None):
+    """
+    Física "seca" para una pila de sondeos sobre la misma rejilla, sin pint:
+    arreglos (N, niveles) (p puede ser 1-D). Devuelve theta, theta_v, r (kg/kg),
+    Gamma_env (K/km), dtheta_dz_Kkm, N2 (s^-2) y z monotónica, todos (N, niveles).
+    Si MR de un sondeo es ~0 se deriva r de la HR, como physics_from_profile.
+    Con T_parcel_K (N, niveles) también devuelve Gamma_moist de esa parcela.
+    `use_rh` fija esa decisión (cálculo sobre una ventana de niveles, ver session.py).
+    Todas las derivadas verticales salen de una sola llamada a grad_dz_stack.
+    """
+    T = _rows(T_K)
+    p = np.broadcast_to(np.asarray(p_hPa, dtype=np.float64), T.shape)
+    z = ensure_monotonic_z(_rows(z_m))
+    MR = np.broadcast_to(_rows(MR_gkg), T.shape)
+    RH = np.broadcast_to(_rows(RH_pct), T.shape)
+
+    if use_rh is None:
+        use_rh = np.all(np.abs(MR) <= 1e-8, axis=-1, keepdims=True)
+    r = np.where(use_rh, mixing_ratio_from_rh(p, T, RH / 100.0), MR / 1000.0)
+
+    theta   = T / (p / P0_HPA) ** KAPPA
+    theta_v = theta * (r + EPSILON) / (EPSILON * (1.0 + r))
+
+    fields = [T, theta, theta_v]
+    if T_parcel_K is not None:
+        fields.append(np.broadcast_to(_rows(T_parcel_K), T.shape))
+    d = grad_dz_stack(z, np.stack(fields, axis=1), smooth_k)   # (N, campos, L)
+
+    out = dict(theta=theta, theta_v=theta_v, r=r,
+               Gamma_env=-d[:, 0] * 1000.0, dtheta_dz_Kkm=d[:, 1] * 1000.0,
+               N2=(G / theta_v) * d[:, 2], z=z)
+    if T_parcel_K is not None:
+        out["Gamma_moist"] = -d[:, 3] * 1000.0
+    return out
+
+# ---- CAPE/CIN vectorizado (N parcelas) ----
+def saturation_mixing_ratio(p_hPa, T_K):
+    p_pa = p_hPa * 100.0
+    e_s = saturation_vapor_pressure_pa(T_K)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(e_s >= p_pa, np.nan, EPSILON * e_s / (p_pa - e_s))
+
+def lcl_batch(p_hPa, T_K, Td_K):
+    """LCL exacto de Romps (2017) vía Lambert W, como mpcalc.lcl. Devuelve (p_lcl, T_lcl)."""
+    w = saturation_mixing_ratio(p_hPa, Td_K)
+    q = w / (1.0 + w)
+    moist_heat_ratio = (_CP_D + q * (_CP_V - _CP_D)) / (_RD + q * (_RV - _RD))
+    a = moist_heat_ratio + (_CP_L - _CP_V) / _RV
+    b = -(_LV0 + (_CP_L - _CP_V) * _T0) / (_RV * T_K)
+    c = b / a
+    rh = saturation_vapor_pressure_pa(Td_K) / saturation_vapor_pressure_pa(T_K)
+    w_m1 = lambertw(rh ** (1.0 / a) * c * np.exp(c), k=-1).real
+    T_lcl = c / w_m1 * T_K
+    return p_hPa * (T_lcl / T_K) ** moist_heat_ratio, T_lcl
+
+def _virtual(T_K, r):
+    return T_K * (r + EPSILON) / (EPSILON * (1.0 + r))
+
+def _first_true(mask, fill=-1):
+    """Índice del primer True por fila (fill si no hay)."""
+    return np.where(mask.any(axis=-1), mask.argmax(axis=-1), fill)
+
+def _last_true(mask, fill=-1):
+    n = mask.shape[-1]
+    return np.where(mask.any(axis=-1), n - 1 - mask[..., ::-1].argmax(axis=-1), fill)
+
+def cape_cin_batch(p_hPa, T_K, Td_K, T_parcel_K):
+    """
+    CAPE/CIN de N parcelas a la vez, sobre arreglos (N, niveles) sin pint (p puede
+    ser 1-D, descendente). Reproduce mpcalc.cape_cin con which_lfc='bottom' y
+    which_el='top': temperaturas virtuales, LFC/EL por cruces en log(p) e
+    integración trapezoidal en ln(p) entre los puntos (niveles + cruces por cero).
+    Devuelve dict con cape, cin (J/kg), lfc_p y el_p (hPa), cada uno (N,).
+    """
+    T  = _rows(T_K); Td = _rows(Td_K); Tp = _rows(T_parcel_K)
+    T, Td, Tp = np.broadcast_arrays(T, Td, Tp)
+    p  = np.broadcast_to(np.asarray(p_hPa, dtype=np.float64), T.shape)
+    n, L = T.shape
+    rows = np.arange(n)
+    p0, T0, Td0 = p[:, 0], T[:, 0], Td[:, 0]
+
+    # Perfiles virtuales: la parcela conserva r(Td0) bajo el LCL y va saturada encima
+    p_lcl, _ = lcl_batch(p0, T0, Td0)
+    r_parcel = np.where(p > p_lcl[:, None],
+                        saturation_mixing_ratio(p0, Td0)[:, None],
+                        saturation_mixing_ratio(p, Tp))
+    Tve = _virtual(T, saturation_mixing_ratio(p, Td))
+    Tvp = _virtual(Tp, r_parcel)
+    y = Tvp - Tve
+    lnp = np.log(p)
+
+    # Cruces entre niveles j y j+1 (interpolación lineal en ln p), como find_intersections
+    sgn = np.sign(y)
+    cross = sgn[:, :-1] != sgn[:, 1:]
+    y0, y1 = y[:, :-1], y[:, 1:]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        lnpc = (y1 * lnp[:, :-1] - y0 * lnp[:, 1:]) / (y1 - y0)
+        pc = np.where(cross, np.exp(np.where(cross, lnpc, 0.0)), np.nan)
+    dup = np.zeros_like(cross)
+    dup[:, :-1] = cross[:, :-1] & cross[:, 1:] & (y[:, 1:-1] == 0)
+    cross &= ~dup
+    j = np.arange(L - 1)
+    inc = cross & (sgn[:, 1:] > 0)
+    dec = cross & (sgn[:, 1:] < 0)
+
+    # LFC ('bottom'): primer cruce creciente por encima del LCL de la parcela virtual
+    p_lcl_lfc, _ = lcl_batch(p0, Tvp[:, 0], Td0)
+    skip0 = np.isclose(Tvp[:, 0], Tve[:, 0])
+    cand = inc & (j[None, :] >= skip0[:, None].astype(int))
+    above = cand & (pc < p_lcl_lfc[:, None])
+    i_above = _first_true(above)
+    positive_above_lcl = ((p < p_lcl_lfc[:, None])
+                          & ~((Tvp < Tve) | np.isclose(Tvp, Tve))).any(axis=-1)
+    dec1 = dec & (j[None, :] >= 1)
+    el_below_lcl = np.where(dec1, pc, np.inf).min(axis=-1) > p_lcl_lfc
+    el_below_lcl &= dec1.any(axis=-1)
+    lfc_p = np.where(
+        i_above >= 0, pc[rows, np.maximum(i_above, 0)],
+        np.where(cand.any(axis=-1),
+                 np.where(el_below_lcl, np.nan, p_lcl_lfc),
+                 np.where(positive_above_lcl, p_lcl_lfc, np.nan)))
+
+    # EL ('top'): último cruce decreciente, si está por encima del LCL del entorno
+    p_lcl_el, _ = lcl_batch(p0, Tve[:, 0], Td0)
+    i_el = _last_true(dec1)
+    el_p = np.where(i_el >= 0, pc[rows, np.maximum(i_el, 0)], np.nan)
+    el_p = np.where((Tvp[:, -1] > Tve[:, -1]) | ~(el_p < p_lcl_el), np.nan, el_p)
+    el_top = np.where(np.isnan(el_p), p[:, -1], el_p)
+
+    # Integración por sub-segmentos: (j -> cruce) y (cruce -> j+1); los cruces se
+    # insertan desde j >= 1 como en _find_append_zero_crossings
+    ins = cross & (j[None, :] >= 1)
+    pa, pb = p[:, :-1], p[:, 1:]
+    ya, yb = y0, y1
+    pm = np.where(ins, pc, pb)
+    ym = np.where(ins, 0.0, yb)
+    def _seg_area(p_hi, y_hi, p_lo, y_lo, keep):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            area = 0.5 * (y_hi + y_lo) * (np.log(p_hi) - np.log(p_lo))
+        return np.where(keep, area, 0.0).sum(axis=-1)
+    def _in_range(pp, lo, hi):
+        return (((pp < hi) | np.isclose(pp, hi)) & ((pp > lo) | np.isclose(pp, lo)))
+
+    lfc_c, el_c = lfc_p[:, None], el_top[:, None]
+    cape_mask = lambda pp: _in_range(pp, el_c, lfc_c)
+    cin_mask  = lambda pp: (pp > lfc_c) | np.isclose(pp, lfc_c)
+    cape = _RD * (_seg_area(pa, ya, pm, ym, cape_mask(pa) & cape_mask(pm))
+                  + _seg_area(pm, ym, pb, yb, cape_mask(pm) & cape_mask(pb) & ins))
+    cin  = _RD * (_seg_area(pa, ya, pm, ym, cin_mask(pa) & cin_mask(pm))
+                  + _seg_area(pm, ym, pb, yb, cin_mask(pm) & cin_mask(pb) & ins))
+    cin = np.minimum(cin, 0.0)
+
+    no_lfc = np.isnan(lfc_p)
+    cape = np.where(no_lfc, 0.0, cape)
+    cin  = np.where(no_lfc, 0.0, cin)
+    return dict(cape=cape, cin=cin, lfc_p=lfc_p, el_p=el_p)
+
+# ---- Tabla de pseudo-adiabáticas (ascenso de parcelas) ----
+# Cada fila es una pseudo-adiabática indexada por θw (temperatura a 1000 hPa) y
+# cada columna un nivel de una rejilla uniforme en ln(p). Se integra una sola vez
+# con el mismo ODE y tolerancias que mpcalc.moist_lapse.
+MOIST_TABLE_PATH = os.getenv("RADIOSONDE_MOIST_TABLE", "")   # .npz opcional (caché en disco)
+_MT_THETA_W = np.arange(200.0, 360.0 + 1e-9, 0.25)           # K
+_MT_LNP = np.linspace(np.log(1100.0), np.log(50.0), 600)     # ln(hPa)
+_MOIST_TABLE = None
+
+def _moist_dTdp(p_hPa, T_K):
+    rs = saturation_mixing_ratio(p_hPa, T_K)
+    frac = (_RD * T_K + _LV0 * rs) / (_CP_D + _LV0 * _LV0 * rs * EPSILON / (_RD * T_K**2))
+    return frac / p_hPa
+
+def build_moist_table():
+    """Integra todas las pseudo-adiabáticas de _MT_THETA_W sobre _MT_LNP. (K, P) en K."""
+    from scipy.integrate import solve_ivp
+    p = np.exp(_MT_LNP)
+    up, down = p[p < 1000.0], p[p >= 1000.0]
+    args = dict(fun=_moist_dTdp, y0=_MT_THETA_W, method="LSODA", atol=1e-7, rtol=1.5e-8)
+    res_up = solve_ivp(t_span=(1000.0, up[-1]), t_eval=up, **args)
+    res_dn = solve_ivp(t_span=(1000.0, down[0]), t_eval=down[::-1], **args)
+    if not (res_up.success and res_dn.success):
+        raise ValueError("Falló la integración de la tabla de pseudo-adiabáticas")
+    return np.concatenate([res_dn.y[:, ::-1], res_up.y], axis=1)
+
+def get_moist_table():
+    """Tabla en memoria (una vez por proceso); si MOIST_TABLE_PATH existe se carga de disco."""
+    global _MOIST_TABLE
+    if _MOIST_TABLE is None:
+        table = None
+        if MOIST_TABLE_PATH and os.path.exists(MOIST_TABLE_PATH):
+            with np.load(MOIST_TABLE_PATH) as npz:
+                if (np.array_equal(npz["theta_w"], _MT_THETA_W)
+                        and np.array_equal(npz["lnp"], _MT_LNP)):
+                    table = npz["T"]
+        if table is None:
+            table = build_moist_table()
+            if MOIST_TABLE_PATH:
+                np.savez(MOIST_TABLE_PATH, T=table, theta_w=_MT_THETA_W, lnp=_MT_LNP)
+        _MOIST_TABLE = table
+    return _MOIST_TABLE
+
+def warm_up():
+    """Importa pandas/SciPy/MetPy y carga la tabla de pseudo-adiabáticas (lazy.preload)."""
+    for module in (pd, lambertw, mpcalc, units):
+        module._load()
+    get_moist_table()
+
+def _lnp_index(p_hPa):
+    """Índice fraccional en _MT_LNP (rejilla uniforme) -> (i, w)."""
+    step = _MT_LNP[1] - _MT_LNP[0]
+    f = np.clip((np.log(p_hPa) - _MT_LNP[0]) / step, 0.0, len(_MT_LNP) - 1.000001)
+    i = f.astype(int)
+    return i, f - i
+
+def moist_lapse_table(p_hPa, p_start, T_start):
+    """
+    Temperatura (K) sobre la pseudo-adiabática que pasa por (p_start, T_start),
+    evaluada en p_hPa. p_start/T_start: (N,), p_hPa: (L,) -> (N, L).
+    Interpolación bilineal en (θw, ln p).
+    """
+    table = get_moist_table()
+    p_start = np.atleast_1d(p_start); T_start = np.atleast_1d(T_start)
+    # Columna de la tabla en p_start -> θw fraccional de cada parcela
+    i, w = _lnp_index(p_start)
+    cols = table[:, i].T * (1.0 - w[:, None]) + table[:, i + 1].T * w[:, None]   # (N, K)
+    K = cols.shape[1]
+    k = np.clip((cols < T_start[:, None]).sum(axis=1) - 1, 0, K - 2)
+    rows = np.arange(len(T_start))
+    c0, c1 = cols[rows, k], cols[rows, k + 1]
+    wk = ((T_start - c0) / (c1 - c0))[:, None]
+    k = k[:, None]
+    # Evaluación en los niveles pedidos
+    j, wj = _lnp_index(np.asarray(p_hPa, dtype=np.float64))
+    t00, t01 = table[k, j], table[k, j + 1]
+    t10, t11 = table[k + 1, j], table[k + 1, j + 1]
+    return ((1.0 - wk) * ((1.0 - wj) * t00 + wj * t01)
+            + wk * ((1.0 - wj) * t10 + wj * t11))
+
+def parcel_profile_batch(p_hPa, T_start, Td_start):
+    """
+    Equivalente vectorizado de mpcalc.parcel_profile para N parcelas que parten
+    de p_hPa[0]: adiabática seca hasta el LCL y pseudo-adiabática (tabla) encima.
+    Error frente al ODE de MetPy: < 0.005 K para θw en 200-360 K y p en 1100-50 hPa
+    (ver MoistTableTests); fuera de ese rango la tabla satura en el borde.
+    """
+    p = np.asarray(p_hPa, dtype=np.float64)
+    T_start = np.atleast_1d(np.asarray(T_start, dtype=np.float64))
+    Td_start = np.atleast_1d(np.asarray(Td_start, dtype=np.float64))
+    p_lcl, _ = lcl_batch(p[0], T_start, Td_start)
+    T_dry = T_start[:, None] * (p[None, :] / p[0]) ** KAPPA
+    T_lcl = T_start * (p_lcl / p[0]) ** KAPPA
+    T_moist = moist_lapse_table(p, p_lcl, T_lcl)
+    return np.where(p[None, :] >= p_lcl[:, None], T_dry, T_moist)
 
 def _first_scalar(q):
     try: return q[0]
     except Exception: return q
 
-def _mixed_layer_T_Td(p_q, T_q, Td_q, depth=50*units.hectopascal):
+def _mixed_layer_T_Td(p_q, T_q, Td_q, depth=None):
+    if depth is None:
+        depth = 50 * units.hectopascal
     try:
         res = mpcalc.mixed_layer(p_q, T_q, Td_q, depth=depth)
         if isinstance(res, tuple):
@@ -114,143 +656,246 @@ def _mixed_layer_T_Td(p_q, T_q, Td_q, depth=50*units.hectopascal):
         pass
     return _first_scalar(T_q), _first_scalar(Td_q)
 
-def physics_from_profile(p_hPa, z_m, T_K, Td_K, RH_pct, u_ms, v_ms, MR_gkg):
-    z_m = ensure_monotonic_z(z_m)
+def _cape_cin_metpy(p_q, T_q, Td_q, T_parcel_sb, T_parcel_ml):
+    """Ruta de referencia con mpcalc.cape_cin (SB, ML)."""
+    try:
+        cape_sb, cin_sb = mpcalc.cape_cin(p_q, T_q, Td_q, T_parcel_sb)
+        cape_ml, cin_ml = mpcalc.cape_cin(p_q, T_q, Td_q, T_parcel_ml)
+        return (cape_sb.to('J/kg').m, cin_sb.to('J/kg').m,
+                cape_ml.to('J/kg').m, cin_ml.to('J/kg').m)
+    except Exception:
+        return np.nan, np.nan, np.nan, np.nan
 
+def physics_from_profile(p_hPa, z_m, T_K, Td_K, RH_pct, u_ms, v_ms, MR_gkg,
+                         cape_mode=None, parcel_mode=None):
+    """
+    cape_mode: "fast" (cape_cin_batch) o "metpy"; por defecto CAPE_MODE.
+    parcel_mode: "table" (parcel_profile_batch) u "ode" (mpcalc); por defecto PARCEL_MODE.
+    """
     p_q = (p_hPa * units.hectopascal)
     T_q = (T_K  * units.kelvin)
     Td_q= (Td_K * units.kelvin)
-    if np.allclose(MR_gkg, 0.0):
-        rh01_q = (RH_pct/100.0) * units.dimensionless
-        r_q = mpcalc.mixing_ratio_from_relative_humidity(rh01_q, T_q, p_q)
-    else:
-        r_q = (MR_gkg/1000.0) * units('kg/kg')
-
-    theta   = mpcalc.potential_temperature(p_q, T_q).m
-    theta_v = mpcalc.virtual_potential_temperature(p_q, T_q, r_q).m
-
-    dT_dz     = grad_dz(z_m, T_K, smooth_k=5)
-    Gamma_env = -dT_dz * 1000.0
 
-    T_parcel_sb = mpcalc.parcel_profile(p_q, T_q[0], Td_q[0]).to('kelvin')
-    T_ml0, Td_ml0 = _mixed_layer_T_Td(p_q, T_q, Td_q, depth=50*units.hectopascal)
-    T_parcel_ml = mpcalc.parcel_profile(p_q, T_ml0, Td_ml0).to('kelvin')
-
-    dTp_dz_ml   = grad_dz(z_m, T_parcel_ml.m, smooth_k=5)
-    Gamma_moist = -dTp_dz_ml * 1000.0
+    with timed("parcel"):
+        T_ml0, Td_ml0 = _mixed_layer_T_Td(p_q, T_q, Td_q, depth=50*units.hectopascal)
+        T_ml0, Td_ml0 = T_ml0.m_as('kelvin'), Td_ml0.m_as('kelvin')
+        if (parcel_mode or PARCEL_MODE) == "ode":
+            T_parcels = np.stack([
+                mpcalc.parcel_profile(p_q, T_q[0], Td_q[0]).m_as('kelvin'),
+                mpcalc.parcel_profile(p_q, T_ml0 * units.kelvin, Td_ml0 * units.kelvin).m_as('kelvin'),
+            ])
+        else:
+            T_parcels = parcel_profile_batch(p_hPa, [T_K[0], T_ml0], [Td_K[0], Td_ml0])
+    T_parcel_sb, T_parcel_ml = T_parcels
 
-    try:
-        cape_sb, cin_sb = mpcalc.cape_cin(p_q, T_q, Td_q, T_parcel_sb)
-        cape_ml, cin_ml = mpcalc.cape_cin(p_q, T_q, Td_q, T_parcel_ml)
-        cape_sb = cape_sb.to('J/kg').m; cin_sb = cin_sb.to('J/kg').m
-        cape_ml = cape_ml.to('J/kg').m; cin_ml = cin_ml.to('J/kg').m
-    except Exception:
-        cape_sb = cin_sb = cape_ml = cin_ml = np.nan
+    # z monotónica + todas las derivadas (T, θ, θv, parcela ML) en un solo paso
+    dry = {k: v[0] for k, v in
+           physics_batch(p_hPa, z_m, T_K, RH_pct, MR_gkg, T_parcel_K=T_parcel_ml).items()}
 
-    dtheta_dz = grad_dz(z_m, theta,   smooth_k=5) * 1000.0
-    dthv_dz   = grad_dz(z_m, theta_v, smooth_k=5)
-    N2        = (G / theta_v) * dthv_dz
+    with timed("cape"):
+        if (cape_mode or CAPE_MODE) == "metpy":
+            cape_sb, cin_sb, cape_ml, cin_ml = _cape_cin_metpy(
+                p_q, T_q, Td_q, T_parcel_sb * units.kelvin, T_parcel_ml * units.kelvin)
+        else:
+            cc = cape_cin_batch(p_hPa, T_K, Td_K, T_parcels)
+            (cape_sb, cape_ml), (cin_sb, cin_ml) = cc["cape"], cc["cin"]
 
+    Gamma_env = dry["Gamma_env"]
     return dict(
-        theta=theta, theta_v=theta_v,
-        Gamma_env=Gamma_env, Gamma_moist=Gamma_moist, Gamma_dry=np.full_like(Gamma_env, GAMMA_DRY),
-        dtheta_dz_Kkm=dtheta_dz, N2=N2,
+        theta=dry["theta"], theta_v=dry["theta_v"],
+        Gamma_env=Gamma_env, Gamma_moist=dry["Gamma_moist"], Gamma_dry=np.full_like(Gamma_env, GAMMA_DRY),
+        dtheta_dz_Kkm=dry["dtheta_dz_Kkm"], N2=dry["N2"],
         cape_sb=cape_sb, cin_sb=cin_sb, cape_ml=cape_ml, cin_ml=cin_ml,
-        z=z_m
+        z=dry["z"]
     )
 
+# ---- Etiquetado ----
+def mask_runs(mask):
+    """
+    Corridas contiguas de True sobre el último eje de `mask` (1-D o (N, niveles)).
+    Devuelve (fila, inicio, fin) como arreglos, con fin inclusivo.
+    """
+    m = np.atleast_2d(np.asarray(mask, dtype=bool))
+    edge = np.zeros((m.shape[0], 1), dtype=bool)
+    starts = m & ~np.concatenate([edge, m[:, :-1]], axis=1)
+    ends   = m & ~np.concatenate([m[:, 1:], edge], axis=1)
+    row, start = np.nonzero(starts)
+    _, end = np.nonzero(ends)
+    return row, start, end
+
+def any_run_thicker(mask, z_agl, min_thick):
+    """(N,) bool: alguna corrida de `mask` con espesor z_agl[fin]-z_agl[inicio] >= min_thick."""
+    z_agl = np.atleast_2d(z_agl)
+    row, start, end = mask_runs(mask)
+    thick = z_agl[row, end] - z_agl[row, start]
+    return np.bincount(row[thick >= min_thick], minlength=z_agl.shape[0]) > 0
+
+def means_0_3km(z_agl, Gamma_env, Gamma_moist, N2):
+    """Medias 0-3 km AGL de Gamma_env, Gamma_moist y N2 por sondeo -> tres arreglos (N,)."""
+    z_agl = np.atleast_2d(z_agl)
+    m03 = (z_agl >= 0) & (z_agl <= 3000)
+    mean = lambda a: np.nanmean(np.where(m03, np.atleast_2d(a), np.nan), axis=-1)
+    return mean(Gamma_env), mean(Gamma_moist), mean(N2)
+
+def label_many(z_m, Gamma_env, Gamma_moist, N2, z_sfc=None,
+               cape_sb=np.nan, cin_sb=np.nan, cape_ml=np.nan, cin_ml=np.nan, means=None):
+    """
+    Etiqueta una pila (N, niveles) de una vez; mismas reglas y prioridad que
+    label_from_metrics. CAPE/CIN y z_sfc son escalares o (N,). `means` permite
+    pasar las medias 0-3 km ya calculadas (means_0_3km). Devuelve lista de str.
+    """
+    z_m = _rows(z_m)
+    Gamma_env, Gamma_moist, N2 = _rows(Gamma_env), _rows(Gamma_moist), _rows(N2)
+    z_sfc = z_m[:, 0] if z_sfc is None else np.asarray(z_sfc, dtype=np.float64)
+    z_agl = z_m - np.reshape(z_sfc, (-1, 1))
+    cape_sb, cin_sb, cape_ml, cin_ml = (
+        np.broadcast_to(np.asarray(a, dtype=np.float64), z_m.shape[:1])
+        for a in (cape_sb, cin_sb, cape_ml, cin_ml))
+
+    inversion = any_run_thicker((Gamma_env < 0) & (z_agl <= 500), z_agl, 150)
+    with np.errstate(invalid="ignore"):
+        unstable = (
+            (np.isfinite(cape_ml) & (cape_ml >= 50) & (np.isnan(cin_ml) | (cin_ml > -75)))
+            | (np.isfinite(cape_sb) & (cape_sb >= 100) & (np.isnan(cin_sb) | (cin_sb > -100)))
+            | any_run_thicker((Gamma_env - Gamma_moist) > 0.5, z_agl, 400)
+            | any_run_thicker(N2 < -2e-4, z_agl, 200)
+        )
+    GamE, GamM, N2m = means if means is not None else means_0_3km(z_agl, Gamma_env, Gamma_moist, N2)
+    stable = (GamE < (GamM - 0.3)) & (np.isnan(N2m) | (N2m > 1e-4))
+
+    labels = np.select([inversion, unstable, stable], ["Inversion", "Inestable", "Estable"], "Neutral")
+    return labels.tolist()
+
 def label_from_metrics(z_m, T_K, Gamma_env, Gamma_moist, N2,
                        z_sfc=None, cape_sb=np.nan, cin_sb=np.nan,
-                       cape_ml=np.nan, cin_ml=np.nan):
-    if z_sfc is None: z_sfc = z_m[0]
-    z_agl = z_m - z_sfc
-
-    dT_dz = -Gamma_env/1000.0
-    inv = (dT_dz > 0) & (z_agl <= 500)
-    if np.any(inv):
-        idx = np.where(inv)[0]; s = idx[0]; ok = False
-        for i in range(1, len(idx)):
-            if idx[i] != idx[i-1] + 1:
-                if (z_agl[idx[i-1]] - z_agl[s]) >= 150: ok = True
-                s = idx[i]
-        if (z_agl[idx[-1]] - z_agl[s]) >= 150: ok = True
-        if ok: return "Inversion"
-
-    if (np.isfinite(cape_ml) and cape_ml >= 50 and (np.isnan(cin_ml) or cin_ml > -75)) \
-       or (np.isfinite(cape_sb) and cape_sb >= 100 and (np.isnan(cin_sb) or cin_sb > -100)):
-        return "Inestable"
-
-    diff = (Gamma_env - Gamma_moist) > 0.5
-    if np.any(diff):
-        idx = np.where(diff)[0]; s = idx[0]
-        for i in range(1, len(idx)):
-            if idx[i] != idx[i-1] + 1:
-                if (z_agl[idx[i-1]] - z_agl[s]) >= 400: return "Inestable"
-                s = idx[i]
-        if (z_agl[idx[-1]] - z_agl[s]) >= 400: return "Inestable"
-
-    negN = N2 < -2e-4
-    if np.any(negN):
-        idx = np.where(negN)[0]; s = idx[0]
-        for i in range(1, len(idx)):
-            if idx[i] != idx[i-1] + 1:
-                if (z_agl[idx[i-1]] - z_agl[s]) >= 200: return "Inestable"
-                s = idx[i]
-        if (z_agl[idx[-1]] - z_agl[s]) >= 200: return "Inestable"
+                       cape_ml=np.nan, cin_ml=np.nan, means=None):
+    return label_many(z_m, Gamma_env, Gamma_moist, N2, z_sfc=z_sfc,
+                      cape_sb=cape_sb, cin_sb=cin_sb, cape_ml=cape_ml, cin_ml=cin_ml,
+                      means=means)[0]
 
-    m03 = (z_agl >= 0) & (z_agl <= 3000)
-    GamE = np.nanmean(Gamma_env[m03])
-    GamM = np.nanmean(Gamma_moist[m03])
-    N2m  = np.nanmean(N2[m03])
-    if GamE < (GamM - 0.3) and (np.isnan(N2m) or N2m > 1e-4):
-        return "Estable"
-    return "Neutral"
-
-def build_feature_matrix(p, z, T, Td, RHpct, u, v, phys):
+def build_feature_matrix(p, z, T, Td, RHpct, u, v, phys, dtype=None):
+    """Matriz (niveles x FEATURE_ORDER) en `dtype` (FEATURE_DTYPE: float32 en modo compacto)."""
     RH01 = np.clip(RHpct/100.0, 0, 1)
     X = np.stack([
         p, z, T, Td, RH01, u, v,
         phys["theta"], phys["theta_v"], phys["Gamma_env"],
         phys["dtheta_dz_Kkm"], phys["N2"]
-    ], axis=1).astype(np.float64)
+    ], axis=1).astype(dtype or FEATURE_DTYPE)
     return X
 
-def process_uploaded_tsv(uploaded_file, filename="radiosonde.tsv"):
-    """Procesa un TSV (file-like) y devuelve el dict JSON con resumen, niveles y etiqueta."""
-    df = read_edt_tsv(uploaded_file)
-    p, z, T, Td, RH, u, v, MR = interp_to_levels(df)
-    z = ensure_monotonic_z(z)
-
-    phys = physics_from_profile(p, z, T, Td, RH, u, v, MR)
-    label = label_from_metrics(
-        phys["z"], T, phys["Gamma_env"], phys["Gamma_moist"], phys["N2"], z_sfc=phys["z"][0],
-        cape_sb=phys.get("cape_sb", np.nan), cin_sb=phys.get("cin_sb", np.nan),
-        cape_ml=phys.get("cape_ml", np.nan), cin_ml=phys.get("cin_ml", np.nan)
-    )
-    X = build_feature_matrix(p, z, T, Td, RH, u, v, phys)
+def round_significant(a, digits=None):
+    """Redondea (en float64) a `digits` cifras significativas; NaN, inf y 0 quedan igual."""
+    a = np.asarray(a, dtype=np.float64)
+    digits = digits or SIGNIFICANT_DIGITS
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mag = np.floor(np.log10(np.abs(a)))
+        scale = 10.0 ** (digits - 1 - mag)
+        return np.where(np.isfinite(mag), np.round(a * scale) / scale, a)
 
-    z_agl = z - z[0]; m03 = (z_agl >= 0) & (z_agl <= 3000)
-    summary = {
-        "Gamma_env_0_3km": float(np.nanmean(phys["Gamma_env"][m03])),
-        "Gamma_moist_0_3km": float(np.nanmean(phys["Gamma_moist"][m03])),
-        "N2_mean_0_3km": float(np.nanmean(phys["N2"][m03])),
-        "CAPE_SB": float(phys.get("cape_sb", np.nan)),
-        "CIN_SB": float(phys.get("cin_sb", np.nan)),
-        "CAPE_ML": float(phys.get("cape_ml", np.nan)),
-        "CIN_ML": float(phys.get("cin_ml", np.nan)),
-    }
-    levels = [{k: float(v) for k, v in zip(FEATURE_ORDER, row)} for row in X]
-    # fecha opcional desde nombre
-    date_from_name = ""
+def compact_result(result, digits=None):
+    """
+    Resultado de process_tsv_matrix en modo compacto: X en float32 y X/summary
+    redondeados a `digits` cifras significativas, con "precision" para el cliente.
+    """
+    digits = digits or SIGNIFICANT_DIGITS
+    out = dict(result)
+    out["X"] = round_significant(result["X"], digits).astype(np.float32)
+    out["summary"] = {k: float(round_significant(v, digits)) for k, v in result["summary"].items()}
+    out["precision"] = {"dtype": "float32", "significant_digits": digits}
+    return out
+
+def significant_digits(result):
+    """Cifras significativas de un resultado compacto (compact_result) o None."""
+    return result.get("precision", {}).get("significant_digits")
+
+def matrix_rows(X, digits=None):
+    """X como lista de listas de float; con `digits`, redondeada (JSON corto desde float32)."""
+    X = np.asarray(X, dtype=np.float64)
+    if digits:
+        X = round_significant(X, digits)
+    return X.tolist()
+
+def date_from_filename(filename):
+    """Fecha opcional desde el nombre (MMDDYYYY -> YYYY-MM-DD); "" si no hay."""
     m = re.search(r"(\d{8})", filename)
-    if m:
-        raw = m.group(1); mm, dd, yyyy = raw[:2], raw[2:4], raw[4:]
-        date_from_name = f"{yyyy}-{mm}-{dd}"
+    if not m:
+        return ""
+    raw = m.group(1); mm, dd, yyyy = raw[:2], raw[2:4], raw[4:]
+    return f"{yyyy}-{mm}-{dd}"
+
+def levels_from_matrix(X, digits=None):
+    """Filas de X como lista de dicts {FEATURE_ORDER[i]: valor} (formato JSON por defecto)."""
+    return [dict(zip(FEATURE_ORDER, row)) for row in matrix_rows(X, digits)]
+
+def matrix_from_levels(levels):
+    """Inversa de levels_from_matrix (en FEATURE_DTYPE)."""
+    return np.array([[lvl[k] for k in FEATURE_ORDER] for lvl in levels], dtype=FEATURE_DTYPE)
+
+def process_uploaded_tsv(uploaded_file, filename="radiosonde.tsv", digits=None):
+    """
+    Procesa un TSV (file-like) y devuelve el dict JSON con resumen, niveles y etiqueta.
+    Con `digits` (o en modo compacto) los valores salen redondeados, ver compact_result.
+    """
+    result = process_tsv_matrix(uploaded_file, filename=filename)
+    digits = digits or (SIGNIFICANT_DIGITS if COMPACT else None)
+    if digits:
+        result = compact_result(result, digits)
+    result["levels"] = levels_from_matrix(result.pop("X"), digits)
+    return result
+
+def process_tsv_matrix(uploaded_file, filename="radiosonde.tsv", grid=None):
+    """
+    Como process_uploaded_tsv, pero los niveles quedan como matriz "X"
+    (niveles x FEATURE_ORDER). `grid`: especificación de rejilla (DEFAULT_GRID si None).
+    """
+    with timed("read"):
+        df = read_edt_tsv(uploaded_file)
+    with timed("interp"):
+        levels = interp_to_grid(df, grid)
+    return _process_levels(levels, filename)
+
+def process_tsv_grids(uploaded_file, grids, filename="radiosonde.tsv"):
+    """{spec: resultado de process_tsv_matrix} para varias rejillas, parseando el TSV una vez."""
+    with timed("read"):
+        df = read_edt_tsv(uploaded_file)
+    with timed("interp"):
+        per_grid = interp_to_grids(df, grids)
+    return {g: _process_levels(levels, filename) for g, levels in per_grid.items()}
+
+def _process_levels(levels, filename):
+    p, z, T, Td, RH, u, v, MR = levels
+    with timed("physics"):
+        phys = physics_from_profile(p, z, T, Td, RH, u, v, MR)   # corrige z una sola vez
+    z = phys["z"]
+    with timed("label"):
+        means = means_0_3km(phys["z"] - phys["z"][0], phys["Gamma_env"], phys["Gamma_moist"], phys["N2"])
+        label = label_from_metrics(
+            phys["z"], T, phys["Gamma_env"], phys["Gamma_moist"], phys["N2"], z_sfc=phys["z"][0],
+            cape_sb=phys.get("cape_sb", np.nan), cin_sb=phys.get("cin_sb", np.nan),
+            cape_ml=phys.get("cape_ml", np.nan), cin_ml=phys.get("cin_ml", np.nan),
+            means=means,
+        )
+    LABELS.inc(label)
+    with timed("feature_matrix"):
+        X = build_feature_matrix(p, z, T, Td, RH, u, v, phys)
 
     return {
         "file": filename,
-        "date": date_from_name,
+        "date": date_from_filename(filename),
         "label": label,
-        "summary": summary,
-        "levels": levels
+        "summary": summary_from_metrics(means, phys),
+        "X": X,
+    }
+
+def summary_from_metrics(means, phys):
+    """Dict "summary" de la respuesta: medias 0-3 km (means_0_3km) y CAPE/CIN SB y ML."""
+    GamE, GamM, N2m = (float(m[0]) for m in means)
+    return {
+        "Gamma_env_0_3km": GamE,
+        "Gamma_moist_0_3km": GamM,
+        "N2_mean_0_3km": N2m,
+        "CAPE_SB": float(phys.get("cape_sb", np.nan)),
+        "CIN_SB": float(phys.get("cin_sb", np.nan)),
+        "CAPE_ML": float(phys.get("cape_ml", np.nan)),
+        "CIN_ML": float(phys.get("cin_ml", np.nan)),
     }
@@ -0,0 +1,328 @@
+"""
+Procesamiento incremental de un sondeo mientras el globo sube: el cliente abre
+una sesión y va enviando el EDT por pedazos (POST /feature/sessions/<id>/).
+
+Cada pedazo solo parsea sus líneas nuevas. Un nivel de la rejilla queda
+"cubierto" cuando llega una fila con P <= p_nivel; entonces se interpola (una
+vez) con las filas retenidas cerca del tope, y las derivadas se recalculan
+solo en los últimos niveles (los que tocan el borde del suavizado, ver
+_RECOMPUTE). La parcela ML se fija cuando hay 50 hPa cubiertos; desde ahí
+la parcela de cada nivel nuevo sale sola (parcel_profile_batch es por nivel).
+CAPE/CIN, etiqueta y resumen (sobre los <= 27 niveles cubiertos) se rehacen
+solo si se cubrieron niveles nuevos; si no, se reemite lo anterior.
+
+El estado (filas del tramo superior, niveles y física) tiene tamaño acotado,
+así que el costo por pedazo no crece con la altura y la sesión se guarda
+serializada en su propia caché (RADIOSONDE_SESSION_CACHE, sin descarte por
+MAX_ENTRIES) entre peticiones. Los pedazos se numeran desde 0 (`seq`): cada
+petición toma un lock por sesión (add atómico en esa caché) y un pedazo con
+otro número que el esperado, o mientras otra petición tiene el lock, se
+rechaza con SessionConflict.
+
+Al cerrar, los niveles por encima del último dato se completan como en
+process_tsv_matrix (valor de la fila de menor presión) y el resultado coincide
+con procesar el archivo completo si la presión desciende de forma monótona.
+La parcela se asciende siempre con la tabla (PARCEL_MODE="table") y CAPE/CIN
+con cape_cin_batch.
+"""
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+
+from .metrics import LABELS, timed
+from .rs_core import (
+    HEADER_LINE_IDX, HEADER_SCAN_LINES, RENAME_MAP, Grid, _INTERP_FIELDS, _is_header, _mixed_layer_T_Td,
+    apply_weights, build_feature_matrix, cape_cin_batch, date_from_filename, interp_weights,
+    label_from_metrics, means_0_3km, parcel_profile_batch, parse_grid, physics_batch,
+    summary_from_metrics, units,
+)
+
+SMOOTH_K = 5
+# Niveles cuyo d/dz cambia al agregar niveles encima: el gradiente centrado usa
+# el nivel vecino y la media móvil k//2 más (con borde replicado en el tope)
+_RECOMPUTE = SMOOTH_K // 2 + 1
+ML_DEPTH_HPA = 50.0
+_PHYS_FIELDS = ("theta", "theta_v", "Gamma_env", "Gamma_moist", "dtheta_dz_Kkm", "N2")
+_COLUMNS = ("P",) + tuple(name for name, _ in _INTERP_FIELDS)   # P, Z, T, TD, RH, u, v, MR
+LOCK_SECONDS = 30          # tope de un lock si la petición que lo tiene muere
+
+
+class SessionError(ValueError):
+    """Datos o rejilla inválidos para una sesión incremental."""
+
+
+class SessionConflict(Exception):
+    """Pedazo fuera de orden o sesión ocupada por otra petición. `seq`: el pedazo esperado."""
+
+    def __init__(self, message, seq=None):
+        super().__init__(message)
+        self.seq = seq
+
+
+class SoundingSession:
+    """Sondeo en curso sobre una rejilla de presión (p o logp)."""
+
+    def __init__(self, filename="radiosonde.tsv", grid=None):
+        grid = grid if isinstance(grid, Grid) else parse_grid(grid)
+        if grid.kind == "z":
+            raise SessionError("las sesiones incrementales solo admiten rejillas de presión (p, logp)")
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.grid = grid.spec
+        self.p = np.array(grid.levels, dtype=np.float64)    # descendente
+        L = self.p.size
+        self.seq = 0                               # pedazos aceptados
+        self.rows = 0
+        self.k = 0                                 # niveles cubiertos: p[:k]
+        self.closed = False
+        self._pending = b""                        # línea incompleta del último pedazo
+        self._preamble = []                        # líneas antes de encontrar la cabecera
+        self._cols = None                          # índice de cada columna de _COLUMNS (o None)
+        self._tail = np.empty((0, len(_COLUMNS)))  # filas que aún pueden rodear niveles nuevos
+        self._p_min = np.inf
+        self.levels = np.full((len(_INTERP_FIELDS), L), np.nan)   # Z, T, TD, RH, u, v, MR
+        self.z = np.full(L, np.nan)                # z monotónica (ensure_monotonic_z)
+        self._z_run = -np.inf                      # max_{j<k}(z[j] - j)
+        self.T_parcels = np.full((2, L), np.nan)   # SB, ML
+        self._ml_start = None                      # (T, Td) de la capa de mezcla
+        self._ml_fixed = False
+        self._use_rh = None
+        self.phys = {name: np.full(L, np.nan) for name in _PHYS_FIELDS}
+        self.label, self.summary = None, None
+
+    # ---- Lectura por pedazos ----
+    def _lines(self, chunk, final=False):
+        data = self._pending + chunk
+        lines = data.split(b"\n")
+        self._pending = b"" if final else lines.pop()
+        return [line.decode("utf-8", errors="replace").rstrip("\r") for line in lines]
+
+    def _header_from(self, line):
+        names = [t.strip() for t in line.split("\t")]
+        lower = {}
+        for i, name in enumerate(names):
+            lower.setdefault(name.lower(), i)
+        by_dst = {}
+        for src, dst in RENAME_MAP.items():
+            i = names.index(src) if src in names else lower.get(src.lower())
+            if i is not None:
+                by_dst[dst] = i
+        self._cols = [by_dst.get(name) for name in _COLUMNS]
+
+    def _data_lines(self, lines, final=False):
+        """Consume el preámbulo y la cabecera; devuelve solo líneas de datos."""
+        if self._cols is not None:
+            return lines
+        for i, line in enumerate(lines):
+            if _is_header(line):
+                self._header_from(line)
+                self._preamble = []
+                return lines[i + 1:]
+            self._preamble.append(line)
+            if len(self._preamble) >= HEADER_SCAN_LINES:
+                return self._fixed_header(lines[i + 1:])
+        if final and len(self._preamble) > HEADER_LINE_IDX:
+            return self._fixed_header([])
+        return []
+
+    def _fixed_header(self, rest):
+        # Sin cabecera reconocible: misma posición fija que read_edt_tsv
+        seen, self._preamble = self._preamble, []
+        self._header_from(seen[HEADER_LINE_IDX])
+        return seen[HEADER_LINE_IDX + 1:] + rest
+
+    def _parse(self, lines):
+        fills = (np.nan,) + tuple(np.nan if fill is None else fill for _, fill in _INTERP_FIELDS)
+        out = []
+        for line in lines:
+            if not line.strip():
+                continue
+            tokens = line.split("\t")
+            row = []
+            for idx, fill in zip(self._cols, fills):
+                if idx is None:
+                    row.append(fill)
+                    continue
+                tok = tokens[idx].strip() if idx < len(tokens) else ""
+                try:
+                    row.append(float(tok) if tok else np.nan)
+                except ValueError:
+                    raise SessionError(f"valor no numérico en la fila {self.rows + len(out) + 1}: '{tok}'")
+            out.append(row)
+        rows = np.array(out, dtype=np.float64).reshape(-1, len(_COLUMNS))
+        return rows[~np.isnan(rows[:, 0])]
+
+    # ---- Actualización ----
+    def append(self, chunk, final=False, seq=None):
+        """
+        Agrega un pedazo (bytes) del EDT. Devuelve el estado con los niveles que
+        cambiaron (X desde `first_level`), etiqueta y resumen provisionales, y
+        el próximo `seq`. Con `seq` distinto de self.seq lanza SessionConflict.
+        """
+        if self.closed:
+            raise SessionError("la sesión ya está cerrada")
+        if seq is not None and seq != self.seq:
+            raise SessionConflict(f"pedazo fuera de orden: se esperaba {self.seq}, llegó {seq}", seq=self.seq)
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        with timed("session"):
+            rows = self._parse(self._data_lines(self._lines(chunk, final), final))
+            self.rows += len(rows)
+            start = self.k
+            if len(rows):
+                self._tail = np.concatenate([self._tail, rows])
+                self._p_min = min(self._p_min, rows[:, 0].min())
+            if self.rows >= 2:
+                covered = int(np.count_nonzero(self.p >= self._p_min))
+                if final:
+                    covered = self.p.size    # sobre el último dato: valor de la fila de menor presión
+                if covered > self.k and covered >= 2:   # d/dz necesita dos niveles
+                    start = self._cover(covered)
+            self.seq += 1
+            return self._update(start)
+
+    def close(self):
+        """Procesa lo pendiente y completa la rejilla; devuelve el dict de process_tsv_matrix."""
+        self.append(b"", final=True)
+        if self.rows < 2:
+            raise SessionError("el sondeo necesita al menos 2 niveles")
+        self.closed = True
+        LABELS.inc(self.label)
+        return {
+            "file": self.filename,
+            "date": date_from_filename(self.filename),
+            "label": self.label,
+            "summary": self.summary,
+            "X": self._matrix(0),
+        }
+
+    def _cover(self, k):
+        """Interpola y procesa los niveles p[self.k:k]; devuelve el primer nivel que cambió."""
+        k0 = self.k
+        tail = self._tail[np.argsort(self._tail[:, 0], kind="stable")]
+        x = self.p[k0:k][::-1]
+        if parse_grid(self.grid).kind == "logp":
+            i, w = interp_weights(np.log(tail[:, 0]), np.log(x))
+        else:
+            i, w = interp_weights(tail[:, 0], x)
+        self.levels[:, k0:k] = apply_weights(list(tail[:, 1:].T), i, w)[:, ::-1]
+        # Los niveles siguientes quedan por debajo de p[k-1]: basta con esas filas
+        # más la inmediatamente superior
+        keep = tail[:, 0] <= self.p[k - 1]
+        above = np.flatnonzero(~keep)
+        if above.size:
+            keep[above[0]] = True
+        self._tail = tail[keep]
+
+        Z = self.levels[0]
+        for j in range(k0, k):
+            self._z_run = max(self._z_run, Z[j] - j)
+            self.z[j] = self._z_run + j
+        self.k = k
+
+        use_rh = bool(np.all(np.abs(self.levels[6, :k]) <= 1e-8))
+        start = max(0, k0 - _RECOMPUTE)
+        if use_rh != self._use_rh:
+            self._use_rh, start = use_rh, 0
+        if self._update_parcels(k0, k):
+            start = 0
+        self._update_physics(start, k)
+        return start
+
+    def _update_parcels(self, k0, k):
+        """Parcelas SB y ML en los niveles nuevos. True si cambió el arranque ML (todo se rehace)."""
+        _, T, Td = self.levels[:3]
+        changed = False
+        if not self._ml_fixed:
+            p_q = self.p[:k] * units.hectopascal
+            T_ml, Td_ml = _mixed_layer_T_Td(p_q, T[:k] * units.kelvin, Td[:k] * units.kelvin,
+                                            depth=ML_DEPTH_HPA * units.hectopascal)
+            self._ml_start = (T_ml.m_as("kelvin"), Td_ml.m_as("kelvin"))
+            # Con el tope de la capa ya cubierto el promedio no cambia más
+            self._ml_fixed = self.p[k - 1] <= self.p[0] - ML_DEPTH_HPA
+            changed, k0 = True, 0
+        p = np.concatenate([self.p[:1], self.p[k0:k]])
+        T_ml, Td_ml = self._ml_start
+        self.T_parcels[:, k0:k] = parcel_profile_batch(p, [T[0], T_ml], [Td[0], Td_ml])[:, 1:]
+        return changed
+
+    def _update_physics(self, start, k):
+        # Ventana con _RECOMPUTE niveles de contexto por debajo de `start`
+        w0 = max(0, start - _RECOMPUTE)
+        sl = slice(w0, k)
+        _, T, _, RH, _, _, MR = self.levels
+        out = physics_batch(self.p[sl], self.z[sl], T[sl], RH[sl], MR[sl], smooth_k=SMOOTH_K,
+                            T_parcel_K=self.T_parcels[1, sl], use_rh=self._use_rh)
+        for name in _PHYS_FIELDS:
+            self.phys[name][start:k] = out[name][0, start - w0:]
+
+        # CAPE/CIN y etiqueta sobre todo lo cubierto (<= niveles de la rejilla)
+        p, T, Td = self.p[:k], T[:k], self.levels[2, :k]
+        cc = cape_cin_batch(p, T, Td, self.T_parcels[:, :k])
+        (cape_sb, cape_ml), (cin_sb, cin_ml) = cc["cape"], cc["cin"]
+        phys = {name: v[:k] for name, v in self.phys.items()}
+        phys.update(cape_sb=cape_sb, cin_sb=cin_sb, cape_ml=cape_ml, cin_ml=cin_ml)
+        z = self.z[:k]
+        means = means_0_3km(z - z[0], phys["Gamma_env"], phys["Gamma_moist"], phys["N2"])
+        self.label = label_from_metrics(z, T, phys["Gamma_env"], phys["Gamma_moist"], phys["N2"],
+                                        z_sfc=z[0], cape_sb=cape_sb, cin_sb=cin_sb,
+                                        cape_ml=cape_ml, cin_ml=cin_ml, means=means)
+        self.summary = summary_from_metrics(means, phys)
+
+    def _matrix(self, start):
+        k = self.k
+        _, T, Td, RH, u, v, _ = self.levels[:, start:k]
+        phys = {name: v[start:k] for name, v in self.phys.items()}
+        return build_feature_matrix(self.p[start:k], self.z[start:k], T, Td, RH, u, v, phys)
+
+    def _update(self, start):
+        return {
+            "session": self.id,
+            "seq": self.seq,
+            "file": self.filename,
+            "grid": self.grid,
+            "rows": self.rows,
+            "levels_covered": self.k,
+            "levels_total": int(self.p.size),
+            "label": self.label,
+            "summary": self.summary,
+            "first_level": start,
+            "X": self._matrix(start),
+        }
+
+
+# ---- Almacenamiento entre peticiones ----
+def _cache():
+    return caches[getattr(settings, "RADIOSONDE_SESSION_CACHE", "radiosonde_sessions")]
+
+def _key(session_id):
+    return f"rs:session:{session_id}"
+
+def save_session(session):
+    _cache().set(_key(session.id), session, timeout=getattr(settings, "RADIOSONDE_SESSION_TTL", 3600))
+
+def load_session(session_id):
+    """La sesión abierta o None (no existe o expiró)."""
+    return _cache().get(_key(session_id))
+
+def delete_session(session_id):
+    _cache().delete(_key(session_id))
+
+@contextmanager
+def locked_session(session_id):
+    """
+    La sesión guardada (o None), con el lock de la sesión tomado hasta salir del
+    bloque. SessionConflict si otra petición lo tiene.
+    """
+    cache, lock, token = _cache(), _key(session_id) + ":lock", uuid.uuid4().hex
+    if not cache.add(lock, token, timeout=LOCK_SECONDS):
+        raise SessionConflict("otro pedazo de esta sesión se está procesando")
+    try:
+        yield load_session(session_id)
+    finally:
+        # Si el lock expiró (pedazo de más de LOCK_SECONDS) puede ser ya de otra petición
+        if cache.get(lock) == token:
+            cache.delete(lock)
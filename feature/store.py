@@ -0,0 +1,109 @@
+"""
+Persistencia de sondeos procesados fuera del camino de la petición: los
+resultados se encolan y un hilo los inserta por lotes con bulk_create y/o los
+agrega al archivo de features (archive.py).
+"""
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .archive import get_archive
+
+logger = logging.getLogger(__name__)
+
+
+class SoundingWriter:
+    """
+    Hilo escritor: junta hasta `batch_size` sondeos (o lo que llegue en
+    `flush_interval` s) y los inserta en una sola consulta. Si la cola está
+    llena el sondeo se descarta con un warning: nunca bloquea la petición.
+    """
+    def __init__(self, batch_size=200, flush_interval=1.0, max_queue=10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, result, key):
+        """Encola el dict de process_tsv_matrix (con "X") para guardarlo."""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((result, key))
+        except queue.Full:
+            logger.warning("Cola de persistencia llena; se descarta %s", result.get("file"))
+
+    def flush(self):
+        """Espera a que todo lo encolado hasta ahora quede escrito (tests, apagado)."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="sounding-writer", daemon=True)
+                    self._thread.start()
+
+    def _drain(self):
+        items = [self._queue.get()]
+        while len(items) < self.batch_size:
+            try:
+                items.append(self._queue.get(timeout=self.flush_interval))
+            except queue.Empty:
+                break
+        return items
+
+    def _run(self):
+        while True:
+            items = self._drain()
+            try:
+                _to_database(items, batch_size=self.batch_size)
+            except Exception:
+                logger.exception("No se pudieron guardar %d sondeos", len(items))
+            finally:
+                close_old_connections()
+            try:
+                _to_archive(items)
+            except Exception:
+                logger.exception("No se pudieron archivar %d sondeos", len(items))
+            finally:
+                for _ in items:
+                    self._queue.task_done()
+
+
+def write_soundings(items, batch_size=200):
+    """Inserta [(resultado, key), ...]; los ya guardados (misma key) se ignoran."""
+    from .models import Radiosondeo
+    rows = [Radiosondeo.from_result(result, key) for result, key in items]
+    Radiosondeo.objects.bulk_create(rows, batch_size=batch_size, ignore_conflicts=True)
+
+def _to_database(items, batch_size=200):
+    if getattr(settings, "RADIOSONDE_STORE_RESULTS", False):
+        write_soundings(items, batch_size=batch_size)
+
+def _to_archive(items):
+    if getattr(settings, "RADIOSONDE_ARCHIVE_RESULTS", False):
+        get_archive().append(items)
+
+def persist_results(items, batch_size=200):
+    """
+    Guarda [(resultado, key), ...] ya mismo (sin el hilo escritor), con los
+    mismos destinos y flags que store_result: BD y/o archivo de features.
+    """
+    _to_database(items, batch_size=batch_size)
+    _to_archive(items)
+
+
+writer = SoundingWriter(
+    batch_size=getattr(settings, "RADIOSONDE_STORE_BATCH", 200),
+    flush_interval=getattr(settings, "RADIOSONDE_STORE_FLUSH_SECONDS", 1.0),
+)
+
+def store_result(result, key):
+    """Guarda el sondeo en segundo plano (RADIOSONDE_STORE_RESULTS / RADIOSONDE_ARCHIVE_RESULTS)."""
+    if getattr(settings, "RADIOSONDE_STORE_RESULTS", False) or getattr(settings, "RADIOSONDE_ARCHIVE_RESULTS", False):
+        writer.submit(result, key)
@@ -0,0 +1,87 @@
+"""
+Sondeos sintéticos para pruebas y benchmarks: atmósfera estándar con
+inversiones, capas inestables y ruido, sobre la rejilla P_LEVELS o como
+archivos EDT TSV completos (edt_texts / write_edt_files).
+"""
+import io
+import os
+
+import numpy as np
+
+from .rs_core import EPSILON, P_LEVELS, saturation_vapor_pressure_pa
+
+def synthetic_profiles(n=100, seed=0, p_hPa=P_LEVELS):
+    """
+    Devuelve (z, T, Td) como arreglos (n, niveles) en m, K, K.
+    Mezcla perfiles estables, con inversión de superficie y con capas húmedas
+    e inestables, para cubrir las ramas de LFC/EL y de etiquetado.
+    """
+    rng = np.random.default_rng(seed)
+    p = np.asarray(p_hPa, dtype=float)
+    z_sfc = rng.uniform(3500.0, 4100.0, (n, 1))
+    z = z_sfc + 7400.0 * np.log(p[0] / p)[None, :]
+    z_agl = z - z_sfc
+
+    T_sfc = rng.uniform(275.0, 305.0, (n, 1))
+    lapse = rng.uniform(4.0, 9.5, (n, 1)) / 1000.0
+    T = T_sfc - lapse * z_agl
+
+    # Inversiones de superficie (perfil más frío abajo en los primeros ~500 m)
+    inv = rng.random((n, 1)) < 0.3
+    T -= inv * rng.uniform(1.0, 6.0, (n, 1)) * np.clip(1.0 - z_agl / 500.0, 0.0, None)
+    # Capas cálidas elevadas (inversiones en altura)
+    base = rng.uniform(500.0, 4000.0, (n, 1))
+    warm = rng.random((n, 1)) < 0.4
+    T += warm * rng.uniform(0.0, 5.0, (n, 1)) * ((z_agl > base) & (z_agl < base + 600.0))
+    # Tropopausa
+    T = np.maximum(T, rng.uniform(200.0, 215.0, (n, 1)))
+    T += rng.normal(0.0, 0.3, T.shape)
+
+    depression = rng.uniform(0.5, 25.0, (n, 1)) + rng.normal(0.0, 2.0, T.shape) \
+        + z_agl / 1000.0 * rng.uniform(0.0, 3.0, (n, 1))
+    Td = T - np.clip(depression, 0.1, 60.0)
+    return z, T, Td
+
+EDT_COLUMNS = ["Elapsed time", "TimeUTC", "P", "T", "RH", "v", "u", "Height", "TD", "MR", "DD", "FF"]
+ASCENT_RATE = 5.0   # m/s
+
+def edt_texts(count=10, rows=2000, seed=0, p_top=20.0, preamble=45):
+    """
+    Genera `count` textos EDT TSV (preámbulo + cabecera + `rows` filas desde
+    superficie hasta p_top hPa), con los mismos perfiles que synthetic_profiles
+    más viento (paseo aleatorio) y RH/MR coherentes con T y Td.
+    """
+    rng = np.random.default_rng(seed)
+    p = np.geomspace(rng.uniform(640.0, 660.0), p_top, rows)
+    z, T, Td = synthetic_profiles(count, seed=seed, p_hPa=p)
+    e, es = saturation_vapor_pressure_pa(Td), saturation_vapor_pressure_pa(T)
+    RH = np.clip(100.0 * e / es, 0.0, 100.0)
+    MR = 1000.0 * EPSILON * e / (p * 100.0 - e)
+    u = np.cumsum(rng.normal(0.0, 0.15, (count, rows)), axis=1) + rng.uniform(-5, 5, (count, 1))
+    v = np.cumsum(rng.normal(0.0, 0.15, (count, rows)), axis=1) + rng.uniform(-5, 5, (count, 1))
+    FF = np.hypot(u, v)
+    DD = (270.0 - np.degrees(np.arctan2(v, u))) % 360.0
+    t = (z - z[:, :1]) / ASCENT_RATE
+    header = "\n".join(f"Preamble line {i}\tvalue {i}" for i in range(preamble))
+    for n in range(count):
+        secs = t[n].astype(int)
+        clock = [f"12:{(s // 60) % 60:02d}:{s % 60:02d}" for s in secs]
+        num = np.column_stack([p, T[n], RH[n], v[n], u[n], z[n], Td[n], MR[n], DD[n], FF[n]])
+        buf = io.StringIO()
+        np.savetxt(buf, num, fmt=["%.2f", "%.2f", "%.1f", "%.2f", "%.2f", "%.1f", "%.2f", "%.3f", "%.0f", "%.1f"],
+                   delimiter="\t")
+        body = ["\t".join((f"{t[n, i]:.0f}", clock[i], line))
+                for i, line in enumerate(buf.getvalue().splitlines())]
+        yield "\n".join([header, "\t".join(EDT_COLUMNS), *body]) + "\n"
+
+def write_edt_files(directory, count=10, rows=2000, seed=0):
+    """Escribe edt_MMDDYYYY_<n>.tsv en `directory`; devuelve las rutas."""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for n, text in enumerate(edt_texts(count, rows=rows, seed=seed)):
+        day = 1 + n % 28
+        path = os.path.join(directory, f"edt_01{day:02d}2025_{n:04d}.tsv")
+        with open(path, "w", encoding="utf-8") as fh:
+            fh.write(text)
+        paths.append(path)
+    return paths
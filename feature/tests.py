@@ -1,3 +1,1165 @@
-from django.test import TestCase
+import datetime
+import json
+import os
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+import zipfile
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+import msgpack
+from asgiref.sync import async_to_sync
+import numpy as np
+import pandas as pd
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import AsyncRequestFactory, SimpleTestCase, override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from . import llm_groq, rs_core
+from .cache import narrative_cache, result_cache
+from .fake_llm import FakeLLMServer
+from .archive import FeatureArchive
+from .models import Radiosondeo
+from .query import build_queryset, decode_cursor, encode_cursor
+from .store import SoundingWriter
+from .synthetic import edt_texts, synthetic_profiles
+from .batch import ProcessingQueue, QueueFull
+from .session import SoundingSession, locked_session
+from .benchmarks import bench_stages
+from .views import (RadiosondeProcessView, RadiosondeProcessAsyncView, RadiosondeBatchView, RadiosondeQueryView,
+                    SoundingSessionView)
+
+
+def _edt_text(n=400, preamble=45, seed=0):
+    """TSV con formato EDT: preámbulo, cabecera y filas desde superficie (~650 hPa)."""
+    rng = np.random.default_rng(seed)
+    z = np.linspace(3800.0, 17000.0, n)
+    p = 650.0 * np.exp(-(z - 3800.0) / 7400.0)
+    T = 288.0 - 6.5e-3 * z + rng.normal(0, 0.1, n)
+    Td = T - 8.0
+    rows = ["Elapsed time\tTimeUTC\tP\tT\tRH\tv\tu\tHeight\tTD\tMR\tDD\tFF"]
+    for i in range(n):
+        rows.append("\t".join([
+            str(i), f"12:{i // 60:02d}:{i % 60:02d}", f"{p[i]:.2f}", f"{T[i]:.2f}", "55.0",
+            "1.5", "-2.0", f"{z[i]:.1f}", f"{Td[i]:.2f}", "4.5", "120", "2.5",
+        ]))
+    lines = [f"Preamble line {i}\tvalue {i}" for i in range(preamble)] + rows
+    return "\n".join(lines) + "\n"
+
+
+def _legacy_read_edt_tsv(text):
+    """Lector original (motor python, cabecera fija, astype por columna)."""
+    df = pd.read_csv(StringIO(text), sep="\t", skiprows=rs_core.HEADER_LINE_IDX, engine="python")
+    df.columns = df.columns.str.strip()
+    selected = {c: rs_core.RENAME_MAP[c] for c in rs_core.RENAME_MAP if c in df.columns}
+    df = df[list(selected.keys())].rename(columns=selected)
+    for c in df.columns:
+        df[c] = df[c].astype(float)
+    return df.sort_values("P").reset_index(drop=True)
+
+
+class ReadEdtTsvTests(SimpleTestCase):
+    def test_matches_legacy_reader(self):
+        text = _edt_text()
+        expected = _legacy_read_edt_tsv(text)
+        got = rs_core.read_edt_tsv(BytesIO(text.encode("utf-8")))
+        pd.testing.assert_frame_equal(got, expected)
+
+    def test_detects_header_with_other_preamble_length(self):
+        expected = rs_core.read_edt_tsv(BytesIO(_edt_text(preamble=45).encode()))
+        for preamble in (0, 12, 80):
+            got = rs_core.read_edt_tsv(BytesIO(_edt_text(preamble=preamble).encode()))
+            pd.testing.assert_frame_equal(got, expected)
+
+    def test_reads_from_path(self):
+        text = _edt_text(preamble=30)
+        with tempfile.NamedTemporaryFile("w", suffix=".tsv", delete=False) as fh:
+            fh.write(text)
+        try:
+            got = rs_core.read_edt_tsv(fh.name)
+        finally:
+            os.unlink(fh.name)
+        self.assertEqual(list(got.columns), list(rs_core.RENAME_MAP.values()))
+        self.assertTrue((got.dtypes == np.float64).all())
+        self.assertTrue(np.all(np.diff(got["P"].to_numpy()) >= 0))
+
+    def test_streams_non_seekable_source_in_small_chunks(self):
+        text = _edt_text().replace("Preamble", "Preámbulo")   # multibyte entre bloques
+        expected = rs_core.read_edt_tsv(BytesIO(text.encode("utf-8")))
+
+        class _Pipe:
+            def __init__(self, data):
+                self._buf = BytesIO(data)
+
+            def read(self, n=-1):
+                return self._buf.read(n)
+
+        stream = rs_core._TextStream(_Pipe(text.encode("utf-8")), chunk_size=7)
+        rs_core._skip_to_header(stream)
+        got = rs_core._select_columns(rs_core._read_table(stream)).sort_values("P", ignore_index=True)
+        pd.testing.assert_frame_equal(got, expected)
+
+
+class LazyImportTests(SimpleTestCase):
+    def test_django_setup_and_urlconf_skip_heavy_imports(self):
+        code = (
+            "import sys, django; django.setup();"
+            "from django.urls import get_resolver; get_resolver().url_patterns;"
+            "print(','.join(m for m in ('pandas', 'metpy', 'scipy.special', 'groq') if m in sys.modules))"
+        )
+        # Incluso con la precarga activada: solo la hacen wsgi.py/asgi.py, no django.setup()
+        from django.conf import settings
+        env = {**os.environ, "DJANGO_SETTINGS_MODULE": "radiosonde.settings", "RADIOSONDE_PRELOAD": "true"}
+        # Lo que settings.py exige del entorno/.env, con los valores de este proceso
+        for name in ("SECRET_KEY", "EMAIL_HOST_USER", "EMAIL_HOST_PASSWORD"):
+            env.setdefault(name, getattr(settings, name) or "test")
+        env.setdefault("DBNAME", settings.DATABASES["default"]["NAME"] or "test")
+        out = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+        self.assertEqual(out.stdout.strip(), "")
+
+    def test_server_entrypoints_preload_when_enabled(self):
+        import importlib
+        from . import lazy
+        for module in ("radiosonde.wsgi", "radiosonde.asgi"):
+            for enabled in (True, False):
+                sys.modules.pop(module, None)
+                with override_settings(RADIOSONDE_PRELOAD=enabled), mock.patch.object(lazy, "preload") as preload:
+                    importlib.import_module(module)
+                self.assertEqual(preload.called, enabled, module)
+
+    def test_lazy_module_forwards_attributes_and_calls(self):
+        self.assertEqual(rs_core.units.kelvin, rs_core.units._load().kelvin)
+        self.assertAlmostEqual(float(rs_core.lambertw(0.0).real), 0.0)
+
+
+class GridTests(SimpleTestCase):
+    def setUp(self):
+        self.df = rs_core.read_edt_tsv(StringIO(_edt_text(n=1500, seed=3)))
+        self.p = self.df["P"].to_numpy()
+
+    def _np_interp(self, x_src, x_tgt):
+        return [np.interp(x_tgt, x_src, self.df[c].to_numpy()) for c in ("Z", "T", "TD", "RH", "u", "v", "MR")]
+
+    def test_default_grid_matches_np_interp(self):
+        self.assertEqual(rs_core.parse_grid().levels.tolist(), rs_core.P_LEVELS.tolist())
+        out = rs_core.interp_to_levels(self.df)
+        ref = [x[::-1] for x in self._np_interp(self.p, rs_core.P_LEVELS_ASC)]
+        np.testing.assert_array_equal(out[0], rs_core.P_LEVELS)
+        for a, b in zip(out[1:], ref):
+            np.testing.assert_allclose(a, b, rtol=0, atol=1e-9)
+
+    def test_logp_and_height_grids(self):
+        g = rs_core.parse_grid("logp:700:100:30")
+        out = rs_core.interp_to_grid(self.df, g)
+        ref = self._np_interp(np.log(self.p), np.log(g.levels[::-1]))
+        for a, b in zip(out[1:], ref):
+            np.testing.assert_allclose(a, b[::-1], rtol=0, atol=1e-9)   # fuera de rango: constante
+
+        z = rs_core.interp_to_grid(self.df, "z:0:9000:500")
+        z_sfc = self.df["Z"].to_numpy()[-1]   # df ordenado por P ascendente: superficie al final
+        np.testing.assert_allclose(z[1], z_sfc + np.arange(0, 9001, 500.0))
+        self.assertTrue(np.all(np.diff(z[0]) < 0))   # p decrece con la altura
+
+        multi = rs_core.interp_to_grids(self.df, ["p:620:100:20", "z:0:9000:500"])
+        np.testing.assert_array_equal(multi["z:0:9000:500"][2], z[2])
+        self.assertIs(rs_core.parse_grid("z:0:9000:500"), rs_core.parse_grid("z:0:9000:500"))
+        for bad in ("q:1:2:3", "p:100:620:20", "z:0:10", "logp:a:b:c"):
+            with self.assertRaises(ValueError):
+                rs_core.parse_grid(bad)
+
+
+class SyntheticEdtTests(SimpleTestCase):
+    def test_generated_files_parse_and_benchmark(self):
+        texts = list(edt_texts(3, rows=600, seed=4))
+        for text in texts:
+            df = rs_core.read_edt_tsv(StringIO(text))
+            self.assertEqual(len(df), 600)
+            self.assertTrue(np.all(df["TD"] <= df["T"]))
+            self.assertIn(rs_core.process_uploaded_tsv(StringIO(text))["label"], rs_core.CLASSES)
+        self.assertEqual(texts, list(edt_texts(3, rows=600, seed=4)))
+
+        stages = bench_stages(count=2, repeat=1, rows=300)["per_sounding"]
+        self.assertIn("serialize_levels", stages)
+        self.assertTrue(all(v["best_ms"] > 0 for v in stages.values()))
+
+
+def _as_user(request):
+    force_authenticate(request, user=get_user_model()(username="tester@example.com"))
+    return request
+
+
+def _profiles(n=6):
+    """Perfiles interpolados a P_LEVELS a partir de EDT sintéticos."""
+    return [rs_core.interp_to_levels(rs_core.read_edt_tsv(BytesIO(_edt_text(seed=s).encode())))
+            for s in range(n)]
+
+
+def _legacy_monotonic_z(z):
+    z = z.copy()
+    for i in range(1, len(z)):
+        if z[i] <= z[i-1]:
+            z[i] = z[i-1] + 1.0
+    return z
+
+
+def _legacy_grad_dz(z, f, k=5):
+    return np.gradient(rs_core.moving_mean(f, k=k), z)
+
+
+class PhysicsBatchTests(SimpleTestCase):
+    def test_matches_metpy_per_sounding(self):
+        import metpy.calc as mpcalc
+        from metpy.units import units
+
+        profs = _profiles()
+        p = rs_core.P_LEVELS
+        z, T, RH = (np.stack([pr[i] for pr in profs]) for i in (1, 2, 4))
+        MR = np.stack([pr[7] for pr in profs])
+        MR[::2] = 0.0   # mitad de los sondeos sin MR: r desde la HR
+        out = rs_core.physics_batch(p, z, T, RH, MR)
+        self.assertEqual(out["N2"].shape, T.shape)
+
+        for i in range(len(profs)):
+            p_q, T_q = p * units.hPa, T[i] * units.K
+            if i % 2 == 0:
+                r_q = mpcalc.mixing_ratio_from_relative_humidity(p_q, T_q, RH[i] / 100.0 * units.dimensionless)
+            else:
+                r_q = MR[i] / 1000.0 * units("kg/kg")
+            theta = mpcalc.potential_temperature(p_q, T_q).m
+            theta_v = mpcalc.virtual_potential_temperature(p_q, T_q, r_q).m
+            zi = _legacy_monotonic_z(z[i])
+            np.testing.assert_allclose(out["theta"][i], theta, rtol=1e-12)
+            np.testing.assert_allclose(out["theta_v"][i], theta_v, rtol=1e-12)
+            np.testing.assert_allclose(out["Gamma_env"][i], -_legacy_grad_dz(zi, T[i]) * 1000.0, rtol=1e-9)
+            np.testing.assert_allclose(out["dtheta_dz_Kkm"][i], _legacy_grad_dz(zi, theta) * 1000.0, rtol=1e-9)
+            np.testing.assert_allclose(out["N2"][i], rs_core.G / theta_v * _legacy_grad_dz(zi, theta_v), rtol=1e-9)
+
+
+class StencilTests(SimpleTestCase):
+    def test_grad_dz_stack_matches_smooth_then_gradient(self):
+        z, T, Td = synthetic_profiles(5, seed=4)
+        F = np.stack([T, Td, T - Td], axis=1)                 # (N, campos, L)
+        got = rs_core.grad_dz_stack(z, F)
+        self.assertEqual(got.shape, F.shape)
+        for n in range(len(z)):
+            for f in range(F.shape[1]):
+                np.testing.assert_allclose(got[n, f], _legacy_grad_dz(z[n], F[n, f]), rtol=1e-9, atol=1e-12)
+        # Rejilla única (campos, L) y sin suavizado
+        np.testing.assert_allclose(rs_core.grad_dz_stack(z[0], F[0], smooth_k=1),
+                                   [np.gradient(f, z[0]) for f in F[0]], rtol=1e-9)
+
+    def test_monotonic_z_matches_loop(self):
+        rng = np.random.default_rng(0)
+        z = np.cumsum(rng.normal(150.0, 200.0, (50, 27)), axis=1)   # con retrocesos frecuentes
+        got = rs_core.ensure_monotonic_z(z)
+        self.assertTrue(np.all(np.diff(got, axis=1) >= 1.0))
+        same = 0
+        for i in range(len(z)):
+            legacy = _legacy_monotonic_z(z[i])
+            if np.all(np.diff(legacy) >= 1.0):   # igual al bucle salvo huecos < 1 m
+                np.testing.assert_allclose(got[i], legacy)
+                same += 1
+        self.assertGreater(same, 25)
+
+
+class CapeCinBatchTests(SimpleTestCase):
+    def _metpy(self, p, T, Td, Tp):
+        import metpy.calc as mpcalc
+        from metpy.units import units
+        cape, cin = mpcalc.cape_cin(p * units.hPa, T * units.K, Td * units.K, Tp * units.K)
+        return cape.to("J/kg").m, cin.to("J/kg").m
+
+    def test_matches_metpy_over_synthetic_corpus(self):
+        import metpy.calc as mpcalc
+        from metpy.units import units
+
+        p = rs_core.P_LEVELS
+        _, T, Td = synthetic_profiles(150, seed=3)
+        rng = np.random.default_rng(3)
+        # Parcelas de superficie y desplazadas (tipo capa de mezcla)
+        T0 = T[:, 0] + np.where(np.arange(len(T)) % 2, rng.uniform(-2, 1, len(T)), 0.0)
+        Tp = np.array([mpcalc.parcel_profile(p * units.hPa, t0 * units.K, td0 * units.K).to("K").m
+                       for t0, td0 in zip(T0, Td[:, 0])])
+        out = rs_core.cape_cin_batch(p, T, Td, Tp)
+        self.assertGreater((out["cape"] > 0).sum(), 20)
+        for i in range(len(T)):
+            cape, cin = self._metpy(p, T[i], Td[i], Tp[i])
+            self.assertAlmostEqual(out["cape"][i], cape, delta=1e-6 * max(1.0, abs(cape)), msg=i)
+            self.assertAlmostEqual(out["cin"][i], cin, delta=1e-6 * max(1.0, abs(cin)), msg=i)
+
+    def test_physics_fast_and_metpy_modes_agree(self):
+        for p, z, T, Td, RH, u, v, MR in _profiles(4):
+            fast = rs_core.physics_from_profile(p, z, T, Td, RH, u, v, MR, cape_mode="fast")
+            ref = rs_core.physics_from_profile(p, z, T, Td, RH, u, v, MR, cape_mode="metpy")
+            for k in ("cape_sb", "cin_sb", "cape_ml", "cin_ml"):
+                self.assertAlmostEqual(fast[k], ref[k], places=6)
+
+
+class MoistTableTests(SimpleTestCase):
+    def test_parcel_profile_within_error_bound_of_metpy_ode(self):
+        import metpy.calc as mpcalc
+        from metpy.units import units
+
+        rng = np.random.default_rng(7)
+        for p in (rs_core.P_LEVELS, np.linspace(1050.0, 100.0, 40)):
+            T0 = rng.uniform(240.0, 315.0, 60)
+            Td0 = T0 - rng.uniform(0.0, 30.0, 60)
+            got = rs_core.parcel_profile_batch(p, T0, Td0)
+            ref = np.array([mpcalc.parcel_profile(p * units.hPa, t * units.K, td * units.K).m_as("K")
+                            for t, td in zip(T0, Td0)])
+            np.testing.assert_allclose(got, ref, atol=5e-3, rtol=0)
+
+    def test_table_disk_cache_round_trip(self):
+        table = rs_core.build_moist_table()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "moist.npz")
+            with mock.patch.object(rs_core, "MOIST_TABLE_PATH", path), \
+                 mock.patch.object(rs_core, "_MOIST_TABLE", None):
+                np.testing.assert_array_equal(rs_core.get_moist_table(), table)
+                self.assertTrue(os.path.exists(path))
+            with mock.patch.object(rs_core, "MOIST_TABLE_PATH", path), \
+                 mock.patch.object(rs_core, "_MOIST_TABLE", None), \
+                 mock.patch.object(rs_core, "build_moist_table", side_effect=AssertionError):
+                np.testing.assert_array_equal(rs_core.get_moist_table(), table)
+
+
+def _legacy_label(z_m, Gamma_env, Gamma_moist, N2, cape_sb, cin_sb, cape_ml, cin_ml):
+    """Etiquetado original (bucles sobre np.where) como referencia."""
+    z_agl = z_m - z_m[0]
+
+    def thick_run(mask, min_thick):
+        if not np.any(mask):
+            return False
+        idx = np.where(mask)[0]; s = idx[0]
+        for i in range(1, len(idx)):
+            if idx[i] != idx[i-1] + 1:
+                if (z_agl[idx[i-1]] - z_agl[s]) >= min_thick: return True
+                s = idx[i]
+        return (z_agl[idx[-1]] - z_agl[s]) >= min_thick
+
+    if thick_run((-Gamma_env / 1000.0 > 0) & (z_agl <= 500), 150):
+        return "Inversion"
+    if (np.isfinite(cape_ml) and cape_ml >= 50 and (np.isnan(cin_ml) or cin_ml > -75)) \
+       or (np.isfinite(cape_sb) and cape_sb >= 100 and (np.isnan(cin_sb) or cin_sb > -100)):
+        return "Inestable"
+    if thick_run((Gamma_env - Gamma_moist) > 0.5, 400) or thick_run(N2 < -2e-4, 200):
+        return "Inestable"
+    m03 = (z_agl >= 0) & (z_agl <= 3000)
+    GamE = np.nanmean(Gamma_env[m03]); GamM = np.nanmean(Gamma_moist[m03]); N2m = np.nanmean(N2[m03])
+    if GamE < (GamM - 0.3) and (np.isnan(N2m) or N2m > 1e-4):
+        return "Estable"
+    return "Neutral"
+
+
+class LabelManyTests(SimpleTestCase):
+    def test_mask_runs(self):
+        row, start, end = rs_core.mask_runs([[1, 1, 0, 1], [0, 0, 0, 0], [0, 1, 1, 1]])
+        self.assertEqual(list(zip(row, start, end)), [(0, 0, 1), (0, 3, 3), (2, 1, 3)])
+
+    def test_matches_legacy_labels(self):
+        p = rs_core.P_LEVELS
+        z, T, Td = synthetic_profiles(400, seed=11)
+        RH = 100.0 * rs_core.saturation_vapor_pressure_pa(Td) / rs_core.saturation_vapor_pressure_pa(T)
+        dry = rs_core.physics_batch(p, z, T, RH, np.zeros_like(T))
+        Tp = rs_core.parcel_profile_batch(p, T[:, 0], Td[:, 0])
+        Gamma_moist = -rs_core.grad_dz_stack(dry["z"], Tp) * 1000.0
+        cc = rs_core.cape_cin_batch(p, T, Td, Tp)
+        # Mitad sin CAPE para ejercitar las reglas por capas
+        cape = np.where(np.arange(len(T)) % 2, cc["cape"], np.nan)
+
+        got = rs_core.label_many(dry["z"], dry["Gamma_env"], Gamma_moist, dry["N2"],
+                                 cape_sb=cape, cin_sb=cc["cin"], cape_ml=cape, cin_ml=cc["cin"])
+        expected = [_legacy_label(dry["z"][i], dry["Gamma_env"][i], Gamma_moist[i], dry["N2"][i],
+                                  cape[i], cc["cin"][i], cape[i], cc["cin"][i])
+                    for i in range(len(T))]
+        self.assertEqual(got, expected)
+        self.assertEqual(set(got), set(rs_core.CLASSES))
+
+
+_TEST_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "radiosonde": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "rs-tests"},
+}
+
+
+@override_settings(CACHES=_TEST_CACHES, RADIOSONDE_STORE_RESULTS=False, RADIOSONDE_ARCHIVE_RESULTS=False)
+class ProcessViewTests(SimpleTestCase):
+    def setUp(self):
+        result_cache.clear()
+        narrative_cache.clear()
+        from django.core.cache import caches
+        caches["radiosonde"].clear()
+
+    def _post(self, body, **extra):
+        request = APIRequestFactory().post(
+            "/feature/process/?summarize=false", data=body,
+            content_type="application/octet-stream", **extra,
+        )
+        return RadiosondeProcessView.as_view()(_as_user(request))
+
+    def test_octet_stream_upload(self):
+        resp = self._post(_edt_text().encode("utf-8"), HTTP_X_FILENAME="edt_10152025.tsv")
+        self.assertEqual(resp.status_code, 200, resp.data)
+        self.assertEqual(resp.data["file"], "edt_10152025.tsv")
+        self.assertEqual(resp.data["date"], "2025-10-15")
+        self.assertEqual(len(resp.data["levels"]), len(rs_core.P_LEVELS))
+        self.assertIn(resp.data["label"], rs_core.CLASSES)
+
+    def test_repeat_upload_is_served_from_cache(self):
+        body = _edt_text(seed=5).encode("utf-8")
+        first = self._post(body, HTTP_X_FILENAME="edt_01012025.tsv")
+        self.assertEqual(first["X-Radiosonde-Cache"], "miss")
+        again = self._post(body, HTTP_X_FILENAME="otro_02022025.tsv")
+        self.assertEqual(again["X-Radiosonde-Cache"], "memory")
+        self.assertEqual(again.data["file"], "otro_02022025.tsv")
+        self.assertEqual(again.data["date"], "2025-02-02")
+        self.assertEqual(again.data["levels"], first.data["levels"])
+
+        result_cache.clear()   # otro worker: solo el nivel compartido
+        self.assertEqual(self._post(body)["X-Radiosonde-Cache"], "shared")
+        self.assertEqual(self._post(_edt_text(seed=6).encode("utf-8"))["X-Radiosonde-Cache"], "miss")
+
+    def test_metrics_record_stages_cache_and_labels(self):
+        from django.test import RequestFactory
+        from . import metrics
+        from .views import metrics_view
+        metrics.reset()
+        resp = self._post(_edt_text(seed=12).encode("utf-8"))
+        resp.render()
+        self.assertEqual(metrics_view(RequestFactory().get("/feature/metrics/")).status_code, 403)
+        with override_settings(RADIOSONDE_METRICS_TOKEN="s3"):
+            text = metrics_view(RequestFactory().get("/", HTTP_AUTHORIZATION="Bearer s3")).content.decode()
+        for stage in ("read", "interp", "physics", "label", "feature_matrix", "serialize"):
+            self.assertIn(f'radiosonde_stage_seconds_count{{stage="{stage}"}} 1', text)
+        self.assertIn('radiosonde_stage_seconds_bucket{stage="physics",le="+Inf"} 1', text)
+        self.assertIn('radiosonde_cache_lookups_total{cache="result",tier="miss"} 1', text)
+        self.assertIn(f'radiosonde_labels_total{{label="{resp.data["label"]}"}} 1', text)
+        with override_settings(RADIOSONDE_METRICS_TOKEN="s3"):
+            self.assertEqual(metrics_view(RequestFactory().get("/")).status_code, 403)
+
+    def test_metric_label_values_are_escaped(self):
+        from . import metrics
+        self.assertEqual(metrics._labels(("file",), ('a\\b"c\nd',)), '{file="a\\\\b\\"c\\nd"}')
+
+    def test_full_queue_returns_429_with_retry_after(self):
+        with mock.patch("feature.batch.processing_queue.submit", side_effect=QueueFull(3)):
+            resp = self._post(_edt_text(seed=13).encode("utf-8"))
+        self.assertEqual(resp.status_code, 429)
+        self.assertEqual(resp["Retry-After"], "3")
+        self.assertEqual(resp.data["retry_after"], 3)
+
+    def test_matrix_formats_match_default_levels(self):
+        body = _edt_text(seed=9).encode("utf-8")
+        levels = self._post(body, HTTP_X_FILENAME="edt_03042025.tsv").data["levels"]
+        X = np.array([[lvl[k] for k in rs_core.FEATURE_ORDER] for lvl in levels])
+
+        def post(fmt):
+            request = APIRequestFactory().post(
+                f"/feature/process/?summarize=false&format={fmt}", data=body,
+                content_type="application/octet-stream", HTTP_X_FILENAME="edt_03042025.tsv",
+            )
+            resp = RadiosondeProcessView.as_view()(_as_user(request))
+            self.assertEqual(resp.status_code, 200)
+            return resp.render()
+
+        columnar = json.loads(post("columnar").content)
+        self.assertEqual(columnar["columns"], rs_core.FEATURE_ORDER)
+        np.testing.assert_array_equal(np.array(columnar["data"]), X)
+        self.assertNotIn("levels", columnar)
+
+        resp = post("npy")
+        self.assertEqual(resp["Content-Type"], "application/x-npy")
+        self.assertEqual(resp["X-Radiosonde-Columns"].split(","), rs_core.FEATURE_ORDER)
+        np.testing.assert_array_equal(np.load(BytesIO(resp.content)), X)
+
+        with np.load(BytesIO(post("npz").content)) as npz:
+            np.testing.assert_array_equal(npz["X"], X)
+            self.assertEqual(json.loads(npz["meta"].item())["date"], "2025-03-04")
+
+        packed = msgpack.unpackb(post("msgpack").content)
+        mp = np.frombuffer(packed["X"], dtype="<f8").reshape(packed["shape"])
+        np.testing.assert_array_equal(mp, X)
+        self.assertEqual(packed["label"], columnar["label"])
+
+    def test_error_responses_in_binary_formats(self):
+        for fmt in ("npy", "npz", "msgpack"):
+            request = APIRequestFactory().post(
+                f"/feature/process/?summarize=false&format={fmt}", data=b"x", content_type="application/octet-stream",
+            )
+            resp = RadiosondeProcessView.as_view()(request).render()   # sin usuario -> 401
+            self.assertEqual(resp.status_code, 401, fmt)
+            if fmt == "msgpack":
+                self.assertIn("detail", msgpack.unpackb(resp.content))
+            else:
+                self.assertEqual(resp["Content-Type"], "application/json")
+                self.assertIn("detail", json.loads(resp.content))
+
+    def test_compact_query_params(self):
+        body = _edt_text(seed=12).encode("utf-8")
+
+        def post(query):
+            request = APIRequestFactory().post(
+                f"/feature/process/?summarize=false&{query}", data=body, content_type="application/octet-stream",
+            )
+            return RadiosondeProcessView.as_view()(_as_user(request))
+
+        full = np.array([[lvl[k] for k in rs_core.FEATURE_ORDER] for lvl in post("").data["levels"]])
+        resp = post("digits=4")
+        self.assertEqual(resp.data["precision"], {"dtype": "float32", "significant_digits": 4})
+        X = np.array([[lvl[k] for k in rs_core.FEATURE_ORDER] for lvl in resp.data["levels"]])
+        np.testing.assert_array_equal(X, rs_core.round_significant(full, 4))
+        self.assertEqual(json.dumps(resp.data["levels"][0]["p_hPa"]), "620.0")
+        self.assertEqual(resp.data["summary"]["CAPE_SB"], float(rs_core.round_significant(
+            post("").data["summary"]["CAPE_SB"], 4)))
+
+        npy = np.load(BytesIO(post("compact=true&format=npy").render().content))
+        self.assertEqual(npy.dtype, np.float32)
+        packed = msgpack.unpackb(post("compact=true&format=msgpack").render().content)
+        self.assertEqual(packed["dtype"], "<f4")
+        np.testing.assert_array_equal(np.frombuffer(packed["X"], dtype="<f4").reshape(packed["shape"]), npy)
+        self.assertEqual(post("digits=9").status_code, 400)
+
+    def test_grid_query_param(self):
+        body = _edt_text(seed=11).encode("utf-8")
+
+        def post(query):
+            request = APIRequestFactory().post(
+                f"/feature/process/?summarize=false&{query}", data=body, content_type="application/octet-stream",
+            )
+            return RadiosondeProcessView.as_view()(_as_user(request))
+
+        z = post("grid=z:0:6000:500")
+        self.assertEqual(len(z.data["levels"]), 13)
+        self.assertEqual(post("grid=z:0:6000:500")["X-Radiosonde-Cache"], "memory")
+        self.assertEqual(post("")["X-Radiosonde-Cache"], "miss")   # otra rejilla, otra clave
+
+        both = post("grid=p:620:100:20&grid=logp:620:100:40")
+        self.assertEqual(set(both.data["grids"]), {"p:620:100:20", "logp:620:100:40"})
+        self.assertEqual(len(both.data["grids"]["logp:620:100:40"]["levels"]), 40)
+        self.assertEqual(post("grid=q:1").status_code, 400)
+        self.assertEqual(post("grid=p:620:100:20&grid=z:0:6000:500&format=npy").status_code, 400)
+
+    def test_narrative_cached_per_model_and_language(self):
+        body = _edt_text(seed=7).encode("utf-8")
+
+        def post(query):
+            request = APIRequestFactory().post(
+                f"/feature/process/?{query}", data=body, content_type="application/octet-stream",
+            )
+            return RadiosondeProcessView.as_view()(_as_user(request))
+
+        with mock.patch("feature.llm_groq.summarize_radiosonde",
+                        side_effect=lambda rec, language, model_id: f"{language}:{model_id}") as llm:
+            first = post("lang=es")
+            self.assertEqual(first["X-Radiosonde-Narrative-Cache"], "miss")
+            again = post("lang=es")
+            self.assertEqual(again["X-Radiosonde-Narrative-Cache"], "memory")
+            self.assertEqual(again.data["narrative"], first.data["narrative"])
+            self.assertEqual(llm.call_count, 1)
+
+            self.assertEqual(post("lang=en")["X-Radiosonde-Narrative-Cache"], "miss")
+            self.assertEqual(post("lang=es&model=otro")["X-Radiosonde-Narrative-Cache"], "miss")
+            narrative_cache.clear()
+            self.assertEqual(post("lang=es")["X-Radiosonde-Narrative-Cache"], "shared")
+            self.assertEqual(post("lang=es&refresh_summary=true")["X-Radiosonde-Narrative-Cache"], "refresh")
+            self.assertEqual(llm.call_count, 4)
+
+            llm.side_effect = RuntimeError("sin red")
+            failed = post("lang=fr")
+            self.assertIn("No se pudo generar", failed.data["narrative"])
+            self.assertNotIn("X-Radiosonde-Narrative-Cache", failed)
+
+    def test_stream_sends_result_first_then_tokens(self):
+        body = _edt_text(seed=8).encode("utf-8")
+
+        def events(query):
+            request = APIRequestFactory().post(
+                f"/feature/process/?stream=true&{query}", data=body, content_type="application/octet-stream",
+            )
+            resp = RadiosondeProcessView.as_view()(_as_user(request))
+            self.assertEqual(resp["Content-Type"], "text/event-stream")
+            out = []
+            for block in b"".join(resp.streaming_content).decode("utf-8").split("\n\n"):
+                if block:
+                    event, data = block.split("\n")
+                    out.append((event[len("event: "):], json.loads(data[len("data: "):])))
+            return out
+
+        with mock.patch("feature.llm_groq.stream_radiosonde", return_value=iter(["Perfil ", "estable."])):
+            first = events("lang=es")
+        self.assertEqual([e for e, _ in first], ["result", "token", "token", "done"])
+        self.assertIn(first[0][1]["label"], rs_core.CLASSES)
+        self.assertEqual(first[-1][1], {"narrative_cache": "miss"})
+
+        again = events("lang=es")   # acierto: la narrativa completa en un solo token
+        self.assertEqual(again[1], ("token", {"text": "Perfil estable."}))
+        self.assertEqual(again[-1][1], {"narrative_cache": "memory"})
+
+        with mock.patch("feature.llm_groq.stream_radiosonde", side_effect=RuntimeError("sin red")):
+            failed = events("lang=en")
+        self.assertEqual([e for e, _ in failed], ["result", "error"])
+
+
+@override_settings(CACHES=_TEST_CACHES, RADIOSONDE_STORE_RESULTS=False, RADIOSONDE_ARCHIVE_RESULTS=False)
+class AsyncProcessViewTests(SimpleTestCase):
+    def setUp(self):
+        result_cache.clear()
+        narrative_cache.clear()
+        from django.core.cache import caches
+        caches["radiosonde"].clear()
+
+    def _post(self, body, query="summarize=false", user=True):
+        request = AsyncRequestFactory().post(
+            f"/feature/process/async/?{query}", data=body, content_type="application/octet-stream",
+            headers={"X-Filename": "edt_07082025.tsv"},
+        )
+        if user:
+            _as_user(request)
+        return async_to_sync(RadiosondeProcessAsyncView.as_view())(request)
+
+    def test_matches_sync_view_and_shares_cache(self):
+        body = _edt_text(seed=21).encode("utf-8")
+        resp = self._post(body)
+        self.assertEqual(resp.status_code, 200, resp.content)
+        self.assertEqual(resp["X-Radiosonde-Cache"], "miss")
+        data = json.loads(resp.content)
+        self.assertEqual(data["date"], "2025-07-08")
+        request = APIRequestFactory().post("/feature/process/?summarize=false", data=body,
+                                           content_type="application/octet-stream")
+        sync = RadiosondeProcessView.as_view()(_as_user(request))
+        self.assertEqual(sync["X-Radiosonde-Cache"], "memory")
+        self.assertEqual(json.loads(json.dumps(sync.data["levels"])), data["levels"])
+
+    def test_narrative_via_async_client(self):
+        with FakeLLMServer(text="Perfil estable.") as srv:
+            llm_groq.configure_client(base_url=srv.url, api_key="test")
+            try:
+                resp = self._post(_edt_text(seed=22).encode("utf-8"), query="lang=es")
+            finally:
+                llm_groq.reset_client()
+        self.assertEqual(json.loads(resp.content)["narrative"], "Perfil estable.")
+        self.assertEqual(resp["X-Radiosonde-Narrative-Cache"], "miss")
+
+    def test_requires_authentication(self):
+        self.assertEqual(self._post(b"x", user=False).status_code, 401)
+
+
+@override_settings(RADIOSONDE_STORE_RESULTS=True, RADIOSONDE_ARCHIVE_RESULTS=False)
+class SoundingStoreTests(SimpleTestCase):
+    def test_writer_bulk_inserts_packed_rows(self):
+        results = [rs_core.process_tsv_matrix(StringIO(_edt_text(seed=s)), f"edt_0{s + 1}152025.tsv")
+                   for s in range(3)]
+        results[2]["file"] = "sin_fecha.tsv"; results[2]["date"] = "2025-99-99"
+        writer = SoundingWriter(batch_size=10, flush_interval=0.01)
+        with mock.patch.object(Radiosondeo.objects, "bulk_create") as bulk:
+            for i, r in enumerate(results):
+                writer.submit(r, f"rs:result:{i}")
+            writer.flush()
+        rows = [row for call in bulk.call_args_list for row in call.args[0]]
+        self.assertTrue(all(call.kwargs["ignore_conflicts"] for call in bulk.call_args_list))
+        self.assertEqual([row.key for row in rows], ["rs:result:0", "rs:result:1", "rs:result:2"])
+        self.assertEqual(str(rows[0].date), "2025-01-15")
+        self.assertIsNone(rows[2].date)
+        self.assertEqual(rows[1].cape_ml, results[1]["summary"]["CAPE_ML"])
+        self.assertEqual(rows[0].summary(), results[0]["summary"])
+        np.testing.assert_array_equal(rows[0].matrix(), results[0]["X"])
+
+
+class CompactModeTests(SimpleTestCase):
+    def test_round_significant(self):
+        a = np.array([123456.7, 0.000123456, -9.87654, 0.0, np.nan, np.inf])
+        np.testing.assert_array_equal(rs_core.round_significant(a, 3),
+                                      [123000.0, 0.000123, -9.88, 0.0, np.nan, np.inf])
+
+    def test_float32_matrices_round_trip_through_store_and_archive(self):
+        with mock.patch.object(rs_core, "FEATURE_DTYPE", np.float32):
+            results = [rs_core.process_tsv_matrix(StringIO(_edt_text(seed=s)), f"edt_0{s + 1}012025.tsv")
+                       for s in range(2)]
+        self.assertEqual(results[0]["X"].dtype, np.float32)
+        row = Radiosondeo.from_result(results[0], "k0")
+        self.assertEqual(len(row.levels), results[0]["X"].size * 4)
+        np.testing.assert_array_equal(row.matrix(), results[0]["X"])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            archive = FeatureArchive(tmp)
+            archive.append([(results[0], "k0")])
+            archive.append([(results[1], "k1")])
+            X = archive.open()
+            self.assertEqual(X.dtype, np.float32)
+            np.testing.assert_array_equal(X[1], results[1]["X"])
+
+    def test_uploaded_tsv_digits(self):
+        out = rs_core.process_uploaded_tsv(StringIO(_edt_text(seed=3)), digits=5)
+        for lvl in out["levels"]:
+            for v in lvl.values():
+                self.assertEqual(v, float(f"{v:.4e}"))   # 5 cifras significativas
+
+
+class FeatureArchiveTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.results = [rs_core.process_tsv_matrix(StringIO(_edt_text(seed=s)), f"edt_0{s + 1}012025.tsv")
+                        for s in range(4)]
+
+    def test_append_mmap_and_export_subset(self):
+        archive = FeatureArchive(self.tmp.name)
+        self.assertEqual(archive.append([(r, f"k{i}") for i, r in enumerate(self.results[:3])]), 3)
+        self.assertEqual(archive.append([(self.results[0], "k0"), (self.results[3], "k3")]), 1)
+
+        X = np.load(archive.data_path, mmap_mode="r")
+        self.assertIsInstance(X, np.memmap)
+        self.assertEqual(X.shape, (4, len(rs_core.P_LEVELS), len(rs_core.FEATURE_ORDER)))
+        np.testing.assert_array_equal(X[3], self.results[3]["X"])
+        self.assertEqual([r["key"] for r in archive.index()], ["k0", "k1", "k2", "k3"])
+
+        out = os.path.join(self.tmp.name, "subset.npy")
+        self.assertEqual(archive.export(out, rows=archive.select(date_from="2025-02-01", date_to="2025-03-31")), 2)
+        np.testing.assert_array_equal(np.load(out), np.stack([self.results[1]["X"], self.results[2]["X"]]))
+        with open(out + ".csv", encoding="utf-8") as fh:
+            self.assertEqual(len(fh.read().splitlines()), 3)
+
+    def test_uncommitted_append_is_discarded(self):
+        archive = FeatureArchive(self.tmp.name)
+        archive.append([(self.results[0], "k0")])
+        with open(archive.data_path, "ab") as fh:   # append interrumpido antes de la cabecera
+            fh.write(b"\0" * 1000)
+        with open(archive.index_path, "a", encoding="utf-8") as fh:
+            fh.write("1,roto.tsv,,Estable,3,kx\n")
+        self.assertEqual(len(archive), 1)
+        archive.append([(self.results[1], "k1")])
+        self.assertEqual([r["key"] for r in archive.index()], ["k0", "k1"])
+        np.testing.assert_array_equal(archive.open()[1], self.results[1]["X"])
+
+    def test_mismatched_shape_is_skipped_not_the_batch(self):
+        archive = FeatureArchive(self.tmp.name)
+        archive.append([(self.results[0], "k0")])
+        odd = {**self.results[1], "X": self.results[1]["X"][:10]}
+        with self.assertLogs("feature.archive", "WARNING"):
+            self.assertEqual(archive.append([(odd, "k1"), (self.results[2], "k2")]), 1)
+        self.assertEqual([r["key"] for r in archive.index()], ["k0", "k2"])
+
+    def test_append_reads_only_new_index_rows(self):
+        from . import archive as archive_module
+        FeatureArchive(self.tmp.name).append([(self.results[0], "k0"), (self.results[1], "k1")])
+        with mock.patch.object(archive_module.csv, "reader") as reader:
+            self.assertEqual(FeatureArchive(self.tmp.name).append([(self.results[1], "k1"),
+                                                                   (self.results[2], "k2")]), 1)
+        reader.assert_not_called()
+        # Otro proceso (sin lo leído por este) también ve las keys ya archivadas
+        archive_module._SEEN.clear()
+        archive = FeatureArchive(self.tmp.name)
+        self.assertEqual(archive.append([(self.results[2], "k2"), (self.results[3], "k3")]), 1)
+        self.assertEqual([r["row"] for r in archive.index()], [0, 1, 2, 3])
+
+
+class SoundingQueryTests(SimpleTestCase):
+    def test_keyset_filters_without_offset(self):
+        cursor = encode_cursor(datetime.date(2024, 5, 1), 42)
+        self.assertEqual(decode_cursor(cursor), (datetime.date(2024, 5, 1), 42))
+        qs = build_queryset({"date_from": "2024-01-01", "label": "Inestable", "cape_ml_min": "500",
+                             "cursor": cursor})
+        sql = str(qs[:101].query)
+        self.assertNotIn("OFFSET", sql)
+        self.assertIn('"cape_ml" >= 500.0', sql)
+        self.assertIn('ORDER BY "feature_radiosondeo"."date" ASC, "feature_radiosondeo"."id" ASC', sql)
+        self.assertNotIn('"levels"', sql)
+        self.assertIn('"levels"', str(build_queryset({"levels": "true"}).query))
+
+    def test_invalid_params_are_400(self):
+        for query in ("date_from=ayer", "cape_ml_min=mucho", "cursor=xyz", "limit=diez"):
+            request = APIRequestFactory().get(f"/feature/soundings/?{query}")
+            resp = RadiosondeQueryView.as_view()(_as_user(request))
+            self.assertEqual(resp.status_code, 400, query)
+
+
+@mock.patch.object(llm_groq, "_BACKOFF_BASE", 0.001)
+class GroqClientTests(SimpleTestCase):
+    record = {"file": "edt.tsv", "label": "estable", "summary": {"cape_sb": 0.0}, "levels": []}
+
+    def tearDown(self):
+        llm_groq.reset_client()
+
+    def test_shared_client_against_fake_server(self):
+        with FakeLLMServer(text="Perfil estable.") as srv:
+            client = llm_groq.configure_client(base_url=srv.url, api_key="test")
+            self.assertEqual(llm_groq.summarize_radiosonde(self.record), "Perfil estable.")
+            self.assertEqual("".join(llm_groq.stream_radiosonde(self.record)), "Perfil estable.")
+            self.assertIs(llm_groq.get_client(), client)
+            self.assertEqual(srv.requests, 2)
+
+    def test_retries_on_429_and_5xx_then_gives_up(self):
+        with FakeLLMServer(error_rate=1.0) as srv:
+            llm_groq.configure_client(base_url=srv.url, api_key="test")
+            with self.assertRaises(llm_groq.retryable_errors()):
+                llm_groq.summarize_radiosonde(self.record)
+            self.assertEqual(srv.requests, llm_groq._MAX_RETRIES + 1)
+
+    def test_async_client_is_closed_with_its_event_loop(self):
+        clients = []
+
+        async def summarize():
+            clients.append(await llm_groq.get_async_client())
+            return await llm_groq.asummarize_radiosonde(self.record)
+
+        with FakeLLMServer(text="Perfil estable.") as srv:
+            llm_groq.configure_client(base_url=srv.url, api_key="test")
+            # async_to_sync arma un loop nuevo por llamada, como una vista async bajo WSGI
+            for _ in range(2):
+                self.assertEqual(async_to_sync(summarize)(), "Perfil estable.")
+        self.assertIsNot(clients[0], clients[1])
+        self.assertTrue(all(c.is_closed() for c in clients))
+
+
+def _kill_worker():
+    os._exit(1)
+
+
+def _exit_on_b(filename, data):
+    if filename == "b":
+        os._exit(1)
+    time.sleep(0.2)    # sigue en vuelo cuando muere el worker de "b"
+    return {"file": filename, "size": len(data)}
+
+
+class _ChunkedOnly(BytesIO):
+    """Stream que falla si alguien lo lee entero de una vez."""
+    def read(self, size=-1):
+        assert size is not None and size > 0, "lectura completa del upload"
+        return super().read(size)
+
+
+class ProcessUploadTests(SimpleTestCase):
+    def test_without_pool_streams_the_upload(self):
+        from . import batch
+        with override_settings(RADIOSONDE_PROCESS_IN_POOL=False):
+            result = batch.process_upload(_ChunkedOnly(_edt_text(seed=22).encode("utf-8")), "edt.tsv")
+        self.assertIn(result["label"], rs_core.CLASSES)
+
+    def test_pool_worker_gets_a_path_not_bytes(self):
+        from . import batch
+        data = _edt_text(seed=23).encode("utf-8")
+        seen = {}
+
+        def run(fn, path, *args):
+            with open(path, "rb") as fh:
+                seen["data"] = fh.read()
+            return fn(path, *args)
+
+        with override_settings(RADIOSONDE_PROCESS_IN_POOL=True), \
+                mock.patch.object(batch.processing_queue, "run", side_effect=run):
+            result = batch.process_upload(_ChunkedOnly(data), "edt.tsv")
+        self.assertEqual(seen["data"], data)
+        self.assertIn(result["label"], rs_core.CLASSES)
+
+
+class ProcessingQueueTests(SimpleTestCase):
+    def test_broken_pool_is_replaced(self):
+        from concurrent.futures.process import BrokenProcessPool
+        from . import batch
+        with override_settings(RADIOSONDE_BATCH_WORKERS=1, RADIOSONDE_PROCESS_IN_POOL=True):
+            with self.assertRaises(BrokenProcessPool):
+                batch.processing_queue.run(_kill_worker)
+            self.assertEqual(batch.processing_queue.depth, 0)
+            result = batch.process_upload(_edt_text(seed=21).encode("utf-8"), "edt_01012025.tsv")
+        self.assertIn(result["label"], rs_core.CLASSES)
+
+    def test_rejects_beyond_capacity_and_records_wait(self):
+        from . import metrics
+        metrics.reset()
+        queue = ProcessingQueue(max_queue=1)
+        with override_settings(RADIOSONDE_BATCH_WORKERS=1):
+            running = [queue.submit(time.sleep, 0.3), queue.submit(time.sleep, 0.3)]
+            self.assertEqual(queue.depth, 2)
+            with self.assertRaises(QueueFull) as ctx:
+                queue.submit(time.sleep, 0)
+            self.assertGreaterEqual(ctx.exception.retry_after, 1)
+            for future in running:
+                future.result()
+        time.sleep(0.05)   # los callbacks de done corren en el hilo del pool
+        self.assertEqual(queue.depth, 0)
+        text = metrics.render()
+        self.assertIn("radiosonde_queue_rejected_total 1", text)
+        self.assertIn("radiosonde_queue_wait_seconds_count 2", text)
+
+
+class SoundingSessionTests(SimpleTestCase):
+    def _chunks(self, data, seed=0):
+        rng = np.random.default_rng(seed)
+        pos = 0
+        while pos < len(data):
+            n = int(rng.integers(50, 3000))
+            yield data[pos:pos + n]
+            pos += n
+
+    def test_close_matches_full_file(self):
+        for mr in ("4.5", "0"):
+            text = _edt_text(n=1500, seed=5).replace("\t4.5\t", f"\t{mr}\t")
+            ref = rs_core.process_tsv_matrix(StringIO(text), "edt_06012025.tsv")
+            session = SoundingSession("edt_06012025.tsv")
+            for chunk in self._chunks(text.encode("utf-8")):
+                session.append(chunk)
+            out = session.close()
+            self.assertEqual(out["label"], ref["label"])
+            np.testing.assert_allclose(out["X"], ref["X"], rtol=1e-10, atol=1e-10)
+            for k, v in ref["summary"].items():
+                self.assertAlmostEqual(out["summary"][k], v, places=6, msg=k)
+
+    def test_updates_match_covered_levels_from_scratch(self):
+        session = SoundingSession("edt.tsv")
+        X = np.full((len(rs_core.P_LEVELS), len(rs_core.FEATURE_ORDER)), np.nan)
+        for chunk in self._chunks(_edt_text(n=1500, seed=6).encode("utf-8"), seed=1):
+            k_old = session.k
+            update = session.append(chunk)
+            k, first = update["levels_covered"], update["first_level"]
+            X[first:first + len(update["X"])] = update["X"]
+            if k < 2:
+                continue
+            if session._ml_fixed and k > k_old:
+                # Solo se rehacen los niveles nuevos y los que tocan el borde del suavizado
+                self.assertGreaterEqual(first, k_old - 3)
+            p, (z, T, Td, RH, u, v, MR) = session.p[:k], session.levels[:, :k]
+            phys = rs_core.physics_from_profile(p, z, T, Td, RH, u, v, MR)
+            np.testing.assert_allclose(X[:k], rs_core.build_feature_matrix(p, phys["z"], T, Td, RH, u, v, phys),
+                                       rtol=1e-10, atol=1e-10)
+            self.assertAlmostEqual(update["summary"]["CAPE_ML"], float(phys["cape_ml"]), places=6)
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        caches = {"radiosonde_sessions": {"BACKEND": "feature.cache_backends.SessionFileCache",
+                                          "LOCATION": tmp.name, "OPTIONS": {"MAX_ENTRIES": 2}}}
+        override = override_settings(CACHES={**_TEST_CACHES, **caches},
+                                     RADIOSONDE_SESSION_CACHE="radiosonde_sessions")
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def _post(self, path, body, seq=None, **kwargs):
+        headers = {"X-Filename": "edt_09092025.tsv"}
+        if seq is not None:
+            headers["X-Session-Seq"] = str(seq)
+        request = APIRequestFactory().post(path, data=body, content_type="application/octet-stream",
+                                           headers=headers)
+        return SoundingSessionView.as_view()(_as_user(request), **kwargs)
+
+    def test_view_open_append_close(self):
+        data = _edt_text(n=600, seed=7).encode("utf-8")
+        post = self._post
+
+        resp = post("/feature/sessions/", data[:8000])
+        self.assertEqual(resp.status_code, 201, resp.data)
+        sid = resp.data["session"]
+        self.assertEqual(resp["Location"], f"/feature/sessions/{sid}/")
+        resp = post(f"/feature/sessions/{sid}/", data[8000:20000], session_id=sid)
+        self.assertEqual(resp.status_code, 200, resp.data)
+        self.assertGreater(resp.data["levels_covered"], 0)
+        resp = post(f"/feature/sessions/{sid}/?close=true", data[20000:], session_id=sid)
+        self.assertEqual(resp.status_code, 200, resp.data)
+        self.assertEqual(resp.data["date"], "2025-09-09")
+        self.assertEqual(len(resp.data["levels"]), len(rs_core.P_LEVELS))
+        self.assertEqual(post(f"/feature/sessions/{sid}/", b"", session_id=sid).status_code, 404)
+
+    def test_out_of_order_and_concurrent_chunks_get_409(self):
+        data = _edt_text(n=600, seed=8).encode("utf-8")
+        resp = self._post("/feature/sessions/", data[:6000], seq=0)
+        sid = resp.data["session"]
+        self.assertEqual(resp.data["seq"], 1)
+        path = f"/feature/sessions/{sid}/"
+        skipped = self._post(path, data[12000:], seq=2, session_id=sid)
+        self.assertEqual((skipped.status_code, skipped.data["seq"]), (409, 1))
+        with locked_session(sid):
+            self.assertEqual(self._post(path, data[6000:12000], seq=1, session_id=sid).status_code, 409)
+        resp = self._post(path, data[6000:12000], seq=1, session_id=sid)
+        self.assertEqual((resp.status_code, resp.data["seq"]), (200, 2))
+        # Reintento de un pedazo ya aplicado: no se agrega dos veces
+        self.assertEqual(self._post(path, data[6000:12000], seq=1, session_id=sid).status_code, 409)
+        self.assertEqual(self._post(path, data[12000:], seq=2, session_id=sid).data["rows"], 600)
+
+    def test_expired_lock_is_not_released_by_its_old_owner(self):
+        from django.core.cache import caches
+        from . import session as session_module
+        cache = caches["radiosonde_sessions"]
+        with locked_session("s1"):
+            cache.delete("rs:session:s1:lock")                    # expiró ...
+            self.assertTrue(cache.add("rs:session:s1:lock", "otra"))   # ... y lo tomó otra petición
+        self.assertEqual(cache.get("rs:session:s1:lock"), "otra")
+        with self.assertRaises(session_module.SessionConflict):
+            with locked_session("s1"):
+                pass
+
+    def test_sessions_are_not_culled_with_other_entries(self):
+        from django.core.cache import caches
+        cache = caches["radiosonde_sessions"]
+        for i in range(5):
+            cache.set(f"k{i}", i)
+        self.assertEqual([cache.get(f"k{i}") for i in range(5)], list(range(5)))
+        self.assertTrue(cache.add("lock", 1))
+        self.assertFalse(cache.add("lock", 2))
+        cache.set("expired", 1, timeout=-1)
+        self.assertTrue(cache.add("expired", 2))
+        self.assertEqual(cache.get("expired"), 2)
+
+
+class ProcessingJobTests(SimpleTestCase):
+    def _zip(self):
+        buf = BytesIO()
+        with zipfile.ZipFile(buf, "w") as zf:
+            zf.writestr("edt_01022025.tsv", _edt_text(seed=31))
+            zf.writestr("edt_01032025.tsv", _edt_text(seed=32))
+            zf.writestr("edt_01042025.tsv", _edt_text(seed=33))
+            zf.writestr("broken.tsv", "not an edt file\n")
+        return buf.getvalue()
+
+    def test_resumed_job_skips_recorded_members_and_stores_the_rest(self):
+        from . import jobs
+        from .models import ProcessingJob
+        # Retomado tras una caída: un miembro ya figura en results
+        job = ProcessingJob(pk=7, filename="season.zip", worker="w:1", total=4, processed=1,
+                            results=[{"file": "edt_01022025.tsv", "label": "Estable"}])
+        saves = []
+        with mock.patch.object(jobs, "_load_archive", return_value=self._zip()), \
+                mock.patch.object(jobs, "_save_progress", side_effect=lambda job, **f: saves.append(f) or True), \
+                mock.patch.object(jobs, "persist_results") as write:
+            jobs.run_job(job)
+        self.assertEqual((job.processed, job.failed, job.status), (4, 1, ProcessingJob.DONE))
+        self.assertEqual(saves[-1]["status"], ProcessingJob.DONE)
+        rows = [row for call in write.call_args_list for row in call.args[0]]
+        self.assertEqual(sorted(r["file"] for r, _ in rows), ["edt_01032025.tsv", "edt_01042025.tsv"])
+        result, key = rows[0]
+        self.assertEqual(result["X"].shape, (len(rs_core.P_LEVELS), len(rs_core.FEATURE_ORDER)))
+        self.assertTrue(key.startswith("rs:result:"))
+        json.dumps(job.results, allow_nan=False)   # válido para jsonb
+
+    def test_resume_tells_apart_members_with_the_same_name(self):
+        from . import jobs
+        from .models import ProcessingJob
+        buf = BytesIO()
+        with zipfile.ZipFile(buf, "w") as zf:
+            zf.writestr("a/edt_01022025.tsv", _edt_text(seed=41))
+            zf.writestr("b/edt_01022025.tsv", _edt_text(seed=42))
+        job = ProcessingJob(pk=9, filename="season.zip", worker="w:1", total=2, processed=1,
+                            results=[{"file": "a/edt_01022025.tsv", "label": "Estable"}])
+        with mock.patch.object(jobs, "_load_archive", return_value=buf.getvalue()), \
+                mock.patch.object(jobs, "_save_progress", return_value=True), \
+                mock.patch.object(jobs, "persist_results") as write:
+            jobs.run_job(job)
+        rows = [row for call in write.call_args_list for row in call.args[0]]
+        self.assertEqual([r["file"] for r, _ in rows], ["b/edt_01022025.tsv"])
+        self.assertEqual(rows[0][0]["date"], "2025-01-02")
+        self.assertEqual(job.processed, 2)
+
+    @override_settings(RADIOSONDE_STORE_RESULTS=True, RADIOSONDE_ARCHIVE_RESULTS=True)
+    def test_results_go_to_the_database_and_the_feature_archive(self):
+        from . import jobs, store
+        from .models import ProcessingJob
+        job = ProcessingJob(pk=10, filename="season.zip", worker="w:1")
+        archive = mock.Mock()
+        with mock.patch.object(jobs, "_load_archive", return_value=self._zip()), \
+                mock.patch.object(jobs, "_save_progress", return_value=True), \
+                mock.patch.object(store, "write_soundings") as write, \
+                mock.patch.object(store, "get_archive", return_value=archive):
+            jobs.run_job(job)
+        stored = [r["file"] for call in write.call_args_list for r, _ in call.args[0]]
+        archived = [r["file"] for call in archive.append.call_args_list for r, _ in call.args[0]]
+        self.assertEqual(len(stored), 3)
+        self.assertEqual(archived, stored)
+        with override_settings(RADIOSONDE_STORE_RESULTS=False, RADIOSONDE_ARCHIVE_RESULTS=False), \
+                mock.patch.object(store, "write_soundings") as write:
+            store.persist_results([({}, "k")])
+        write.assert_not_called()
+
+    def test_lost_job_is_abandoned(self):
+        from . import jobs
+        from .models import ProcessingJob
+        job = ProcessingJob(pk=8, filename="season.zip", worker="w:1")
+        with mock.patch.object(jobs, "_load_archive", return_value=self._zip()), \
+                mock.patch.object(jobs, "_save_progress", return_value=False), \
+                mock.patch.object(jobs, "persist_results"):
+            with self.assertRaises(jobs.JobLost):
+                jobs.run_job(job)
+
+
+class BatchViewTests(SimpleTestCase):
+    def _post(self, name, data):
+        request = APIRequestFactory().post(
+            "/feature/process/batch/", {"file": SimpleUploadedFile(name, data)}, format="multipart",
+        )
+        return RadiosondeBatchView.as_view()(_as_user(request))
+
+    def _records(self, resp):
+        body = b"".join(resp.streaming_content).decode("utf-8")
+        return {r["file"]: r for r in map(json.loads, body.splitlines())}
+
+    def test_zip_streams_one_line_per_member_with_inline_errors(self):
+        buf = BytesIO()
+        with zipfile.ZipFile(buf, "w") as zf:
+            zf.writestr("season/edt_01022025.tsv", _edt_text(seed=1))
+            zf.writestr("season/edt_01032025.tsv", _edt_text(seed=2, preamble=20))
+            zf.writestr("season/broken.tsv", "not an edt file\n")
+            zf.writestr("__MACOSX/season/._edt_01022025.tsv", "junk")
+        resp = self._post("season.zip", buf.getvalue())
+        self.assertEqual(resp["Content-Type"], "application/x-ndjson")
+        records = self._records(resp)
+        self.assertEqual(set(records), {"edt_01022025.tsv", "edt_01032025.tsv", "broken.tsv"})
+        self.assertIn("error", records["broken.tsv"])
+        self.assertEqual(records["edt_01032025.tsv"]["date"], "2025-01-03")
+        self.assertEqual(len(records["edt_01022025.tsv"]["levels"]), len(rs_core.P_LEVELS))
+
+    def test_tar_gz(self):
+        buf = BytesIO()
+        with tarfile.open(fileobj=buf, mode="w:gz") as tf:
+            data = _edt_text().encode("utf-8")
+            info = tarfile.TarInfo("edt_05052025.tsv")
+            info.size = len(data)
+            tf.addfile(info, BytesIO(data))
+        records = self._records(self._post("season.tar.gz", buf.getvalue()))
+        self.assertEqual(list(records), ["edt_05052025.tsv"])
+        self.assertIn(records["edt_05052025.tsv"]["label"], rs_core.CLASSES)
+
+    def test_members_go_through_the_processing_queue(self):
+        from . import batch
+        queue = ProcessingQueue(max_queue=0)     # capacidad = 1 worker
+        members = [(f"edt_0{i + 1}012025.tsv", _edt_text(seed=40 + i).encode("utf-8")) for i in range(3)]
+        with override_settings(RADIOSONDE_BATCH_WORKERS=1), mock.patch.object(batch, "processing_queue", queue), \
+                mock.patch.object(queue, "submit", wraps=queue.submit) as submit:
+            results = list(batch.process_archive(iter(members), max_pending=3))
+        self.assertEqual(sorted(r["file"] for r in results), [name for name, _ in members])
+        self.assertTrue(all("label" in r for r in results))
+        self.assertGreater(submit.call_count, len(members))    # hubo QueueFull y se esperó
+        self.assertEqual(queue.depth, 0)
+
+    def test_member_that_kills_its_worker_fails_alone(self):
+        from . import batch
+        members = [(name, name.encode()) for name in ("a", "b", "c")]
+        with batch.WorkerPool(max_workers=2) as pool:
+            results = {r["file"]: r for r in batch.process_archive(iter(members), pool=pool, max_pending=3,
+                                                                    fn=_exit_on_b)}
+            self.assertEqual(set(results), {"a", "b", "c"})
+            self.assertIn("murió", results["b"]["error"])
+            self.assertEqual((results["a"]["size"], results["c"]["size"]), (1, 1))
+            # El mismo pool (ya recreado) sigue sirviendo para el próximo archivo
+            again = list(batch.process_archive(iter([("d", b"dd")]), pool=pool, fn=_exit_on_b))
+        self.assertEqual(again, [{"file": "d", "size": 2}])
+
+    def test_non_finite_values_are_null(self):
+        buf = BytesIO()
+        with zipfile.ZipFile(buf, "w") as zf:
+            zf.writestr("edt_01022025.tsv", _edt_text(seed=1))
+        record = {"file": "edt_01022025.tsv", "label": "Estable", "summary": {"CAPE_ML": float("nan")},
+                  "levels": [{"N2_s2": float("inf")}]}
+        with mock.patch("feature.views.process_archive", return_value=iter([record])):
+            resp = self._post("season.zip", buf.getvalue())
+            body = b"".join(resp.streaming_content).decode("utf-8")
+        def reject(const):
+            raise ValueError(const)
+        line = json.loads(body, parse_constant=reject)
+        self.assertIsNone(line["summary"]["CAPE_ML"])
+        self.assertIsNone(line["levels"][0]["N2_s2"])
+
+    def test_rejects_non_archive(self):
+        resp = self._post("edt.tsv", _edt_text().encode("utf-8"))
+        self.assertEqual(resp.status_code, 400)
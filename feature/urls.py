@@ -1,6 +1,14 @@
 from django.urls import path
-from .views import RadiosondeProcessView
+from .views import RadiosondeProcessView, RadiosondeProcessAsyncView, RadiosondeBatchView, RadiosondeQueryView, ProcessingJobView, SoundingSessionView, metrics_view
 
 urlpatterns = [
     path('process/', RadiosondeProcessView.as_view(), name='radiosonde-process'),
+    path('process/async/', RadiosondeProcessAsyncView.as_view(), name='radiosonde-process-async'),
+    path('process/batch/', RadiosondeBatchView.as_view(), name='radiosonde-process-batch'),
+    path('jobs/', ProcessingJobView.as_view(), name='radiosonde-jobs'),
+    path('jobs/<int:pk>/', ProcessingJobView.as_view(), name='radiosonde-job'),
+    path('sessions/', SoundingSessionView.as_view(), name='radiosonde-sessions'),
+    path('sessions/<str:session_id>/', SoundingSessionView.as_view(), name='radiosonde-session'),
+    path('soundings/', RadiosondeQueryView.as_view(), name='radiosonde-query'),
+    path('metrics/', metrics_view, name='radiosonde-metrics'),
 ]
\ No newline at end of file
@@ -1,22 +1,118 @@
+import json
+import math
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden, Http404, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
 from rest_framework.views import APIView
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.response import Response
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
 from rest_framework import status
 
-from .rs_core import process_uploaded_tsv
-from .llm_groq import summarize_radiosonde
+from .cache import aprocess_cached, asummarize_cached, process_cached, stream_summary_cached, summarize_cached
+from .batch import QueueFull, _process_member, iter_archive_members, process_archive, process_grids
+from . import metrics
+from .jobs import job_status, submit_job
+from .models import ProcessingJob
+from .query import query_soundings
+from .session import (SessionConflict, SessionError, SoundingSession, delete_session, locked_session,
+                      save_session)
+from .renderers import MATRIX_RENDERERS, SoundingJSONRenderer
+from .rs_core import (COMPACT, FEATURE_ORDER, MAX_SIGNIFICANT_DIGITS, SIGNIFICANT_DIGITS, compact_result,
+                      levels_from_matrix, parse_grid, significant_digits)
+
+def _json_safe(obj):
+    """NaN/inf -> None (null) en dicts/listas anidados: JSON estricto (NDJSON, como jobs._finite)."""
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {k: _json_safe(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_json_safe(v) for v in obj]
+    return obj
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def _sse_narrative(result, lang, model_id, refresh):
+    """Eventos SSE: 'result' de inmediato, 'token' por fragmento del LLM y 'done' (o 'error')."""
+    yield _sse("result", result)
+    try:
+        chunks, tier = stream_summary_cached(result, language=lang, model_id=model_id, refresh=refresh)
+        for text in chunks:
+            yield _sse("token", {"text": text})
+    except Exception as e:
+        yield _sse("error", {"detail": f"No se pudo generar resumen LLM: {e}"})
+        return
+    yield _sse("done", {"narrative_cache": tier})
+
+
+_MATRIX_FORMATS = {r.format for r in MATRIX_RENDERERS}
+
+def _with_levels(result):
+    """Resultado con "levels" como lista de dicts (formato JSON original) en vez de "X"."""
+    out = {k: v for k, v in result.items() if k != "X"}
+    out["levels"] = levels_from_matrix(result["X"], significant_digits(result))
+    return out
+
+def _digits(params):
+    """
+    Cifras significativas de la respuesta: ?digits=N (implica compacto),
+    ?compact=true|false o, sin nada, RADIOSONDE_COMPACT. None = precisión completa.
+    """
+    if params.get("digits"):
+        try:
+            digits = int(params["digits"])
+        except ValueError:
+            digits = 0
+        if not 1 <= digits <= MAX_SIGNIFICANT_DIGITS:
+            raise ValueError(f"'digits' debe ser un entero entre 1 y {MAX_SIGNIFICANT_DIGITS}")
+        return digits
+    compact = params.get("compact")
+    if compact is None:
+        return SIGNIFICANT_DIGITS if COMPACT else None
+    return SIGNIFICANT_DIGITS if compact.lower() == "true" else None
+
+def _compact(result, digits):
+    return compact_result(result, digits) if digits else result
+
+def _json_error(request, payload, code, headers=None):
+    # Los errores siempre en JSON, aunque se haya negociado un formato binario
+    request.accepted_renderer, request.accepted_media_type = JSONRenderer(), JSONRenderer.media_type
+    return Response(payload, status=code, headers=headers)
+
+def _busy_payload(e):
+    return {"detail": str(e), "retry_after": e.retry_after}, {"Retry-After": str(e.retry_after)}
 
-from io import BytesIO
 
 class RadiosondeProcessView(APIView):
+    """
+    Formatos de respuesta (Accept o ?format=): json (por defecto, niveles como dicts),
+    columnar, npy, npz y msgpack (ver renderers.py). ?grid= elige la rejilla vertical
+    (rs_core.parse_grid); con varias ?grid= se devuelve {"grids": {spec: ...}} en JSON.
+    """
     parser_classes = [MultiPartParser, FormParser]
+    renderer_classes = ([SoundingJSONRenderer]
+                        + [r for r in api_settings.DEFAULT_RENDERER_CLASSES if r is not JSONRenderer]
+                        + MATRIX_RENDERERS)
 
     def post(self, request, *args, **kwargs):
         # 1) Obtener archivo (multipart o raw)
-        up = request.FILES.get('file') or request.FILES.get('upload')
-        if up is None and request.content_type and 'octet-stream' in request.content_type:
-            up = BytesIO(request.body)
-            up.name = request.headers.get('X-Filename', 'radiosonde.tsv')
+        if request.content_type and 'octet-stream' in request.content_type:
+            # Raw: se lee directo del stream de la petición, sin cargar request.body
+            up = request.stream
+            filename = request.headers.get('X-Filename', 'radiosonde.tsv')
+        else:
+            up = request.FILES.get('file') or request.FILES.get('upload')
+            filename = getattr(up, 'name', 'radiosonde.tsv')
 
         if up is None:
             diag = {
@@ -26,27 +122,298 @@ class RadiosondeProcessView(APIView):
                 "DATA_keys": list(request.data.keys()),
                 "body_len": len(request.body) if hasattr(request, "body") else None,
             }
-            return Response(diag, status=status.HTTP_400_BAD_REQUEST)
+            return _json_error(request, diag, status.HTTP_400_BAD_REQUEST)
 
-        filename = getattr(up, 'name', 'radiosonde.tsv')
+        # Rejilla vertical (?grid=p:620:100:20, logp:..., z:0:12000:250); varias -> una respuesta por rejilla
+        grids = request.query_params.getlist("grid")
         try:
-            # 2) Procesar TSV -> JSON con métricas + etiqueta
-            result = process_uploaded_tsv(up, filename=filename)
+            for g in grids:
+                parse_grid(g)
+            digits = _digits(request.query_params)
+        except ValueError as e:
+            return _json_error(request, {"detail": str(e)}, status.HTTP_400_BAD_REQUEST)
+        if len(grids) > 1:
+            if request.accepted_renderer.format in _MATRIX_FORMATS:
+                return _json_error(request, {"detail": "Varias rejillas solo en formato JSON"},
+                                   status.HTTP_400_BAD_REQUEST)
+            try:
+                per_grid = process_grids(up, grids, filename=filename)
+            except QueueFull as e:
+                payload, busy_headers = _busy_payload(e)
+                return _json_error(request, payload, status.HTTP_429_TOO_MANY_REQUESTS, headers=busy_headers)
+            except Exception as e:
+                return _json_error(request, {"detail": f"Error procesando: {e}"}, 500)
+            first = next(iter(per_grid.values()))
+            return Response({
+                "file": first["file"], "date": first["date"],
+                "grids": {g: {k: v for k, v in _with_levels(_compact(r, digits)).items() if k not in ("file", "date")}
+                          for g, r in per_grid.items()},
+            })
+
+        try:
+            # 2) Procesar TSV -> JSON con métricas + etiqueta (caché por contenido)
+            result, cache_tier = process_cached(up, filename=filename, grid=grids[0] if grids else None)
+            result = _compact(result, digits)
 
             # 3) ¿Generar resumen con LLM?
             summarize = request.query_params.get("summarize", "true").lower() != "false"
             lang = request.query_params.get("lang", "es")
             model_id = request.query_params.get("model")  # opcional
+            refresh = request.query_params.get("refresh_summary", "false").lower() == "true"
+
+            headers = {"X-Radiosonde-Cache": cache_tier}
+            fmt = request.accepted_renderer.format
+            if fmt == "npy":
+                # .npy solo lleva la matriz: el resto va en cabeceras
+                summarize = False
+                headers.update({"X-Radiosonde-Columns": ",".join(FEATURE_ORDER),
+                                "X-Radiosonde-Label": result["label"], "X-Radiosonde-Date": result["date"]})
+            stream = summarize and request.query_params.get("stream", "false").lower() == "true"
+            matrix = fmt in _MATRIX_FORMATS and not stream
+            # Los dicts por nivel solo se arman para JSON/SSE o para el LLM
+            record = _with_levels(result) if summarize or not matrix else None
+            if not matrix:
+                result = record
 
+            if stream:
+                # SSE: el resultado físico sale primero, la narrativa llega token a token
+                resp = StreamingHttpResponse(_sse_narrative(record, lang, model_id, refresh),
+                                             content_type="text/event-stream")
+                resp["Cache-Control"] = "no-cache"
+                resp["X-Accel-Buffering"] = "no"
+                resp["X-Radiosonde-Cache"] = cache_tier
+                return resp
             if summarize:
                 try:
-                    narrative = summarize_radiosonde(result, language=lang, model_id=model_id)
+                    narrative, headers["X-Radiosonde-Narrative-Cache"] = summarize_cached(
+                        record, language=lang, model_id=model_id, refresh=refresh)
                 except Exception as e:
                     # No bloquear si el LLM falla; devolvemos datos igualmente
                     narrative = f"(No se pudo generar resumen LLM: {e})"
                 result["narrative"] = narrative
 
-            return Response(result, status=status.HTTP_200_OK)
+            return Response(result, status=status.HTTP_200_OK, headers=headers)
 
+        except QueueFull as e:
+            payload, busy_headers = _busy_payload(e)
+            return _json_error(request, payload, status.HTTP_429_TOO_MANY_REQUESTS, headers=busy_headers)
         except Exception as e:
-            return Response({"detail": f"Error procesando: {e}"}, status=500)
+            return _json_error(request, {"detail": f"Error procesando: {e}"}, 500)
+
+
+def _json_response(payload, status=200, headers=None):
+    return HttpResponse(SoundingJSONRenderer().render(payload), status=status,
+                        content_type="application/json", headers=headers)
+
+def _read_upload_authorized(request):
+    """
+    Autenticación y permisos por defecto de DRF (JWT + IsAuthenticated) para una
+    vista Django pura, y lectura del upload. Devuelve (bytes, nombre) o una respuesta de error.
+    """
+    drf_request = Request(request, parsers=[MultiPartParser(), FormParser()],
+                          authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    try:
+        allowed = all(perm().has_permission(drf_request, None)
+                      for perm in api_settings.DEFAULT_PERMISSION_CLASSES)
+    except APIException as e:
+        return _json_response({"detail": str(e.detail)}, status=e.status_code)
+    if not allowed:
+        code = 403 if drf_request.user.is_authenticated else 401
+        return _json_response({"detail": "No autorizado."}, status=code)
+
+    if request.content_type and 'octet-stream' in request.content_type:
+        return request.body, request.headers.get('X-Filename', 'radiosonde.tsv')
+    up = drf_request.FILES.get('file') or drf_request.FILES.get('upload')
+    if up is None:
+        return _json_response({"detail": "Falta archivo 'file'. Envía multipart/form-data con key 'file' "
+                                         "o binary con Content-Type: application/octet-stream."}, status=400)
+    return up.read(), up.name
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class RadiosondeProcessAsyncView(View):
+    """
+    Versión async de /process/ para ASGI: la física corre en el pool de procesos
+    (batch.get_pool) y la narrativa se espera con AsyncGroq, así un mismo worker
+    atiende muchos uploads a la vez y un LLM lento no frena el procesamiento.
+    Solo JSON y una rejilla; mismos parámetros grid, summarize, lang, model y refresh_summary.
+    """
+    http_method_names = ["post"]
+
+    async def post(self, request, *args, **kwargs):
+        upload = await sync_to_async(_read_upload_authorized)(request)
+        if isinstance(upload, HttpResponse):
+            return upload
+        data, filename = upload
+
+        grids = request.GET.getlist("grid")
+        if len(grids) > 1:
+            return _json_response({"detail": "Varias rejillas solo en /feature/process/"}, status=400)
+        grid = grids[0] if grids else None
+        try:
+            parse_grid(grid)
+            digits = _digits(request.GET)
+        except ValueError as e:
+            return _json_response({"detail": str(e)}, status=400)
+
+        try:
+            result, cache_tier = await aprocess_cached(data, filename=filename, grid=grid)
+        except QueueFull as e:
+            payload, busy_headers = _busy_payload(e)
+            return _json_response(payload, status=429, headers=busy_headers)
+        except Exception as e:
+            return _json_response({"detail": f"Error procesando: {e}"}, status=500)
+
+        headers = {"X-Radiosonde-Cache": cache_tier}
+        record = _with_levels(_compact(result, digits))
+        if request.GET.get("summarize", "true").lower() != "false":
+            try:
+                record["narrative"], headers["X-Radiosonde-Narrative-Cache"] = await asummarize_cached(
+                    record, language=request.GET.get("lang", "es"), model_id=request.GET.get("model"),
+                    refresh=request.GET.get("refresh_summary", "false").lower() == "true")
+            except Exception as e:
+                # No bloquear si el LLM falla; devolvemos datos igualmente
+                record["narrative"] = f"(No se pudo generar resumen LLM: {e})"
+        return _json_response(record, headers=headers)
+
+
+class RadiosondeBatchView(APIView):
+    """
+    Recibe un zip/tar con varios EDT TSV y responde NDJSON: una línea por sondeo
+    (mismo dict que /process/, o {"file", "error"}) a medida que cada uno termina.
+    """
+    parser_classes = [MultiPartParser, FormParser]
+
+    def post(self, request, *args, **kwargs):
+        up = request.FILES.get('file') or request.FILES.get('archive')
+        if up is None:
+            return Response(
+                {"detail": "Falta archivo 'file'. Envía multipart/form-data con un .zip o .tar(.gz) de EDT TSV."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            digits = _digits(request.query_params)
+            members = iter_archive_members(up, name=up.name)
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        fn = partial(_process_member, digits=digits) if digits else None
+        lines = (json.dumps(_json_safe(rec), ensure_ascii=False, allow_nan=False) + "\n"
+                 for rec in process_archive(members, fn=fn))
+        return StreamingHttpResponse(lines, content_type="application/x-ndjson")
+
+
+class ProcessingJobView(APIView):
+    """
+    POST: encola un zip/tar de EDT TSV como trabajo en segundo plano (lo procesa
+    `manage.py process_jobs`) y responde 202 con su id.
+    GET <id>: estado y progreso; ?results=true incluye el resumen por sondeo.
+    """
+    parser_classes = [MultiPartParser, FormParser]
+
+    def post(self, request, *args, **kwargs):
+        up = request.FILES.get('file') or request.FILES.get('archive')
+        if up is None:
+            return Response({"detail": "Falta archivo 'file'. Envía multipart/form-data con un .zip o .tar(.gz) de EDT TSV."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            job = submit_job(up.read(), up.name)
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(job_status(job), status=status.HTTP_202_ACCEPTED,
+                        headers={"Location": f"{request.path.rstrip('/')}/{job.pk}/"})
+
+    def get(self, request, pk=None, *args, **kwargs):
+        try:
+            job = ProcessingJob.objects.defer("archive").get(pk=pk)
+        except ProcessingJob.DoesNotExist:
+            return Response({"detail": "Trabajo no encontrado."}, status=status.HTTP_404_NOT_FOUND)
+        with_results = request.query_params.get("results", "false").lower() == "true"
+        return Response(job_status(job, with_results))
+
+
+class SoundingSessionView(APIView):
+    """
+    Sondeo incremental durante el ascenso (ver session.py). El cuerpo de cada POST
+    es el siguiente pedazo del EDT (raw); la respuesta trae etiqueta y resumen
+    provisionales y los niveles que cambiaron desde `first_level`.
+    POST sessions/ (?grid=): abre la sesión (el cuerpo puede traer el primer pedazo).
+    POST sessions/<id>/: agrega un pedazo; con ?close=true lo procesa todo y
+    devuelve el resultado final (mismo formato que /process/) y borra la sesión.
+    Con 'X-Session-Seq: n' (0 al abrir, luego el `seq` de la última respuesta) un
+    pedazo fuera de orden responde 409; también si otro pedazo de la sesión está en curso.
+    DELETE sessions/<id>/: descarta la sesión.
+    """
+    renderer_classes = [SoundingJSONRenderer]
+
+    def post(self, request, session_id=None, *args, **kwargs):
+        close = request.query_params.get("close", "false").lower() == "true"
+        try:
+            digits = _digits(request.query_params)
+            seq = request.headers.get("X-Session-Seq")
+            seq = None if seq is None else int(seq)
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            if session_id is None:
+                try:
+                    session = SoundingSession(request.headers.get('X-Filename', 'radiosonde.tsv'),
+                                              grid=request.query_params.get("grid"))
+                except ValueError as e:
+                    return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+                return self._append(request, session, seq, close, digits, created=True)
+            with locked_session(session_id) as session:
+                if session is None:
+                    return Response({"detail": "Sesión no encontrada o expirada."}, status=status.HTTP_404_NOT_FOUND)
+                return self._append(request, session, seq, close, digits)
+        except SessionConflict as e:
+            return Response({"detail": str(e), "seq": e.seq}, status=status.HTTP_409_CONFLICT)
+
+    def _append(self, request, session, seq, close, digits, created=False):
+        try:
+            update = session.append(request.body, seq=seq)
+            if close:
+                result = _with_levels(_compact(session.close(), digits))
+                result["session"] = session.id
+                delete_session(session.id)
+                return Response(result)
+        except SessionError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        save_session(session)
+
+        update = _with_levels(_compact(update, digits) if update["summary"] else update)
+        if created:
+            return Response(update, status=status.HTTP_201_CREATED,
+                            headers={"Location": f"{request.path.rstrip('/')}/{session.id}/"})
+        return Response(update)
+
+    def delete(self, request, session_id=None, *args, **kwargs):
+        delete_session(session_id)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class RadiosondeQueryView(APIView):
+    """
+    GET sobre los sondeos guardados: filtros por fecha, etiqueta y métricas,
+    paginación por cursor (ver query.py). ?levels=true incluye la matriz de niveles
+    (redondeada con ?compact/?digits, como /process/).
+    """
+    def get(self, request, *args, **kwargs):
+        try:
+            page = query_soundings(request.query_params, digits=_digits(request.query_params))
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(page)
+
+
+def metrics_view(request):
+    """
+    Métricas del proceso en formato de texto Prometheus. 404 si RADIOSONDE_METRICS=false;
+    exige 'Authorization: Bearer <RADIOSONDE_METRICS_TOKEN>' (sin token configurado, 403).
+    """
+    if not metrics.ENABLED:
+        raise Http404
+    token = getattr(settings, "RADIOSONDE_METRICS_TOKEN", "")
+    if not token or request.headers.get("Authorization") != f"Bearer {token}":
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
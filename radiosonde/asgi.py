@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'radiosonde.settings')
 
 application = get_asgi_application()
+
+# Precarga de pandas/MetPy/pool solo en el servidor (no en migrate, shell, process_jobs, ...)
+from feature.lazy import preload_if_enabled  # noqa: E402
+
+preload_if_enabled()
@@ -175,4 +175,93 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 CORS_ALLOW_HEADERS = list(default_headers) + [
     "invitation-token",  
-]
\ No newline at end of file
+]
+
+# Pool de procesos de /feature/process/batch/ y /feature/process/async/ (0 = os.cpu_count()).
+# /process/async/ es para ASGI (p. ej. `uvicorn radiosonde.asgi:application`): física en
+# este pool y narrativa con AsyncGroq, sin ocupar el worker mientras responde el LLM.
+RADIOSONDE_BATCH_WORKERS = int(os.getenv("RADIOSONDE_BATCH_WORKERS", "0"))
+# /process/ también procesa en el pool (workers con MetPy/pandas ya cargados), detrás de una
+# cola acotada: con más de RADIOSONDE_BATCH_WORKERS + RADIOSONDE_QUEUE_SIZE trabajos admitidos
+# responde 429 con Retry-After. Profundidad y espera: radiosonde_queue_* en /feature/metrics/.
+RADIOSONDE_PROCESS_IN_POOL = os.getenv("RADIOSONDE_PROCESS_IN_POOL", "true").lower() == "true"
+RADIOSONDE_QUEUE_SIZE = int(os.getenv("RADIOSONDE_QUEUE_SIZE", "16"))
+
+# CAPE/CIN: "fast" (integrador NumPy, por defecto) o "metpy" (mpcalc.cape_cin, referencia).
+# Lo lee feature/rs_core.py desde la variable de entorno RADIOSONDE_CAPE_MODE.
+# Parcelas: "table" (tabla de pseudo-adiabáticas, por defecto) u "ode" (mpcalc.parcel_profile),
+# vía RADIOSONDE_PARCEL_MODE. RADIOSONDE_MOIST_TABLE: ruta .npz para cachear la tabla en disco.
+# Rejilla vertical por defecto: RADIOSONDE_GRID (p:620:100:20, logp:620:100:27, z:0:12000:250...).
+
+# Caché de resultados procesados (feature/cache.py): LRU en proceso + backend compartido
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "radiosonde": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.getenv("RADIOSONDE_CACHE_DIR", str(BASE_DIR / ".cache" / "radiosonde")),
+        "TIMEOUT": None,
+        "OPTIONS": {"MAX_ENTRIES": int(os.getenv("RADIOSONDE_CACHE_MAX_ENTRIES", "5000"))},
+    },
+    # Sesiones incrementales en curso: sin descarte por MAX_ENTRIES y con add() atómico (locks)
+    "radiosonde_sessions": {
+        "BACKEND": "feature.cache_backends.SessionFileCache",
+        "LOCATION": os.getenv("RADIOSONDE_SESSION_DIR", str(BASE_DIR / ".cache" / "radiosonde-sessions")),
+        "TIMEOUT": None,
+    },
+}
+RADIOSONDE_RESULT_CACHE = "radiosonde"
+RADIOSONDE_RESULT_CACHE_ENTRIES = 256
+
+# Caché de narrativas LLM (feature/cache.py): TTL en segundos y LRU en proceso.
+# ?refresh_summary=true en /feature/process/ fuerza regenerar la narrativa.
+RADIOSONDE_NARRATIVE_CACHE = "radiosonde"
+RADIOSONDE_NARRATIVE_CACHE_ENTRIES = 512
+RADIOSONDE_NARRATIVE_TTL = int(os.getenv("RADIOSONDE_NARRATIVE_TTL", "86400"))
+
+# Cliente Groq (feature/llm_groq.py, desde el entorno): GROQ_TIMEOUT / GROQ_CONNECT_TIMEOUT (s),
+# GROQ_MAX_RETRIES y GROQ_BACKOFF_BASE / GROQ_BACKOFF_MAX (reintentos con jitter ante 429/5xx),
+# GROQ_MAX_CONCURRENCY (completions en vuelo por proceso) y GROQ_BASE_URL
+# (p. ej. el servidor local de `python manage.py fake_llm`).
+
+# Modo compacto (feature/rs_core.py, desde el entorno): RADIOSONDE_COMPACT=true arma,
+# cachea, guarda y archiva las matrices de features en float32 (la física sigue en
+# float64) y redondea JSON/binarios a RADIOSONDE_SIGNIFICANT_DIGITS cifras (6, máx. 7).
+# Por petición: ?compact=true|false o ?digits=N en /feature/process/, batch, sessions y soundings.
+
+# Persistencia de sondeos procesados (feature/store.py -> modelo Radiosondeo):
+# se insertan por lotes desde un hilo escritor, fuera del tiempo de la petición.
+RADIOSONDE_STORE_RESULTS = os.getenv("RADIOSONDE_STORE_RESULTS", "true").lower() == "true"
+RADIOSONDE_STORE_BATCH = 200
+RADIOSONDE_STORE_FLUSH_SECONDS = 1.0
+
+# Archivo de features para entrenamiento (feature/archive.py): features.npy (mmap) + index.csv.
+# Exportar: python manage.py export_archive salida.npy [--date-from ... --label ...]
+RADIOSONDE_ARCHIVE_RESULTS = os.getenv("RADIOSONDE_ARCHIVE_RESULTS", "true").lower() == "true"
+RADIOSONDE_ARCHIVE_DIR = os.getenv("RADIOSONDE_ARCHIVE_DIR", str(BASE_DIR / "data" / "archive"))
+
+# Métricas por etapa (feature/metrics.py) en /feature/metrics/, formato Prometheus.
+# RADIOSONDE_METRICS=false las desactiva. El scrape debe enviar
+# 'Authorization: Bearer <RADIOSONDE_METRICS_TOKEN>'; sin token configurado el
+# endpoint responde 403. Cada proceso expone las suyas.
+RADIOSONDE_METRICS_TOKEN = os.getenv("RADIOSONDE_METRICS_TOKEN", "")
+
+# pandas, SciPy, MetPy y el SDK de Groq se importan en el primer uso (feature/lazy.py),
+# así manage.py y /usuarios/ no pagan varios segundos de import. En los workers web
+# RADIOSONDE_PRELOAD=true los importa (y arma la tabla de parcelas) al cargar
+# radiosonde/wsgi.py o asgi.py, es decir solo al arrancar el servidor.
+RADIOSONDE_PRELOAD = os.getenv("RADIOSONDE_PRELOAD", "false").lower() == "true"
+
+# Cola de trabajos en la BD (feature/jobs.py): POST /feature/jobs/ con un zip/tar y
+# `python manage.py process_jobs [--workers N]` en uno o más hosts. Un trabajo `running`
+# sin heartbeat en RADIOSONDE_JOB_STALE_SECONDS se retoma; tras RADIOSONDE_JOB_MAX_ATTEMPTS falla.
+RADIOSONDE_JOB_STALE_SECONDS = int(os.getenv("RADIOSONDE_JOB_STALE_SECONDS", "300"))
+RADIOSONDE_JOB_MAX_ATTEMPTS = 3
+
+# Sondeos incrementales durante el ascenso (feature/session.py): POST /feature/sessions/
+# y luego POST /feature/sessions/<id>/ con cada pedazo del EDT. El estado (acotado)
+# se guarda en su propia caché (no la de resultados, que descarta entradas) y expira
+# tras RADIOSONDE_SESSION_TTL s sin pedazos.
+RADIOSONDE_SESSION_CACHE = "radiosonde_sessions"
+RADIOSONDE_SESSION_TTL = int(os.getenv("RADIOSONDE_SESSION_TTL", "3600"))